@@ -7,12 +7,12 @@
 """
 
 import os
-import sys
+import contextlib
+from collections.abc import Mapping
 import time
 import json
-import csv
 import requests
-import subprocess
+import urllib.parse
 from datetime import datetime
 from selenium import webdriver
 from selenium.webdriver.chrome.options import Options
@@ -25,9 +25,197 @@ from webdriver_manager.chrome import ChromeDriverManager
 from bs4 import BeautifulSoup
 import pandas as pd
 
+from youtube_comment_downloader.pool import CommentPool, iter_comments
+from youtube_comment_downloader.ratelimit import RateLimiter
+from youtube_comment_downloader.cache import write_json_atomic
+from youtube_comment_downloader.downloader import YoutubeCommentDownloader, CommentsDisabledError
+from youtube_comment_downloader.writers import CsvWriter, JsonWriter, NdjsonWriter, open_text, parse_count
+from youtube_comment_downloader.record import json_default
+
+# 压缩格式对应的文件扩展名
+COMPRESSION_SUFFIXES = {'gzip': '.gz', 'zstd': '.zst'}
+
+# 运行清单中的视频状态
+VIDEO_PENDING = 'pending'
+VIDEO_DONE = 'done'
+VIDEO_FAILED = 'failed'
+VIDEO_DISABLED = 'disabled'
+
+# 视频下载失败的原因，评论已关闭的视频记为disabled，其他原因记为failed
+ERROR_DISABLED = '评论已关闭'
+ERROR_NO_COMMENTS = '没有评论'
+ERROR_TIMEOUT = '超时'
+
+# 只用于跟踪的URL参数，同一个视频的URL可能只在这些参数上不同
+TRACKING_PARAMS = ('pp', 'si')
+
+# 评论记录的字段 (CSV的列)，单个视频的文件不包含关键词
+COMMENT_COLUMNS = ['视频ID', '视频标题', '视频URL', '关键词', '评论ID', '评论内容', '作者', '作者频道ID', '点赞数', '回复数',
+                   '发布时间', '发布时间戳', '是否置顶', '是否作者回复', '照片URL', '是否有心形标记', '是否为回复', '付费金额']
+
+# 单个视频的文件中评论记录的字段
+VIDEO_COMMENT_COLUMNS = [column for column in COMMENT_COLUMNS if column != '关键词']
+
+
+def parse_votes(votes):
+    # 转换为数字 ('1,234' -> 1234, '1.2K' -> 1200)
+    return parse_count(votes)
+
+
+def parse_replies(replies):
+    return parse_count(replies)
+
+
+# 评论记录的每个字段如何由原始评论和视频信息得到
+RECORD_VALUES = {
+    '视频ID': lambda comment, video_info: video_info.get('视频ID', ''),
+    '视频标题': lambda comment, video_info: video_info.get('标题', ''),
+    '视频URL': lambda comment, video_info: video_info.get('URL', ''),
+    '关键词': lambda comment, video_info: video_info.get('关键词', ''),
+    '评论ID': lambda comment, video_info: comment.get('cid', ''),
+    '评论内容': lambda comment, video_info: comment.get('text', ''),
+    '作者': lambda comment, video_info: comment.get('author', ''),
+    '作者频道ID': lambda comment, video_info: comment.get('channel', ''),
+    '点赞数': lambda comment, video_info: parse_votes(comment.get('votes', 0)),
+    '回复数': lambda comment, video_info: parse_replies(comment.get('replies', 0)),
+    '发布时间': lambda comment, video_info: comment.get('time', ''),
+    '发布时间戳': lambda comment, video_info: comment.get('time_parsed', ''),
+    '是否置顶': lambda comment, video_info: comment.get('pinned', False),
+    '是否作者回复': lambda comment, video_info: comment.get('author_is_uploader', False),
+    '照片URL': lambda comment, video_info: comment.get('photo', ''),
+    '是否有心形标记': lambda comment, video_info: comment.get('heart', False),
+    '是否为回复': lambda comment, video_info: comment.get('reply', '.' in comment.get('cid', '')),
+    '付费金额': lambda comment, video_info: comment.get('paid'),
+}
+
+# 评论记录的字段对应的原始评论字段，用于写入Parquet数据集和SQLite数据库
+RECORD_FIELDS = {'视频ID': 'video_id', '评论ID': 'cid', '评论内容': 'text', '发布时间': 'time', '作者': 'author',
+                  '作者频道ID': 'channel', '点赞数': 'votes', '回复数': 'replies', '照片URL': 'photo',
+                  '是否有心形标记': 'heart', '发布时间戳': 'time_parsed', '是否为回复': 'reply', '付费金额': 'paid'}
+
+
+class CommentRecord(Mapping):
+    """
+    紧凑的评论记录 (compact_records=True)
+    
+    与format_comment返回的字典字段相同，但只保存对原始评论和视频信息的引用，字段在读取时计算，
+    同一个视频的所有评论记录共用一份视频信息。只有关键词字段可以修改
+    """
+    
+    __slots__ = ('comment', 'video_info', 'columns', 'keyword')
+    
+    def __init__(self, comment, video_info, include_keyword=True):
+        self.comment = comment
+        self.video_info = video_info
+        self.columns = COMMENT_COLUMNS if include_keyword else VIDEO_COMMENT_COLUMNS
+        self.keyword = None
+    
+    def __getitem__(self, column):
+        if column == '关键词' and self.keyword is not None and self.columns is COMMENT_COLUMNS:
+            return self.keyword
+        if column not in self.columns:
+            raise KeyError(column)
+        return RECORD_VALUES[column](self.comment, self.video_info)
+    
+    def __setitem__(self, column, value):
+        if column != '关键词' or self.columns is not COMMENT_COLUMNS:
+            raise KeyError(column)
+        self.keyword = value
+    
+    def __iter__(self):
+        return iter(self.columns)
+    
+    def __len__(self):
+        return len(self.columns)
+
+
+class KeywordOutput:
+    """
+    一个关键词的合并评论输出
+    
+    每个视频的评论记录在完成时追加写入，CSV、NDJSON和JSON文件在写入第一条评论时创建，
+    Parquet和SQLite格式写入下载器共用的存储
+    """
+    
+    def __init__(self, downloader, keyword, output_format, comment_sink=None):
+        self.downloader = downloader
+        self.keyword = keyword
+        self.output_format = output_format.lower()
+        self.comment_sink = comment_sink
+        self.writer = None
+        self.filename = None
+        self.count = 0
+        self.video_ids = set()
+    
+    @property
+    def icon(self):
+        return {'csv': '📊', 'parquet': '📦', 'sqlite': '📦'}.get(self.output_format, '📄')
+    
+    @property
+    def output_filename(self):
+        """输出文件相对于评论目录的路径"""
+        if self.output_format == 'parquet':
+            return os.path.relpath(self.comment_sink.partition_path(self.keyword), self.downloader.comments_dir)
+        if self.output_format == 'sqlite':
+            return os.path.relpath(self.comment_sink.path, self.downloader.comments_dir)
+        return self.filename
+    
+    def open(self):
+        # 创建安全的文件名
+        safe_keyword = "".join(c for c in self.keyword if c.isalnum() or c in (' ', '-', '_')).strip().replace(' ', '_')[:30]
+        timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+        self.filename = f"comments_{safe_keyword}_{timestamp}{self.downloader.output_extension(self.output_format)}"
+        output_path = os.path.join(self.downloader.comments_dir, self.filename)
+        
+        if self.output_format == 'csv':
+            return CsvWriter(output_path, COMMENT_COLUMNS, max_bytes=self.downloader.max_bytes)
+        if self.output_format == 'ndjson':
+            return NdjsonWriter(output_path, max_bytes=self.downloader.max_bytes)
+        return JsonWriter(output_path, indent=2, key=None)
+    
+    def write(self, video_id, records):
+        """
+        写入一个视频的评论记录
+        
+        Args:
+            video_id (str): 视频ID
+            records (list): 评论记录
+            
+        Returns:
+            int: 写入的评论数
+        """
+        self.video_ids.add(video_id)
+        for record in records:
+            record['关键词'] = self.keyword
+        
+        if self.comment_sink is not None:
+            count = self.comment_sink.write(self.downloader.comment_rows(records), keyword=self.keyword)
+        elif records:
+            if self.writer is None:
+                self.writer = self.open()
+            count = self.writer.write_all(records)
+        else:
+            count = 0
+        self.count += count
+        return count
+    
+    def close(self):
+        if self.writer is not None:
+            self.writer.close()
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, *exc_info):
+        self.close()
+
 
 class BatchCommentDownloader:
-    def __init__(self, output_dir="batch_comments", headless=True, timeout=30):
+    def __init__(self, output_dir="batch_comments", headless=True, timeout=30,
+                 workers=0, use_processes=False, max_tasks_per_worker=50, synthesize_continuations=True,
+                 use_cache=True,
+                 adaptive_rate=True, incremental=False, compression=None, max_file_size=None, compact_records=False,
+                 base_url=None, cassette=None, replay=False):
         """
         初始化批量评论下载器
         
@@ -35,10 +223,38 @@ class BatchCommentDownloader:
             output_dir (str): 输出目录
             headless (bool): 是否无头模式运行
             timeout (int): 超时时间
+            workers (int): 进程内并发下载数 (0=逐个下载)
+            use_processes (bool): 并发时使用进程池而不是线程池
+            max_tasks_per_worker (int): 每个工作者下载多少个视频后被替换
+            synthesize_continuations (bool): 直接构造评论区continuation, 跳过后续视频的观看页面
+            use_cache (bool): 在输出目录下缓存ytcfg、cookie和排序入口, 重新下载时跳过观看页面
+            adaptive_rate (bool): 并发下载时所有工作者共用一个根据响应自动调整速率的限流器
+            incremental (bool): 增量下载, 按最新排序时每个视频只下载上次完整下载之后的新评论
+            compression (str): 输出文件的压缩格式 (None、'gzip' 或 'zstd'，zstd需要安装zstandard)
+            max_file_size (float): CSV和NDJSON输出文件达到该大小(MB)后写入新的编号文件 (None=不拆分)
+            compact_records (bool): 在内存中使用紧凑的评论 (Comment) 和评论记录 (CommentRecord)，输出内容不变
+            base_url (str): 评论请求发往该地址而不是 https://www.youtube.com (例如本地测试服务器)
+            cassette (str): 把所有HTTP请求和响应录制到该文件 (.gz/.zst结尾时压缩)
+            replay (bool): 从cassette文件回放录制的响应，不访问网络
         """
+        if compression is not None and compression not in COMPRESSION_SUFFIXES:
+            raise ValueError(f"不支持的压缩格式: {compression}")
+
         self.output_dir = output_dir
         self.headless = headless
         self.timeout = timeout
+        self.workers = workers
+        self.use_processes = use_processes
+        self.max_tasks_per_worker = max_tasks_per_worker
+        self.cache_dir = os.path.join(output_dir, "cache") if use_cache else None
+        self.downloader_kwargs = {'synthesize_continuations': synthesize_continuations, 'cache': self.cache_dir,
+                                  'compact': compact_records, 'base_url': base_url, 'cassette': cassette,
+                                  'replay': replay}
+        self.compact_records = compact_records
+        self.adaptive_rate = adaptive_rate
+        self.watermarks_dir = os.path.join(output_dir, "watermarks") if incremental else None
+        self.compression_suffix = COMPRESSION_SUFFIXES[compression] if compression else ''
+        self.max_bytes = int(max_file_size * 1024 * 1024) if max_file_size else None
         
         # 创建输出目录
         if not os.path.exists(output_dir):
@@ -48,8 +264,13 @@ class BatchCommentDownloader:
         self.urls_dir = os.path.join(output_dir, "urls")
         self.comments_dir = os.path.join(output_dir, "comments")
         self.logs_dir = os.path.join(output_dir, "logs")
+        self.videos_dir = os.path.join(self.comments_dir, "videos")
         
-        for dir_path in [self.urls_dir, self.comments_dir, self.logs_dir]:
+        # 运行清单: 参数和关键词视频列表写入JSON文件，每个视频的状态追加到JSONL文件
+        self.manifest_path = os.path.join(output_dir, "run_manifest.json")
+        self.manifest_log_path = os.path.join(output_dir, "run_manifest.jsonl")
+        
+        for dir_path in [self.urls_dir, self.comments_dir, self.logs_dir, self.videos_dir]:
             if not os.path.exists(dir_path):
                 os.makedirs(dir_path)
             
@@ -59,6 +280,8 @@ class BatchCommentDownloader:
         print(f"  📂 评论目录: {self.comments_dir}")
         print(f"  📂 日志目录: {self.logs_dir}")
         print(f"🤖 无头模式: {'开启' if headless else '关闭'}")
+        if workers:
+            print(f"⚡ 并发下载: {workers} 个{'进程' if use_processes else '线程'}")
 
     def get_chrome_driver(self):
         """获取Chrome WebDriver"""
@@ -177,17 +400,59 @@ class BatchCommentDownloader:
     def extract_video_id(self, url):
         """从YouTube URL中提取视频ID"""
         try:
-            if "watch?v=" in url:
-                return url.split("watch?v=")[1].split("&")[0]
-            elif "/shorts/" in url:
-                return url.split("/shorts/")[1].split("?")[0]
-            elif "youtu.be/" in url:
-                return url.split("youtu.be/")[1].split("?")[0]
-            else:
-                return "unknown"
+            return YoutubeCommentDownloader.extract_video_id(url) or "unknown"
         except:
             return "unknown"
 
+    def is_incremental(self, sort, since=None):
+        """是否只下载新评论 (这时没有新评论也算下载成功)"""
+        return sort == 1 and (self.watermarks_dir is not None or since is not None)
+
+    def watermark_path(self, video_id, sort):
+        """增量下载时视频的水位线文件，不是增量下载时返回None"""
+        if self.watermarks_dir and sort == 1:
+            return os.path.join(self.watermarks_dir, f"{video_id}.json")
+        return None
+
+    def normalize_video_url(self, url):
+        """去掉URL中的跟踪参数 (如 &pp=)"""
+        parts = urllib.parse.urlsplit(url)
+        query = [(key, value) for key, value in urllib.parse.parse_qsl(parts.query, keep_blank_values=True)
+                 if key not in TRACKING_PARAMS]
+        return urllib.parse.urlunsplit(parts._replace(query=urllib.parse.urlencode(query)))
+
+    def normalize_keyword_results(self, keyword_results):
+        """
+        根据URL统一各关键词视频列表中的视频ID，并去掉同一关键词下的重复视频。
+        无法确定视频ID的视频会被跳过，否则它们会共用 'unknown' 作为去重的键
+        
+        Args:
+            keyword_results (dict): 按关键词分组的视频列表
+            
+        Returns:
+            dict: 处理后的按关键词分组的视频列表
+        """
+        normalized = {}
+        unresolved = 0
+        for keyword, video_list in keyword_results.items():
+            seen = set()
+            normalized[keyword] = []
+            for video_info in video_list:
+                url = video_info.get('URL', '')
+                video_id = self.extract_video_id(url)
+                if video_id == 'unknown':
+                    video_id = video_info.get('视频ID') or 'unknown'
+                if video_id == 'unknown':
+                    unresolved += 1
+                    continue
+                if video_id in seen:
+                    continue
+                seen.add(video_id)
+                normalized[keyword].append(dict(video_info, 视频ID=video_id, URL=self.normalize_video_url(url) if url else url))
+        if unresolved:
+            print(f"⚠️ 跳过 {unresolved} 个无法确定视频ID的视频")
+        return normalized
+
     def batch_search_keywords(self, keywords, max_results_per_keyword=40, scroll_times=5):
         """
         批量搜索多个关键词
@@ -286,7 +551,7 @@ class BatchCommentDownloader:
             limit (int): 评论数量限制
             sort (int): 排序方式 (0=热门, 1=最新)
             language (str): 语言设置
-            output_format (str): 输出格式 ('csv' 或 'json')
+            output_format (str): 输出格式 ('csv'、'ndjson' 或 'json')
             
         Returns:
             tuple: (是否成功, 输出文件路径)
@@ -301,157 +566,93 @@ class BatchCommentDownloader:
         # 生成输出文件名
         safe_title = "".join(c for c in video_title if c.isalnum() or c in (' ', '-', '_')).strip()[:50]
         
-        # 先下载为JSON格式（临时文件）
-        temp_json_filename = f"{video_id}_{safe_title}_temp.json"
-        temp_json_path = os.path.join(self.comments_dir, temp_json_filename)
-        
-        # 最终输出文件
-        if output_format.lower() == 'csv':
-            final_filename = f"{video_id}_{safe_title}.csv"
-        else:
-            final_filename = f"{video_id}_{safe_title}.json"
+        # 输出文件
+        final_filename = f"{video_id}_{safe_title}{self.output_extension(output_format)}"
         final_output_path = os.path.join(self.comments_dir, final_filename)
         
-        # 构建命令
-        cmd = [
-            sys.executable, "-m", "youtube_comment_downloader",
-            "--youtubeid", video_id,
-            "--output", temp_json_path,
-            "--limit", str(limit),
-            "--sort", str(sort),
-            "--pretty"
-        ]
-        
-        if language:
-            cmd.extend(["--language", language])
-        
         try:
             print(f"⬇️ 正在下载评论: {video_title[:50]}...")
-            result = subprocess.run(cmd, capture_output=True, text=True, timeout=300)
-            
-            if result.returncode == 0:
-                # 如果要求CSV格式，转换JSON到CSV
-                if output_format.lower() == 'csv':
-                    success = self.convert_json_to_csv(temp_json_path, final_output_path, video_info)
-                    # 删除临时JSON文件
-                    if os.path.exists(temp_json_path):
-                        os.remove(temp_json_path)
-                    
-                    if success:
-                        print(f"✅ 评论下载并转换成功: {final_filename}")
-                        return True, final_output_path
-                    else:
-                        print(f"❌ CSV转换失败: {video_title}")
-                        return False, None
-                else:
-                    # JSON格式，直接重命名
-                    if os.path.exists(temp_json_path):
-                        os.rename(temp_json_path, final_output_path)
-                    print(f"✅ 评论下载成功: {final_filename}")
-                    return True, final_output_path
-            else:
-                print(f"❌ 评论下载失败: {video_title}")
-                print(f"错误信息: {result.stderr}")
-                return False, None
-                
-        except subprocess.TimeoutExpired:
+            comments = iter_comments(video_id, sort, language, limit, timeout=300,
+                                     downloader_kwargs=self.downloader_kwargs,
+                                     watermark=self.watermark_path(video_id, sort))
+            count = self.save_video_comments(comments, video_info, final_output_path, output_format)
+            if count or self.is_incremental(sort):
+                print(f"✅ 成功获取 {count} 条评论: {final_filename}")
+                return True, final_output_path
+            print(f"❌ 没有获取到评论: {video_title}")
+            return False, None
+        except CommentsDisabledError:
+            print(f"🚫 评论已关闭: {video_title}")
+            return False, None
+        except TimeoutError:
+            # 已经下载的评论保留在输出文件中
             print(f"⏰ 下载超时: {video_title}")
             return False, None
         except Exception as e:
             print(f"❌ 下载出错: {e}")
             return False, None
 
-    def convert_json_to_csv(self, json_path, csv_path, video_info):
+    def save_video_comments(self, comments, video_info, output_path, output_format='csv'):
         """
-        将JSON格式的评论转换为CSV格式
+        保存单个视频的原始评论，CSV和NDJSON格式在评论到达时逐条写入
         
         Args:
-            json_path (str): JSON文件路径
-            csv_path (str): CSV输出路径
+            comments (iterable): YoutubeCommentDownloader返回的评论
             video_info (dict): 视频信息
+            output_path (str): 输出文件路径
+            output_format (str): 输出格式 ('csv'、'ndjson' 或 'json')
             
         Returns:
-            bool: 转换是否成功
+            int: 保存的评论数，没有评论时不创建文件
         """
-        try:
-            with open(json_path, 'r', encoding='utf-8') as f:
-                content = f.read()
-            
-            # 尝试修复不完整的JSON
-            content = content.strip()
-            if not content.endswith('}') and not content.endswith(']'):
-                # 可能是不完整的JSON，尝试修复
-                if '"comments": [' in content:
-                    # 找到最后一个完整的评论对象
-                    last_brace = content.rfind('},')
-                    if last_brace != -1:
-                        content = content[:last_brace+1] + '\n    ]\n}'
-                        print("⚠️ 检测到不完整的JSON文件，尝试自动修复")
-            
-            data = json.loads(content)
-            
-            # 处理JSON结构：可能是直接的数组，也可能是包含comments字段的对象
-            if isinstance(data, dict) and 'comments' in data:
-                comments_data = data['comments']
-            elif isinstance(data, list):
-                comments_data = data
-            else:
-                print(f"❌ 不支持的JSON格式: {type(data)}")
-                return False
-            
-            # 准备CSV数据
-            csv_data = []
+        if output_format.lower() in ('parquet', 'sqlite'):
+            raise ValueError("Parquet和SQLite格式只支持按关键词下载 (batch_download_comments_by_keyword)")
+        
+        if output_format.lower() == 'json':
+            # 与命令行 --pretty 输出的结构保持一致
+            comments = list(comments)
+            return len(comments) if comments and self.save_comments_to_json({"comments": comments}, output_path) else 0
+        
+        if output_format.lower() == 'csv':
+            writer = CsvWriter(output_path, VIDEO_COMMENT_COLUMNS, max_bytes=self.max_bytes)
+        else:
+            writer = NdjsonWriter(output_path, max_bytes=self.max_bytes)
+        with writer:
+            count = writer.write_all(self.format_comment(comment, video_info, include_keyword=False)
+                                     for comment in comments)
+        if not count:
+            for path in writer.paths:
+                os.remove(path)
+        return count
+
+    def format_comments(self, comments_data, video_info, include_keyword=True):
+        """
+        将原始评论转换为统一格式的记录
+        
+        Args:
+            comments_data (list): 原始评论列表
+            video_info (dict): 视频信息
+            include_keyword (bool): 是否包含关键词字段
             
-            for comment in comments_data:
-                if not isinstance(comment, dict):
-                    print(f"⚠️ 跳过无效评论数据: {type(comment)}")
-                    continue
-                    
-                # 处理数值字段
-                votes = comment.get('votes', 0)
-                if isinstance(votes, str):
-                    # 移除逗号并转换为数字
-                    votes = int(votes.replace(',', '')) if votes.replace(',', '').isdigit() else 0
-                
-                replies = comment.get('replies', 0)
-                if isinstance(replies, str):
-                    replies = int(replies) if replies.isdigit() else 0
-                
-                # 提取评论信息
-                row = {
-                    '视频ID': video_info.get('视频ID', ''),
-                    '视频标题': video_info.get('标题', ''),
-                    '视频URL': video_info.get('URL', ''),
-                    '评论ID': comment.get('cid', ''),
-                    '评论内容': comment.get('text', ''),
-                    '作者': comment.get('author', ''),
-                    '作者频道ID': comment.get('channel', ''),
-                    '点赞数': votes,
-                    '回复数': replies,
-                    '发布时间': comment.get('time', ''),
-                    '发布时间戳': comment.get('time_parsed', ''),
-                    '是否置顶': comment.get('pinned', False),
-                    '是否作者回复': comment.get('author_is_uploader', False),
-                    '照片URL': comment.get('photo', ''),
-                    '是否有心形标记': comment.get('heart', False)
-                }
-                csv_data.append(row)
-            
-            # 写入CSV文件
-            if csv_data:
-                df = pd.DataFrame(csv_data)
-                df.to_csv(csv_path, index=False, encoding='utf-8-sig')
-                print(f"📊 成功转换 {len(csv_data)} 条评论到CSV格式")
-                return True
-            else:
-                print("⚠️ 没有找到评论数据")
-                return False
-                
-        except Exception as e:
-            print(f"❌ JSON到CSV转换失败: {e}")
-            import traceback
-            traceback.print_exc()
-            return False
+        Returns:
+            list: 评论记录列表
+        """
+        records = []
+        
+        for comment in comments_data:
+            if not isinstance(comment, Mapping):
+                print(f"⚠️ 跳过无效评论数据: {type(comment)}")
+                continue
+            records.append(self.format_comment(comment, video_info, include_keyword))
+        
+        return records
+
+    def format_comment(self, comment, video_info, include_keyword=True):
+        """将一条原始评论转换为统一格式的记录"""
+        if self.compact_records:
+            return CommentRecord(comment, video_info, include_keyword)
+        columns = COMMENT_COLUMNS if include_keyword else VIDEO_COMMENT_COLUMNS
+        return {column: RECORD_VALUES[column](comment, video_info) for column in columns}
 
     def batch_download_comments(self, video_list, limit=1000, sort=1, language=None, output_format='csv', delay=2):
         """
@@ -462,7 +663,7 @@ class BatchCommentDownloader:
             limit (int): 每个视频的评论数量限制
             sort (int): 排序方式
             language (str): 语言设置
-            output_format (str): 输出格式 ('csv' 或 'json')
+            output_format (str): 输出格式 ('csv'、'ndjson' 或 'json')
             delay (int): 下载间隔秒数
             
         Returns:
@@ -483,16 +684,12 @@ class BatchCommentDownloader:
             log.write(f"参数设置: limit={limit}, sort={sort}, language={language}, output_format={output_format}\n")
             log.write("="*80 + "\n\n")
             
-            for i, video_info in enumerate(video_list, 1):
-                print(f"\n{'='*60}")
-                print(f"正在处理第 {i}/{len(video_list)} 个视频")
-                
-                start_time = time.time()
-                success, output_path = self.download_comments_for_video(
-                    video_info, limit, sort, language, output_format
-                )
-                end_time = time.time()
-                
+            if self.workers:
+                video_results = self.iter_pool_downloads(video_list, limit, sort, language, output_format)
+            else:
+                video_results = self.iter_sequential_downloads(video_list, limit, sort, language, output_format, delay)
+            
+            for i, video_info, success, output_path, elapsed in video_results:
                 # 记录日志
                 log_entry = f"[{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] "
                 log_entry += f"视频 {i}/{len(video_list)}: {video_info.get('标题', 'unknown')[:50]}\n"
@@ -508,16 +705,11 @@ class BatchCommentDownloader:
                     failed_videos.append(video_info)
                     log_entry += f"状态: ❌ 失败\n"
                 
-                log_entry += f"耗时: {end_time - start_time:.2f}秒\n"
+                log_entry += f"耗时: {elapsed:.2f}秒\n"
                 log_entry += "-" * 80 + "\n\n"
                 
                 log.write(log_entry)
                 log.flush()
-                
-                # 添加延迟
-                if i < len(video_list) and delay > 0:
-                    print(f"⏱️ 等待 {delay} 秒后继续...")
-                    time.sleep(delay)
             
             # 写入最终统计
             log.write(f"\n批量下载完成时间: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\n")
@@ -540,37 +732,151 @@ class BatchCommentDownloader:
         
         return result
 
-    def batch_download_comments_by_keyword(self, keyword_results, limit=1000, sort=1, language=None, output_format='csv', delay=2):
+    def iter_sequential_downloads(self, video_list, limit, sort, language, output_format, delay):
+        """逐个下载视频评论，返回 (序号, 视频信息, 是否成功, 输出文件, 耗时)"""
+        for i, video_info in enumerate(video_list, 1):
+            print(f"\n{'='*60}")
+            print(f"正在处理第 {i}/{len(video_list)} 个视频")
+            
+            start_time = time.time()
+            success, output_path = self.download_comments_for_video(
+                video_info, limit, sort, language, output_format
+            )
+            yield i, video_info, success, output_path, time.time() - start_time
+            
+            # 添加延迟
+            if i < len(video_list) and delay > 0:
+                print(f"⏱️ 等待 {delay} 秒后继续...")
+                time.sleep(delay)
+
+    def iter_pool_downloads(self, video_list, limit, sort, language, output_format):
+        """并发下载视频评论并保存，按完成顺序返回 (序号, 视频信息, 是否成功, 输出文件, 耗时)"""
+        with self.create_comment_pool() as pool:
+            for i, video_info, comments, error, elapsed in self.iter_pool_results(pool, video_list, limit, sort, language):
+                video_id = video_info.get('视频ID', 'unknown')
+                video_title = video_info.get('标题', 'unknown')
+                
+                if error is not None:
+                    print(f"❌ 评论下载失败: {video_title} ({error})")
+                    yield i, video_info, False, None, elapsed
+                    continue
+                
+                safe_title = "".join(c for c in video_title if c.isalnum() or c in (' ', '-', '_')).strip()[:50]
+                output_path = os.path.join(self.comments_dir, f"{video_id}_{safe_title}{self.output_extension(output_format)}")
+                
+                if self.save_video_comments(comments, video_info, output_path, output_format):
+                    print(f"✅ [{i}/{len(video_list)}] 成功获取 {len(comments)} 条评论: {video_title[:50]}")
+                    yield i, video_info, True, output_path, elapsed
+                else:
+                    print(f"❌ [{i}/{len(video_list)}] 没有获取到评论: {video_title[:50]}")
+                    yield i, video_info, False, None, elapsed
+
+    def create_comment_pool(self):
+        """创建进程内评论下载工作池"""
+        return CommentPool(self.workers, processes=self.use_processes,
+                           max_tasks_per_worker=self.max_tasks_per_worker,
+                           downloader_kwargs=self.downloader_kwargs,
+                           rate_limiter=RateLimiter(processes=self.use_processes) if self.adaptive_rate else None)
+
+    def iter_pool_results(self, pool, video_list, limit, sort, language, since=None):
+        """
+        通过工作池下载一组视频的原始评论
+        
+        Args:
+            pool (CommentPool): 评论下载工作池
+            video_list (list): 视频信息列表
+            limit (int): 每个视频的评论数量限制
+            sort (int): 排序方式
+            language (str): 语言设置
+            since (float): 只下载该时间戳之后发布的评论
+            
+        Returns:
+            generator: 按完成顺序返回 (序号, 视频信息, 评论列表, 错误, 耗时)
+        """
+        valid_videos = []
+        for i, video_info in enumerate(video_list, 1):
+            if video_info.get('视频ID', 'unknown') == 'unknown':
+                print(f"❌ 无效的视频ID: {video_info.get('标题', 'unknown')}")
+                yield i, video_info, [], ValueError('无效的视频ID'), 0.0
+            else:
+                valid_videos.append((i, video_info))
+        
+        video_ids = [video_info['视频ID'] for _, video_info in valid_videos]
+        print(f"⬇️ 使用 {self.workers} 个工作者并发下载 {len(video_ids)} 个视频的评论...")
+        
+        watermark_dir = self.watermarks_dir if sort == 1 else None
+        for index, comments, error, elapsed in pool.imap_unordered(video_ids, sort, language, limit, timeout=300,
+                                                                   watermark_dir=watermark_dir, since=since):
+            i, video_info = valid_videos[index]
+            yield i, video_info, comments, error, elapsed
+
+    def batch_download_comments_by_keyword(self, keyword_results=None, limit=1000, sort=1, language=None, output_format='csv', delay=2, resume=False, since=None):
         """
         按关键词批量下载评论并合并到单个文件
         
         Args:
-            keyword_results (dict): 按关键词分组的视频列表
+            keyword_results (dict): 按关键词分组的视频列表 (断点续传时可为None，从运行清单读取)
             limit (int): 每个视频的评论数量限制
             sort (int): 排序方式
             language (str): 语言设置
-            output_format (str): 输出格式 ('csv' 或 'json')
+            output_format (str): 输出格式 ('csv'、'ndjson'、'json'、'parquet' 或 'sqlite')
             delay (int): 下载间隔秒数
+            resume (bool): 是否根据运行清单跳过已完成的视频，只重试失败的视频
+            since (float): 只下载该时间戳之后发布的评论 (需要按最新排序)
             
         Returns:
             dict: 下载结果统计
         """
         print(f"\n🚀 开始按关键词批量下载评论")
         
+        if since is not None and sort != 1:
+            raise ValueError("只有按最新排序时才能按时间截止")
+        
+        # 运行清单
+        manifest, video_status = self.load_manifest() if resume else (None, {})
+        if resume and manifest is None:
+            print(f"⚠️ 没有找到运行清单，将从头开始下载")
+        if keyword_results is None:
+            if manifest is None:
+                raise ValueError("没有关键词视频列表，也没有可以继续的运行清单")
+            keyword_results = manifest['关键词']
+        
+        # 按视频ID去重: 每个视频只下载一次，评论再按关键词分别写入
+        keyword_results = self.normalize_keyword_results(keyword_results)
+        video_keywords = {}
+        for keyword, video_list in keyword_results.items():
+            for video_info in video_list:
+                video_keywords.setdefault(video_info['视频ID'], []).append(keyword)
+        
+        if manifest is None:
+            self.create_manifest(keyword_results, {'limit': limit, 'sort': sort, 'language': language,
+                                                   'output_format': output_format, 'since': since}, video_keywords)
+        elif video_status:
+            done = sum(1 for entry in video_status.values() if entry['状态'] in (VIDEO_DONE, VIDEO_DISABLED))
+            print(f"📋 从运行清单继续: {done} 个视频已完成，{len(video_status) - done} 个视频将重试")
+        
         total_keywords = len(keyword_results)
-        total_videos = sum(len(videos) for videos in keyword_results.values())
-        success_count = 0
-        failed_count = 0
+        total_videos = len(video_keywords)
+        duplicate_count = sum(len(videos) for videos in keyword_results.values()) - total_videos
+        handled_videos = set()
         failed_videos = []
         keyword_results_summary = {}
+        if duplicate_count:
+            print(f"🔗 {duplicate_count} 个视频在多个关键词下重复出现，每个视频只下载一次")
         
         # 创建下载日志
         log_file = os.path.join(self.logs_dir, f"download_log_{datetime.now().strftime('%Y%m%d_%H%M%S')}.txt")
         
-        with open(log_file, 'w', encoding='utf-8') as log:
+        # 并发模式下所有关键词共用一个工作池
+        pool_context = self.create_comment_pool() if self.workers else contextlib.nullcontext()
+        # Parquet和SQLite格式在每个视频完成时写入
+        sink_context = self.create_comment_sink(output_format) or contextlib.nullcontext()
+        
+        with open(log_file, 'w', encoding='utf-8') as log, pool_context as pool, sink_context as comment_sink, \
+                contextlib.ExitStack() as keyword_outputs:
             log.write(f"批量下载开始时间: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\n")
             log.write(f"总关键词数: {total_keywords}\n")
-            log.write(f"总视频数: {total_videos}\n")
+            log.write(f"总视频数: {total_videos} (跨关键词重复 {duplicate_count} 个)\n")
             log.write(f"参数设置: limit={limit}, sort={sort}, language={language}, output_format={output_format}\n")
             log.write("="*80 + "\n\n")
             
@@ -579,122 +885,74 @@ class BatchCommentDownloader:
                 print(f"正在处理关键词 {keyword_idx}/{total_keywords}: '{keyword}'")
                 print(f"该关键词下有 {len(video_list)} 个视频")
                 
-                # 为当前关键词创建合并的评论数据
-                all_comments_data = []
-                keyword_success = 0
-                keyword_failed = 0
+                # 跳过已完成的视频 (断点续传) 和在前面的关键词下已经处理过的视频
+                pending_videos = []
+                for video_info in video_list:
+                    video_id = video_info['视频ID']
+                    if video_id in handled_videos:
+                        continue
+                    handled_videos.add(video_id)
+                    if video_status.get(video_id, {}).get('状态') not in (VIDEO_DONE, VIDEO_DISABLED):
+                        pending_videos.append(video_info)
+                skipped = len(video_list) - len(pending_videos)
+                # 评论记录在每个视频完成时追加到关键词的合并评论文件，不在内存中保留
+                keyword_output = keyword_outputs.enter_context(KeywordOutput(self, keyword, output_format, comment_sink))
+                if skipped:
+                    print(f"⏭️ 跳过 {skipped} 个已完成或在其他关键词下已处理的视频")
                 
                 log.write(f"关键词 {keyword_idx}/{total_keywords}: {keyword}\n")
                 log.write(f"视频数量: {len(video_list)}\n")
+                if skipped:
+                    log.write(f"跳过已处理: {skipped}\n")
                 log.write("-" * 40 + "\n")
                 
-                for video_idx, video_info in enumerate(video_list, 1):
-                    print(f"\n正在处理第 {video_idx}/{len(video_list)} 个视频")
-                    
-                    video_id = video_info.get('视频ID', 'unknown')
+                if pool is not None:
+                    video_results = self.iter_keyword_pool_results(pool, pending_videos, limit, sort, language, since)
+                else:
+                    video_results = self.iter_keyword_sequential_results(pending_videos, limit, sort, language, delay,
+                                                                         since)
+                
+                for video_idx, video_info, comments, error, elapsed in video_results:
                     video_title = video_info.get('标题', 'unknown')
+                    video_id = video_info.get('视频ID', 'unknown')
                     
-                    if video_id == 'unknown':
-                        print(f"❌ 无效的视频ID: {video_title}")
-                        failed_count += 1
-                        keyword_failed += 1
-                        failed_videos.append(video_info)
-                        continue
-                    
-                    # 临时JSON文件
-                    temp_json_filename = f"temp_{video_id}.json"
-                    temp_json_path = os.path.join(self.comments_dir, temp_json_filename)
-                    
-                    # 构建下载命令
-                    cmd = [
-                        sys.executable, "-m", "youtube_comment_downloader",
-                        "--youtubeid", video_id,
-                        "--output", temp_json_path,
-                        "--limit", str(limit),
-                        "--sort", str(sort),
-                        "--pretty"
-                    ]
-                    
-                    if language:
-                        cmd.extend(["--language", language])
-                    
-                    try:
-                        print(f"⬇️ 正在下载评论: {video_title[:50]}...")
-                        start_time = time.time()
-                        result = subprocess.run(cmd, capture_output=True, text=True, timeout=300)
-                        end_time = time.time()
+                    if error is None:
+                        output = self.save_video_records(video_id, comments, merge=self.is_incremental(sort, since))
+                        keyword_output.write(video_id, comments)
+                        video_status[video_id] = self.update_manifest(video_info, VIDEO_DONE, len(comments), output,
+                                                                      keywords=video_keywords.get(video_id))
+                        print(f"✅ 成功获取 {len(comments)} 条评论")
                         
-                        if result.returncode == 0:
-                            # 读取并解析JSON数据
-                            comments = self.parse_comments_from_json(temp_json_path, video_info)
-                            if comments:
-                                all_comments_data.extend(comments)
-                                success_count += 1
-                                keyword_success += 1
-                                print(f"✅ 成功获取 {len(comments)} 条评论")
-                                
-                                # 记录日志
-                                log.write(f"  视频 {video_idx}: ✅ {video_title[:50]} - {len(comments)}条评论 ({end_time-start_time:.2f}s)\n")
-                            else:
-                                failed_count += 1
-                                keyword_failed += 1
-                                failed_videos.append(video_info)
-                                log.write(f"  视频 {video_idx}: ❌ {video_title[:50]} - 解析失败\n")
-                            
-                            # 删除临时文件
-                            if os.path.exists(temp_json_path):
-                                os.remove(temp_json_path)
-                                
-                        else:
-                            print(f"❌ 评论下载失败: {video_title}")
-                            print(f"错误信息: {result.stderr}")
-                            failed_count += 1
-                            keyword_failed += 1
-                            failed_videos.append(video_info)
-                            log.write(f"  视频 {video_idx}: ❌ {video_title[:50]} - 下载失败\n")
-                            
-                    except subprocess.TimeoutExpired:
-                        print(f"⏰ 下载超时: {video_title}")
-                        failed_count += 1
-                        keyword_failed += 1
-                        failed_videos.append(video_info)
-                        log.write(f"  视频 {video_idx}: ⏰ {video_title[:50]} - 超时\n")
-                    except Exception as e:
-                        print(f"❌ 下载出错: {e}")
-                        failed_count += 1
-                        keyword_failed += 1
+                        # 记录日志
+                        log.write(f"  视频 {video_idx}: ✅ {video_title[:50]} - {len(comments)}条评论 ({elapsed:.2f}s)\n")
+                    else:
                         failed_videos.append(video_info)
-                        log.write(f"  视频 {video_idx}: ❌ {video_title[:50]} - 异常: {e}\n")
-                    
-                    # 添加延迟
-                    if video_idx < len(video_list) and delay > 0:
-                        print(f"⏱️ 等待 {delay} 秒后继续...")
-                        time.sleep(delay)
+                        status = VIDEO_DISABLED if error == ERROR_DISABLED else VIDEO_FAILED
+                        video_status[video_id] = self.update_manifest(video_info, status, error=error,
+                                                                      keywords=video_keywords.get(video_id))
+                        if error:
+                            icon = {ERROR_TIMEOUT: '⏰', ERROR_DISABLED: '🚫'}.get(error, '❌')
+                            log.write(f"  视频 {video_idx}: {icon} {video_title[:50]} - {error}\n")
                 
-                # 保存当前关键词的合并评论文件
-                if all_comments_data:
-                    # 创建安全的文件名
-                    safe_keyword = "".join(c for c in keyword if c.isalnum() or c in (' ', '-', '_')).strip().replace(' ', '_')[:30]
-                    timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-                    
-                    if output_format.lower() == 'csv':
-                        output_filename = f"comments_{safe_keyword}_{timestamp}.csv"
-                        output_path = os.path.join(self.comments_dir, output_filename)
-                        self.save_comments_to_csv(all_comments_data, output_path)
-                        print(f"📊 关键词 '{keyword}' 的评论已保存到: {output_filename}")
-                        print(f"   总评论数: {len(all_comments_data)}")
-                    else:
-                        output_filename = f"comments_{safe_keyword}_{timestamp}.json"
-                        output_path = os.path.join(self.comments_dir, output_filename)
-                        self.save_comments_to_json(all_comments_data, output_path)
-                        print(f"📄 关键词 '{keyword}' 的评论已保存到: {output_filename}")
-                        print(f"   总评论数: {len(all_comments_data)}")
+                keyword_success = sum(1 for video_info in video_list
+                                      if video_status.get(video_info['视频ID'], {}).get('状态') == VIDEO_DONE)
+                keyword_failed = len(video_list) - keyword_success
+                
+                # 补上在其他关键词下或之前的运行中下载的视频，同一个视频的评论会写入它所属的每个关键词
+                for video_id, records in self.iter_done_records(video_list, keyword_output.video_ids, video_status):
+                    keyword_output.write(video_id, records)
+                keyword_output.close()
+                
+                if keyword_output.count:
+                    output_filename = keyword_output.output_filename
+                    print(f"{keyword_output.icon} 关键词 '{keyword}' 的评论已保存到: {output_filename}")
+                    print(f"   总评论数: {keyword_output.count}")
                         
                     keyword_results_summary[keyword] = {
                         "总视频数": len(video_list),
                         "成功视频数": keyword_success,
                         "失败视频数": keyword_failed,
-                        "总评论数": len(all_comments_data),
+                        "总评论数": keyword_output.count,
                         "输出文件": output_filename
                     }
                 else:
@@ -707,7 +965,7 @@ class BatchCommentDownloader:
                         "输出文件": None
                     }
                 
-                log.write(f"关键词总结: 成功{keyword_success}个，失败{keyword_failed}个，评论{len(all_comments_data)}条\n")
+                log.write(f"关键词总结: 成功{keyword_success}个，失败{keyword_failed}个，评论{keyword_output.count}条\n")
                 log.write("="*80 + "\n\n")
                 
                 # 关键词间延迟
@@ -715,6 +973,10 @@ class BatchCommentDownloader:
                     print(f"⏱️ 关键词间等待 {delay} 秒...")
                     time.sleep(delay)
             
+            success_count = sum(1 for video_id in video_keywords
+                                if video_status.get(video_id, {}).get('状态') == VIDEO_DONE)
+            failed_count = total_videos - success_count
+            
             # 写入最终统计
             log.write(f"\n批量下载完成时间: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\n")
             log.write(f"总成功视频: {success_count} 个\n")
@@ -724,6 +986,7 @@ class BatchCommentDownloader:
         result = {
             "总关键词数": total_keywords,
             "总视频数": total_videos,
+            "跨关键词重复视频数": duplicate_count,
             "成功视频数": success_count,
             "失败视频数": failed_count,
             "成功率": f"{success_count/total_videos*100:.1f}%",
@@ -738,89 +1001,249 @@ class BatchCommentDownloader:
         
         return result
     
-    def parse_comments_from_json(self, json_path, video_info):
+    def create_manifest(self, keyword_results, params, video_keywords=None):
+        """
+        创建新的运行清单，每个视频先记为pending
+        
+        Args:
+            keyword_results (dict): 按关键词分组的视频列表
+            params (dict): 下载参数
+            video_keywords (dict): {视频ID: 该视频所属的全部关键词}
+        """
+        write_json_atomic(self.manifest_path, {
+            "创建时间": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+            "参数": params,
+            "关键词": keyword_results
+        })
+        with open(self.manifest_log_path, 'w', encoding='utf-8') as f:
+            for video_id, keywords in (video_keywords or {}).items():
+                if video_id != 'unknown':
+                    f.write(json.dumps(self.manifest_entry(video_id, keywords, VIDEO_PENDING), ensure_ascii=False) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+        print(f"📋 运行清单: {self.manifest_path}")
+
+    def load_manifest(self):
+        """
+        读取运行清单
+        
+        Returns:
+            tuple: (运行清单, {视频ID: 最新状态})，没有运行清单时返回 (None, {})
+        """
+        try:
+            with open(self.manifest_path, 'r', encoding='utf-8') as f:
+                manifest = json.load(f)
+        except (OSError, ValueError):
+            return None, {}
+        
+        video_status = {}
+        if os.path.exists(self.manifest_log_path):
+            with open(self.manifest_log_path, 'r', encoding='utf-8') as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        # 中断时可能只写了半行
+                        continue
+                    video_status[entry['视频ID']] = entry
+        return manifest, video_status
+
+    def update_manifest(self, video_info, status, comment_count=0, output_path=None, error=None, keywords=None):
         """
-        从JSON文件解析评论数据
+        在运行清单中记录一个视频的状态
         
         Args:
-            json_path (str): JSON文件路径
             video_info (dict): 视频信息
+            status (str): 视频状态 (pending/done/failed/disabled)
+            comment_count (int): 评论数
+            output_path (str): 该视频评论记录的保存位置
+            error (str): 失败原因
+            keywords (list): 该视频所属的全部关键词
             
         Returns:
-            list: 评论数据列表
+            dict: 记录的状态
         """
-        try:
-            with open(json_path, 'r', encoding='utf-8') as f:
-                content = f.read()
-            
-            # 尝试修复不完整的JSON
-            content = content.strip()
-            if not content.endswith('}') and not content.endswith(']'):
-                if '"comments": [' in content:
-                    last_brace = content.rfind('},')
-                    if last_brace != -1:
-                        content = content[:last_brace+1] + '\n    ]\n}'
-                        print("⚠️ 检测到不完整的JSON文件，尝试自动修复")
-            
-            data = json.loads(content)
-            
-            # 处理JSON结构
-            if isinstance(data, dict) and 'comments' in data:
-                comments_data = data['comments']
-            elif isinstance(data, list):
-                comments_data = data
-            else:
-                print(f"❌ 不支持的JSON格式: {type(data)}")
-                return []
+        video_id = video_info.get('视频ID', 'unknown')
+        entry = self.manifest_entry(video_id, keywords or [video_info.get('关键词', '')], status, comment_count,
+                                    output_path, error)
+        if video_id == 'unknown':
+            return entry
+        
+        with open(self.manifest_log_path, 'a', encoding='utf-8') as f:
+            f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+        return entry
+
+    def manifest_entry(self, video_id, keywords, status, comment_count=0, output_path=None, error=None):
+        """运行清单中一个视频的状态记录"""
+        return {
+            "视频ID": video_id,
+            "关键词": keywords,
+            "状态": status,
+            "评论数": comment_count,
+            "输出文件": output_path,
+            "错误": error,
+            "时间": datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        }
+
+    def output_extension(self, output_format):
+        """CSV、NDJSON和JSON输出文件的扩展名，包括压缩格式 (如 '.ndjson.gz')"""
+        return '.' + output_format.lower() + self.compression_suffix
+
+    def save_video_records(self, video_id, records, merge=False):
+        """
+        保存单个视频的评论记录
+        
+        Args:
+            video_id (str): 视频ID
+            records (list): 评论记录列表
+            merge (bool): 增量下载时只有新评论，把它们放在之前保存的评论记录前面，而不是覆盖
             
-            # 转换为统一格式
-            processed_comments = []
-            for comment in comments_data:
-                if not isinstance(comment, dict):
-                    continue
-                    
-                # 处理数值字段
-                votes = comment.get('votes', 0)
-                if isinstance(votes, str):
-                    votes = int(votes.replace(',', '')) if votes.replace(',', '').isdigit() else 0
-                
-                replies = comment.get('replies', 0)
-                if isinstance(replies, str):
-                    replies = int(replies) if replies.isdigit() else 0
+        Returns:
+            str: 保存位置
+        """
+        output_path = os.path.join(self.videos_dir, f"{video_id}.json")
+        if merge:
+            try:
+                with open(output_path, 'r', encoding='utf-8') as f:
+                    saved = json.load(f)
+            except (OSError, ValueError):
+                saved = []
+            new_ids = {record['评论ID'] for record in records}
+            records = list(records) + [record for record in saved if record['评论ID'] not in new_ids]
+        write_json_atomic(output_path, records)
+        return output_path
+
+    def create_comment_sink(self, output_format):
+        """
+        创建按视频写入评论的存储
+        
+        Args:
+            output_format (str): 输出格式
+            
+        Returns:
+            ParquetDatasetWriter/SqliteCommentStore: 'parquet' 格式写入按关键词和下载日期分区的数据集，
+            'sqlite' 格式按评论ID更新同一个数据库，其他格式返回None
+        """
+        if output_format.lower() == 'parquet':
+            # pyarrow只在使用Parquet格式时导入
+            from youtube_comment_downloader.parquet import ParquetDatasetWriter
+            return ParquetDatasetWriter(os.path.join(self.comments_dir, "parquet"))
+        if output_format.lower() == 'sqlite':
+            from youtube_comment_downloader.sqlite import SqliteCommentStore
+            return SqliteCommentStore(os.path.join(self.comments_dir, "comments.sqlite"))
+        return None
+
+    def comment_rows(self, records):
+        """把评论记录转换回原始评论的字段，旧的记录中没有的字段不包含在内"""
+        return ({field: record[column] for column, field in RECORD_FIELDS.items() if column in record}
+                for record in records)
+
+    def iter_done_records(self, video_list, skip_ids, video_status):
+        """
+        逐个读取一个关键词下已完成视频的评论记录
+        
+        Args:
+            video_list (list): 该关键词下的视频列表
+            skip_ids (set): 已经写入的视频ID
+            video_status (dict): 运行清单中的视频状态
+            
+        Returns:
+            generator: 按视频顺序返回 (视频ID, 评论记录列表)
+        """
+        for video_info in video_list:
+            video_id = video_info.get('视频ID', 'unknown')
+            if video_id in skip_ids or video_status.get(video_id, {}).get('状态') != VIDEO_DONE:
+                continue
+            try:
+                with open(video_status[video_id]['输出文件'], 'r', encoding='utf-8') as f:
+                    records = json.load(f)
+            except (OSError, ValueError) as e:
+                print(f"⚠️ 读取已完成视频的评论失败: {video_id} ({e})")
+                continue
+            yield video_id, records
+
+    def iter_keyword_sequential_results(self, video_list, limit, sort, language, delay, since=None):
+        """
+        在当前进程中逐个下载一个关键词下的视频评论
+        
+        Returns:
+            generator: 返回 (序号, 视频信息, 评论记录列表, 失败原因, 耗时)，成功时失败原因为None
+        """
+        for video_idx, video_info in enumerate(video_list, 1):
+            print(f"\n正在处理第 {video_idx}/{len(video_list)} 个视频")
+            
+            video_id = video_info.get('视频ID', 'unknown')
+            video_title = video_info.get('标题', 'unknown')
+            
+            if video_id == 'unknown':
+                print(f"❌ 无效的视频ID: {video_title}")
+                yield video_idx, video_info, [], '', 0.0
+                continue
+            
+            start_time = time.time()
+            try:
+                print(f"⬇️ 正在下载评论: {video_title[:50]}...")
+                comments = iter_comments(video_id, sort, language, limit, timeout=300,
+                                         downloader_kwargs=self.downloader_kwargs,
+                                         watermark=self.watermark_path(video_id, sort), since=since)
+                records = self.format_comments(comments, video_info)
+                elapsed = time.time() - start_time
                 
-                # 创建评论记录
-                comment_record = {
-                    '视频ID': video_info.get('视频ID', ''),
-                    '视频标题': video_info.get('标题', ''),
-                    '视频URL': video_info.get('URL', ''),
-                    '关键词': video_info.get('关键词', ''),
-                    '评论ID': comment.get('cid', ''),
-                    '评论内容': comment.get('text', ''),
-                    '作者': comment.get('author', ''),
-                    '作者频道ID': comment.get('channel', ''),
-                    '点赞数': votes,
-                    '回复数': replies,
-                    '发布时间': comment.get('time', ''),
-                    '发布时间戳': comment.get('time_parsed', ''),
-                    '是否置顶': comment.get('pinned', False),
-                    '是否作者回复': comment.get('author_is_uploader', False),
-                    '照片URL': comment.get('photo', ''),
-                    '是否有心形标记': comment.get('heart', False)
-                }
-                processed_comments.append(comment_record)
-            
-            return processed_comments
+                if records or self.is_incremental(sort, since):
+                    yield video_idx, video_info, records, None, elapsed
+                else:
+                    print(f"❌ 没有获取到评论: {video_title}")
+                    yield video_idx, video_info, [], ERROR_NO_COMMENTS, elapsed
+                    
+            except CommentsDisabledError:
+                print(f"🚫 评论已关闭: {video_title}")
+                yield video_idx, video_info, [], ERROR_DISABLED, time.time() - start_time
+            except TimeoutError:
+                print(f"⏰ 下载超时: {video_title}")
+                yield video_idx, video_info, [], ERROR_TIMEOUT, time.time() - start_time
+            except Exception as e:
+                print(f"❌ 下载出错: {e}")
+                yield video_idx, video_info, [], f'异常: {e}', time.time() - start_time
             
-        except Exception as e:
-            print(f"❌ 解析JSON文件失败: {e}")
-            return []
-    
+            # 添加延迟
+            if video_idx < len(video_list) and delay > 0:
+                print(f"⏱️ 等待 {delay} 秒后继续...")
+                time.sleep(delay)
+
+    def iter_keyword_pool_results(self, pool, video_list, limit, sort, language, since=None):
+        """
+        通过工作池并发下载一个关键词下的视频评论
+        
+        Returns:
+            generator: 按完成顺序返回 (序号, 视频信息, 评论记录列表, 失败原因, 耗时)，成功时失败原因为None
+        """
+        for video_idx, video_info, comments, error, elapsed in self.iter_pool_results(pool, video_list, limit, sort, language, since):
+            video_title = video_info.get('标题', 'unknown')
+            print(f"\n第 {video_idx}/{len(video_list)} 个视频完成: {video_title[:50]}")
+            
+            if isinstance(error, CommentsDisabledError):
+                print(f"🚫 评论已关闭: {video_title}")
+                yield video_idx, video_info, [], ERROR_DISABLED, elapsed
+            elif isinstance(error, TimeoutError):
+                print(f"⏰ 下载超时: {video_title}")
+                yield video_idx, video_info, [], ERROR_TIMEOUT, elapsed
+            elif error is not None:
+                print(f"❌ 下载出错: {error}")
+                yield video_idx, video_info, [], f'异常: {error}', elapsed
+            elif not comments and not self.is_incremental(sort, since):
+                print(f"❌ 没有获取到评论: {video_title}")
+                yield video_idx, video_info, [], ERROR_NO_COMMENTS, elapsed
+            else:
+                yield video_idx, video_info, self.format_comments(comments, video_info), None, elapsed
+
     def save_comments_to_csv(self, comments_data, output_path):
         """保存评论数据到CSV文件"""
         try:
             if comments_data:
-                df = pd.DataFrame(comments_data)
-                df.to_csv(output_path, index=False, encoding='utf-8-sig')
+                with CsvWriter(output_path, comments_data[0].keys(), max_bytes=self.max_bytes) as writer:
+                    writer.write_all(comments_data)
                 return True
             return False
         except Exception as e:
@@ -830,8 +1253,8 @@ class BatchCommentDownloader:
     def save_comments_to_json(self, comments_data, output_path):
         """保存评论数据到JSON文件"""
         try:
-            with open(output_path, 'w', encoding='utf-8') as f:
-                json.dump(comments_data, f, ensure_ascii=False, indent=2)
+            with open_text(output_path, 'w') as f:
+                json.dump(comments_data, f, ensure_ascii=False, indent=2, default=json_default)
             return True
         except Exception as e:
             print(f"❌ 保存JSON文件失败: {e}")
@@ -908,10 +1331,11 @@ def main():
         print("1. 完整流程 (搜索URL + 下载评论)")
         print("2. 仅搜索并保存视频URL")
         print("3. 从已有URL文件批量下载评论")
-        print("4. 退出")
+        print("4. 继续上次未完成的批量下载")
+        print("5. 退出")
         print("=" * 60)
         
-        choice = input("请输入选择 (1-4): ").strip()
+        choice = input("请输入选择 (1-5): ").strip()
         
         if choice == '1':
             # 完整流程
@@ -969,14 +1393,19 @@ def main():
             
             language = input("语言设置 (如: zh, en, 默认自动): ").strip() or None
             
-            format_choice = input("输出格式 (csv/json, 默认csv): ").strip().lower()
-            output_format = format_choice if format_choice in ['csv', 'json'] else 'csv'
+            format_choice = input("输出格式 (csv/ndjson/json/parquet/sqlite, 默认csv): ").strip().lower()
+            output_format = format_choice if format_choice in ['csv', 'ndjson', 'json', 'parquet', 'sqlite'] else 'csv'
             
             try:
                 delay = int(input("下载间隔秒数 (默认2): ").strip() or "2")
             except:
                 delay = 2
             
+            try:
+                downloader.workers = int(input("并发下载数 (0=逐个下载, 默认0): ").strip() or "0")
+            except:
+                downloader.workers = 0
+            
             # 批量下载评论
             download_results = downloader.batch_download_comments_by_keyword(
                 url_results, limit, sort, language, output_format, delay
@@ -1074,14 +1503,19 @@ def main():
                 
                 language = input("语言设置 (如: zh, en, 默认自动): ").strip() or None
                 
-                format_choice = input("输出格式 (csv/json, 默认csv): ").strip().lower()
-                output_format = format_choice if format_choice in ['csv', 'json'] else 'csv'
+                format_choice = input("输出格式 (csv/ndjson/json/parquet/sqlite, 默认csv): ").strip().lower()
+                output_format = format_choice if format_choice in ['csv', 'ndjson', 'json', 'parquet', 'sqlite'] else 'csv'
                 
                 try:
                     delay = int(input("下载间隔秒数 (默认2): ").strip() or "2")
                 except:
                     delay = 2
                 
+                try:
+                    downloader.workers = int(input("并发下载数 (0=逐个下载, 默认0): ").strip() or "0")
+                except:
+                    downloader.workers = 0
+                
                 # 将视频列表转换为关键词格式以兼容新方法
                 keyword_results = {"从文件导入": video_list}
                 
@@ -1096,6 +1530,28 @@ def main():
                 print(f"❌ 处理文件时出错: {e}")
                 
         elif choice == '4':
+            # 根据运行清单继续下载
+            manifest, _ = downloader.load_manifest()
+            if manifest is None:
+                print(f"❌ 没有找到运行清单: {downloader.manifest_path}")
+                continue
+            
+            params = manifest['参数']
+            print(f"📋 运行清单创建于 {manifest['创建时间']}，共 {len(manifest['关键词'])} 个关键词")
+            
+            try:
+                downloader.workers = int(input("并发下载数 (0=逐个下载, 默认0): ").strip() or "0")
+            except:
+                downloader.workers = 0
+            
+            download_results = downloader.batch_download_comments_by_keyword(
+                None, params['limit'], params['sort'], params['language'], params['output_format'], resume=True,
+                since=params.get('since')
+            )
+            
+            downloader.generate_report(download_results=download_results)
+            
+        elif choice == '5':
             print("👋 再见!")
             break
         else:
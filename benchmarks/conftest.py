@@ -0,0 +1,78 @@
+import gzip
+import json
+import os
+import time
+
+import pytest
+import requests
+
+from youtube_comment_downloader import relative_time
+
+FIXTURES_DIR = os.path.join(os.path.dirname(__file__), 'fixtures')
+
+
+def read_fixture(name):
+    with gzip.open(os.path.join(FIXTURES_DIR, name), 'rb') as fp:
+        return fp.read()
+
+
+def make_response(url, content):
+    response = requests.Response()
+    response.status_code = 200
+    response.url = url
+    response.encoding = 'utf-8'
+    response._content = content
+    response._content_consumed = True
+    return response
+
+
+class ReplaySession:
+    # Stands in for the requests.Session of YoutubeCommentDownloader. Every GET returns the recorded watch page and
+    # every POST the recorded response for the continuation token in the request body.
+
+    def __init__(self, watch_page, continuations):
+        self.watch_page = watch_page
+        self.continuations = continuations
+        self.headers = {}
+        self.cookies = requests.cookies.RequestsCookieJar()
+        self.requests = 0
+
+    def get(self, url, **kwargs):
+        self.requests += 1
+        return make_response(url, self.watch_page)
+
+    def post(self, url, json=None, **kwargs):
+        self.requests += 1
+        return make_response(url, self.continuations.get(json['continuation'], b'{}'))
+
+    def close(self):
+        pass
+
+
+@pytest.fixture(scope='session')
+def watch_page():
+    # A watch page with the ytcfg and ytInitialData objects between other inline scripts
+    return read_fixture('watch_page.html.gz')
+
+
+@pytest.fixture(scope='session')
+def continuations():
+    # The responses of /youtubei/v1/next by continuation token, as bytes: four pages of comment threads (both sort
+    # orders start at the first one) and the pages of their replies, some behind a 'Show more replies' button
+    responses = json.loads(read_fixture('continuations.json.gz'))
+    return {token: json.dumps(response).encode('utf-8') for token, response in responses.items()}
+
+
+@pytest.fixture
+def replay_session(watch_page, continuations):
+    return ReplaySession(watch_page, continuations)
+
+
+@pytest.fixture(scope='session', autouse=True)
+def frozen_clock():
+    # Relative times ("2 days ago") are parsed against the current second, which would make the time_parsed values
+    # of two crawls differ now and then. All tests parse them against the same anchor instead.
+    now = float(int(time.time()))
+    with pytest.MonkeyPatch.context() as monkeypatch:
+        monkeypatch.setattr(relative_time, 'clock', lambda: now)
+        yield now
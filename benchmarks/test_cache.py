@@ -0,0 +1,100 @@
+import types
+import time
+
+import pytest
+
+from conftest import FIXTURES_DIR
+from youtube_comment_downloader import cache as cache_module
+from youtube_comment_downloader.cache import BootstrapCache
+from youtube_comment_downloader.downloader import YoutubeCommentDownloader, SORT_BY_RECENT
+from youtube_comment_downloader.server import InnertubeServer, RecordedSource
+
+VIDEO_ID = 'ScMzIvxBSi4'
+
+
+@pytest.fixture(scope='module')
+def source():
+    return RecordedSource.from_directory(FIXTURES_DIR)
+
+
+@pytest.fixture
+def server(source):
+    # A server per test, so that every test counts its own requests
+    with InnertubeServer(source) as server:
+        yield server
+
+
+@pytest.fixture
+def cache(tmp_path):
+    return BootstrapCache(str(tmp_path / 'cache'))
+
+
+def later(monkeypatch, seconds):
+    # Moves the clock of the cache forward
+    now = time.time()
+    monkeypatch.setattr(cache_module, 'time', types.SimpleNamespace(time=lambda: now + seconds))
+
+
+def crawl(server, cache):
+    downloader = YoutubeCommentDownloader(cache=cache, base_url=server.url)
+    return [comment['cid'] for comment in downloader.get_comments(VIDEO_ID, sleep=0)]
+
+
+def test_ttl(cache, monkeypatch):
+    cache.set('ytcfg', '', {'INNERTUBE_API_KEY': 'key'})
+    cache.set('ytcfg', 'de', {'INNERTUBE_API_KEY': 'key'}, ttl=3600)
+    assert cache.get('ytcfg', '') == cache.get('ytcfg', 'de') == {'INNERTUBE_API_KEY': 'key'}
+    assert cache.get('ytcfg', 'fr') is None
+
+    later(monkeypatch, 2 * 3600)
+    assert cache.get('ytcfg', '') is not None
+    assert cache.get('ytcfg', 'de') is None
+    later(monkeypatch, 7 * 3600)
+    assert cache.get('ytcfg', '') is None
+
+
+def test_ttls_override(tmp_path, monkeypatch):
+    cache = BootstrapCache(str(tmp_path), ttls={'sort_endpoint': 60})
+    cache.set_sort_endpoint(VIDEO_ID, SORT_BY_RECENT, {'token': 'x'})
+    cache.set_ytcfg({'INNERTUBE_API_KEY': 'key'})
+    later(monkeypatch, 120)
+    assert cache.get_sort_endpoint(VIDEO_ID, SORT_BY_RECENT) is None
+    assert cache.get_ytcfg() is not None
+
+
+def test_recrawl_skips_watch_page(server, cache):
+    cids = crawl(server, cache)
+    assert server.requests['/watch'] == 1
+    assert crawl(server, cache) == cids
+    assert server.requests['/watch'] == 1
+
+
+def test_expired_entries_fetch_watch_page(server, cache, monkeypatch):
+    cids = crawl(server, cache)
+    later(monkeypatch, 7 * 3600)
+    assert crawl(server, cache) == cids
+    assert server.requests['/watch'] == 2
+
+
+def test_stale_sort_endpoint_is_replaced(server, cache):
+    cids = crawl(server, cache)
+    endpoint = cache.get_sort_endpoint(VIDEO_ID, SORT_BY_RECENT)
+    stale = dict(endpoint, continuationCommand=dict(endpoint['continuationCommand'], token='stale'))
+    cache.set_sort_endpoint(VIDEO_ID, SORT_BY_RECENT, stale)
+
+    # The server has no comments for the cached endpoint, so the watch page is fetched after all
+    assert crawl(server, cache) == cids
+    assert server.requests['/watch'] == 2
+    assert cache.get_sort_endpoint(VIDEO_ID, SORT_BY_RECENT) == endpoint
+
+
+def test_stale_sort_endpoint_is_deleted(server, cache):
+    crawl(server, cache)
+    endpoint = cache.get_sort_endpoint(VIDEO_ID, SORT_BY_RECENT)
+    cache.set_sort_endpoint(VIDEO_ID, SORT_BY_RECENT,
+                            dict(endpoint, continuationCommand=dict(endpoint['continuationCommand'], token='stale')))
+
+    downloader = YoutubeCommentDownloader(cache=cache, base_url=server.url)
+    assert downloader.start_from_cache(downloader.video_url.format(youtube_id=VIDEO_ID), SORT_BY_RECENT, None) == \
+        (None, None, None)
+    assert cache.get_sort_endpoint(VIDEO_ID, SORT_BY_RECENT) is None
@@ -0,0 +1,49 @@
+import pytest
+
+from conftest import FIXTURES_DIR
+from youtube_comment_downloader.cassette import UnrecordedRequestError
+from youtube_comment_downloader.downloader import YoutubeCommentDownloader
+from youtube_comment_downloader.retry import RetryPolicy
+from youtube_comment_downloader.server import InnertubeServer, RecordedSource
+
+VIDEO_ID = 'ScMzIvxBSi4'
+
+
+def download(**kwargs):
+    reply_concurrency = kwargs.pop('reply_concurrency', 0)
+    downloader = YoutubeCommentDownloader(**kwargs)
+    return list(downloader.get_comments(VIDEO_ID, sleep=0, reply_concurrency=reply_concurrency))
+
+
+@pytest.fixture(scope='module', params=['cassette.ndjson', 'cassette.ndjson.gz'])
+def cassette(request, tmp_path_factory):
+    # A crawl through the consent form, with a few failed requests that had to be retried
+    path = str(tmp_path_factory.mktemp('cassette') / request.param)
+    with InnertubeServer(RecordedSource.from_directory(FIXTURES_DIR), consent=True, error_rate=.1) as server:
+        comments = download(base_url=server.url, cassette=path,
+                            retry_policy=RetryPolicy(retries=20, backoff=.001, jitter=0))
+    return path, comments
+
+
+def test_replay(cassette):
+    path, comments = cassette
+    assert download(cassette=path, replay=True) == comments
+
+
+def test_replay_concurrent_replies(cassette):
+    # The replies are requested in a different order than they were recorded
+    path, comments = cassette
+    replayed = download(cassette=path, replay=True, reply_concurrency=4)
+    assert sorted(comment['cid'] for comment in replayed) == sorted(comment['cid'] for comment in comments)
+
+
+def test_unrecorded_request(cassette):
+    path, comments = cassette
+    downloader = YoutubeCommentDownloader(cassette=path, replay=True)
+    with pytest.raises(UnrecordedRequestError):
+        list(downloader.get_comments('dQw4w9WgXcQ'))
+
+
+@pytest.mark.benchmark(group='extraction')
+def test_extraction_loop_replay(benchmark, cassette):
+    benchmark(download, cassette=cassette[0], replay=True)
@@ -0,0 +1,68 @@
+import json
+import os
+
+import pytest
+
+from conftest import ReplaySession
+from test_extraction import VIDEO_URL
+from youtube_comment_downloader.checkpoint import Checkpoint
+from youtube_comment_downloader.downloader import YoutubeCommentDownloader, SORT_BY_RECENT
+
+
+@pytest.fixture(scope='module')
+def expected(continuations):
+    cids = set()
+    for response in continuations.values():
+        for payload in YoutubeCommentDownloader.search_dict(json.loads(response), 'commentEntityPayload'):
+            cids.add(payload['properties']['commentId'])
+    return cids
+
+
+def crawl(session, path, reply_concurrency, stop_after=None):
+    # Downloads with a checkpoint, like a new run of the program, and stops after stop_after comments
+    downloader = YoutubeCommentDownloader()
+    downloader.session = session
+    generator = downloader.get_comments_from_url(VIDEO_URL, SORT_BY_RECENT, sleep=0,
+                                                 reply_concurrency=reply_concurrency, checkpoint=path)
+    cids = []
+    for comment in generator:
+        cids.append(comment['cid'])
+        if len(cids) == stop_after:
+            break
+    generator.close()
+    return cids
+
+
+@pytest.mark.parametrize('reply_concurrency', [0, 4])
+@pytest.mark.parametrize('stop_after', [1, 7, 33])
+def test_resume(watch_page, continuations, expected, tmp_path, reply_concurrency, stop_after):
+    # Pages hold 20 comment threads or replies, so most interruptions are halfway through a page
+    path = str(tmp_path / 'checkpoint.json')
+    cids, runs = [], 0
+    while True:
+        session = ReplaySession(watch_page, continuations)
+        run = crawl(session, path, reply_concurrency, stop_after)
+        cids.extend(run)
+        runs += 1
+        if len(run) < stop_after:
+            break
+        assert os.path.exists(path)
+        # Resuming starts from the saved continuations instead of the watch page
+        assert Checkpoint(path).load([VIDEO_URL, SORT_BY_RECENT, None])
+
+    assert runs > len(expected) // stop_after
+    assert len(cids) == len(set(cids))
+    assert set(cids) == expected
+    assert not os.path.exists(path)
+
+
+def test_other_key_starts_over(watch_page, continuations, expected, tmp_path):
+    # A checkpoint of the same video in another language is ignored, although it has every comment as yielded
+    path = str(tmp_path / 'checkpoint.json')
+    checkpoint = Checkpoint(path)
+    checkpoint.load([VIDEO_URL, SORT_BY_RECENT, 'de'])
+    checkpoint.emitted = set(expected)
+    checkpoint.save({}, [])
+
+    assert set(crawl(ReplaySession(watch_page, continuations), path, 0)) == expected
+    assert not os.path.exists(path)
@@ -0,0 +1,60 @@
+import json
+import pickle
+import tracemalloc
+
+import pytest
+
+from test_response_index import make_response
+from youtube_comment_downloader.downloader import YoutubeCommentDownloader
+from youtube_comment_downloader.record import Comment
+from youtube_comment_downloader.writers import to_json
+
+
+@pytest.fixture(scope='module')
+def index():
+    return YoutubeCommentDownloader.index_response(make_response(1000))
+
+
+def parse(index, record):
+    return list(YoutubeCommentDownloader.parse_comments(index, 'en', record))
+
+
+def without_time(comments):
+    # time_parsed is relative to the time of parsing
+    return [dict(comment, time_parsed=None) for comment in comments]
+
+
+def test_compact_matches_dict(index):
+    comments, compact = parse(index, dict), parse(index, Comment)
+    assert without_time(compact) == without_time(comments)
+    assert [list(comment) for comment in compact] == [list(comment) for comment in comments]
+    assert without_time(json.loads(to_json(comment)) for comment in compact) == \
+        without_time(json.loads(to_json(comment)) for comment in comments)
+    assert without_time(pickle.loads(pickle.dumps(compact))) == without_time(comments)
+
+
+def test_compact_interns_strings():
+    first = Comment(author=''.join(['@us', 'er']))
+    second = Comment(author=''.join(['@use', 'r']))
+    assert first['author'] is second['author']
+
+
+def test_compact_uses_less_memory(index):
+    def size(record):
+        tracemalloc.start()
+        comments = parse(index, record)
+        current = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+        del comments
+        return current
+    assert size(Comment) < size(dict) / 2
+
+
+@pytest.mark.benchmark(group='comment-record')
+def test_parse_dict(benchmark, index):
+    benchmark(parse, index, dict)
+
+
+@pytest.mark.benchmark(group='comment-record')
+def test_parse_compact(benchmark, index):
+    benchmark(parse, index, Comment)
@@ -0,0 +1,76 @@
+import json
+
+import pytest
+
+from conftest import ReplaySession
+from youtube_comment_downloader.downloader import YoutubeCommentDownloader, SORT_BY_POPULAR, SORT_BY_RECENT
+
+VIDEO_URL = 'https://www.youtube.com/watch?v=ScMzIvxBSi4'
+
+
+def download(session, sort_by=SORT_BY_RECENT, reply_concurrency=0):
+    downloader = YoutubeCommentDownloader()
+    downloader.session = session
+    return list(downloader.get_comments_from_url(VIDEO_URL, sort_by, sleep=0, reply_concurrency=reply_concurrency))
+
+
+@pytest.fixture(scope='module')
+def html(watch_page):
+    return watch_page.decode('utf-8')
+
+
+@pytest.fixture(scope='module')
+def initial_data(html):
+    return YoutubeCommentDownloader.parse_watch_page(html)[1]
+
+
+def test_bootstrap_matches(html):
+    chunks = (html[i:i + 16384] for i in range(0, len(html), 16384))
+    assert YoutubeCommentDownloader.parse_watch_page_stream(chunks) == YoutubeCommentDownloader.parse_watch_page(html)
+
+
+@pytest.mark.parametrize('sort_by', [SORT_BY_POPULAR, SORT_BY_RECENT])
+def test_extracts_every_comment(replay_session, continuations, sort_by):
+    expected = set()
+    for response in continuations.values():
+        for payload in YoutubeCommentDownloader.search_dict(json.loads(response), 'commentEntityPayload'):
+            expected.add(payload['properties']['commentId'])
+
+    cids = [comment['cid'] for comment in download(replay_session, sort_by)]
+    assert len(cids) == len(set(cids))
+    assert set(cids) == expected
+
+
+@pytest.mark.benchmark(group='bootstrap')
+def test_regex_search_bootstrap(benchmark, html):
+    benchmark(YoutubeCommentDownloader.parse_watch_page, html)
+
+
+@pytest.mark.benchmark(group='bootstrap')
+def test_streamed_bootstrap(benchmark, html):
+    benchmark(lambda: YoutubeCommentDownloader.parse_watch_page_stream(
+        html[i:i + 16384] for i in range(0, len(html), 16384)))
+
+
+@pytest.mark.benchmark(group='search-dict')
+def test_search_dict_watch_page(benchmark, initial_data):
+    benchmark(lambda: (YoutubeCommentDownloader.has_comments(initial_data),
+                       YoutubeCommentDownloader.sort_menu(initial_data)))
+
+
+@pytest.mark.benchmark(group='search-dict')
+def test_search_dict_continuations(benchmark, continuations):
+    responses = [json.loads(response) for response in continuations.values()]
+    benchmark(lambda: [list(YoutubeCommentDownloader.search_dict(response, 'continuationEndpoint'))
+                       for response in responses])
+
+
+@pytest.mark.benchmark(group='extraction')
+def test_extraction_loop(benchmark, watch_page, continuations):
+    # The whole crawl of a video: watch page, sort menu, comment pages and reply pages
+    benchmark(lambda: download(ReplaySession(watch_page, continuations)))
+
+
+@pytest.mark.benchmark(group='extraction')
+def test_extraction_loop_concurrent_replies(benchmark, watch_page, continuations):
+    benchmark(lambda: download(ReplaySession(watch_page, continuations), reply_concurrency=4))
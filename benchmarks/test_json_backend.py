@@ -0,0 +1,48 @@
+import json
+
+import pytest
+
+from test_response_index import make_response
+from youtube_comment_downloader import jsonlib
+from youtube_comment_downloader.downloader import YoutubeCommentDownloader
+
+BACKENDS = sorted(jsonlib.BACKENDS)
+
+
+@pytest.fixture(scope='module')
+def response_bytes():
+    return json.dumps(make_response(100)).encode('utf-8')
+
+
+@pytest.fixture(scope='module')
+def comments(response_bytes):
+    index = YoutubeCommentDownloader.index_response(json.loads(response_bytes))
+    return list(YoutubeCommentDownloader.parse_comments(index, 'en'))
+
+
+@pytest.fixture(params=BACKENDS)
+def backend(request):
+    jsonlib.use_backend(request.param)
+    yield request.param
+    jsonlib.use_backend()
+
+
+def test_round_trip(backend, response_bytes, comments):
+    assert jsonlib.decode(response_bytes) == json.loads(response_bytes)
+    assert [json.loads(jsonlib.encode(comment)) for comment in comments] == comments
+    assert jsonlib.encode(comments, indent=2) == json.dumps(comments, ensure_ascii=False, indent=2).encode('utf-8')
+
+
+def test_unknown_backend():
+    with pytest.raises(ValueError):
+        jsonlib.use_backend('simdjson')
+
+
+@pytest.mark.benchmark(group='json-decode-response')
+def test_decode_response(benchmark, backend, response_bytes):
+    benchmark(jsonlib.decode, response_bytes)
+
+
+@pytest.mark.benchmark(group='json-encode-comment')
+def test_encode_comments(benchmark, backend, comments):
+    benchmark(lambda: [jsonlib.encode(comment) for comment in comments])
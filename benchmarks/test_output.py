@@ -0,0 +1,228 @@
+import csv
+import functools
+import gzip
+import io
+import json
+import os
+
+import pytest
+
+from conftest import FIXTURES_DIR, ReplaySession
+from test_extraction import download
+from youtube_comment_downloader import main
+from youtube_comment_downloader.downloader import YoutubeCommentDownloader
+from youtube_comment_downloader.server import InnertubeServer, RecordedSource
+from youtube_comment_downloader.writers import CsvWriter, JsonWriter, NdjsonWriter, parse_count, shard_path, to_json
+
+VIDEO_INFO = {'视频ID': 'ScMzIvxBSi4', '标题': 'Fixture video', 'URL': 'https://www.youtube.com/watch?v=ScMzIvxBSi4',
+              '关键词': 'fixture'}
+
+
+@pytest.fixture(scope='module')
+def comments(watch_page, continuations):
+    return download(ReplaySession(watch_page, continuations))
+
+
+@pytest.fixture(scope='module')
+def batch(tmp_path_factory):
+    batch_comment_downloader = pytest.importorskip('batch_comment_downloader')
+    return batch_comment_downloader.BatchCommentDownloader(output_dir=str(tmp_path_factory.mktemp('batch')))
+
+
+@pytest.fixture(scope='module')
+def cassette(tmp_path_factory):
+    # A recorded crawl, which the command line tool replays without sleeping between pages
+    path = str(tmp_path_factory.mktemp('cassette') / 'cassette.ndjson')
+    with InnertubeServer(RecordedSource.from_directory(FIXTURES_DIR)) as server:
+        comments = list(YoutubeCommentDownloader(base_url=server.url, cassette=path).get_comments(VIDEO_INFO['视频ID'],
+                                                                                                  sleep=0))
+    return path, comments
+
+
+def read_text(path):
+    # Reads a whole output file, decompressing every gzip member or zstd frame
+    with open(path, 'rb') as fp:
+        data = fp.read()
+    if path.endswith('.gz'):
+        data = gzip.decompress(data)
+    elif path.endswith('.zst'):
+        import zstandard
+        data = zstandard.ZstdDecompressor().stream_reader(io.BytesIO(data), read_across_frames=True).read()
+    return data.decode('utf-8-sig')
+
+
+def read_shard(path, writer):
+    # Parses a file of a rotated output on its own
+    text = read_text(path)
+    if isinstance(writer, JsonWriter):
+        document = json.loads(text)
+        return document if writer.key is None else document[writer.key]
+    if isinstance(writer, CsvWriter):
+        return list(csv.DictReader(io.StringIO(text)))
+    return [json.loads(line) for line in text.splitlines()]
+
+
+@pytest.mark.parametrize('value, expected', [('1,234', 1234), ('1.2K', 1200), ('3M', 3000000), ('2.5b', 2500000000),
+                                             (' 7 ', 7), (7, 7), ('', 0), (None, 0), ('1.2.3', 0), ('many', 0)])
+def test_parse_count(value, expected):
+    assert parse_count(value) == expected
+
+
+@pytest.mark.parametrize('path, index, expected', [('comments.ndjson', 0, 'comments.ndjson'),
+                                                   ('comments.ndjson', 1, 'comments.0001.ndjson'),
+                                                   ('out/comments.ndjson.gz', 12, 'out/comments.0012.ndjson.gz'),
+                                                   ('comments.CSV.ZST', 3, 'comments.0003.CSV.ZST'),
+                                                   ('comments', 2, 'comments.0002')])
+def test_shard_path(path, index, expected):
+    assert shard_path(path, index) == expected
+
+
+@pytest.mark.parametrize('name, writer_class', [
+    ('comments.ndjson', NdjsonWriter),
+    ('comments.ndjson.gz', NdjsonWriter),
+    ('comments.ndjson.zst', NdjsonWriter),
+    ('comments.json', JsonWriter),
+    ('comments.json', functools.partial(JsonWriter, key=None)),
+    ('comments.csv.gz', functools.partial(CsvWriter, fieldnames=['cid', 'text', 'author'])),
+])
+def test_rotation(tmp_path, comments, name, writer_class):
+    # Every file of a rotated output can be read on its own, and together they hold every comment in order
+    if name.endswith('.zst'):
+        pytest.importorskip('zstandard')
+    path = str(tmp_path / name)
+    with writer_class(path, flush_every=20, max_bytes=4000) as writer:
+        assert writer.write_all(comments) == len(comments)
+
+    assert len(writer.paths) > 2
+    assert writer.paths == [shard_path(path, index) for index in range(len(writer.paths))]
+    assert sorted(os.listdir(str(tmp_path))) == sorted(os.path.basename(shard) for shard in writer.paths)
+    shards = [read_shard(shard, writer) for shard in writer.paths]
+    assert all(shard for shard in shards)
+    for shard in writer.paths[:-1]:
+        assert os.path.getsize(shard) >= 4000
+    rows = [row for shard in shards for row in shard]
+    if isinstance(writer, CsvWriter):
+        assert [row['cid'] for row in rows] == [comment['cid'] for comment in comments]
+    else:
+        assert rows == comments
+
+
+@pytest.mark.parametrize('extension', ['.ndjson.gz', '.ndjson.zst'])
+def test_compressed_append(tmp_path, comments, extension):
+    # Appending adds a gzip member or zstd frame, which reads back as one stream
+    if extension.endswith('.zst'):
+        pytest.importorskip('zstandard')
+    path = str(tmp_path / ('comments' + extension))
+    with NdjsonWriter(path) as writer:
+        writer.write_all(comments[:50])
+    with NdjsonWriter(path, append=True) as writer:
+        writer.write_all(comments[50:])
+    assert read_shard(path, writer) == comments
+
+
+@pytest.mark.parametrize('pretty', [False, True])
+def test_cli_max_size(tmp_path, cassette, pretty):
+    path, comments = cassette
+    output = str(tmp_path / 'output' / 'comments.json')
+    main(['--youtubeid', VIDEO_INFO['视频ID'], '--output', output, '--replay', path, '--max-size', '.02'] +
+         (['--pretty'] if pretty else []))
+
+    shards = sorted(os.listdir(str(tmp_path / 'output')))
+    assert len(shards) > 2
+    assert shards == sorted(os.path.basename(shard_path(output, index)) for index in range(len(shards)))
+    saved = []
+    for index in range(len(shards)):
+        with open(shard_path(output, index), encoding='utf-8') as fp:
+            saved.extend(json.load(fp)['comments'] if pretty else [json.loads(line) for line in fp])
+    assert saved == comments
+
+
+def test_parquet_typed_counts(batch, tmp_path, comments):
+    # Abbreviated counts ('1.2K') end up as numbers in the typed columns of the batch tool's Parquet dataset
+    dataset = pytest.importorskip('pyarrow.dataset')
+    from youtube_comment_downloader.parquet import ParquetDatasetWriter
+
+    with ParquetDatasetWriter(str(tmp_path / 'parquet')) as writer:
+        writer.write(batch.comment_rows(batch.format_comments(comments, VIDEO_INFO)), keyword='fixture')
+    rows = {row['cid']: row for row in dataset.dataset(str(tmp_path / 'parquet'), partitioning='hive').to_table()
+            .to_pylist()}
+    assert any(comment['votes'].endswith('K') for comment in comments)
+    for comment in comments:
+        assert rows[comment['cid']]['votes'] == parse_count(comment['votes'])
+        assert rows[comment['cid']]['replies'] == parse_count(comment['replies'])
+
+
+@pytest.mark.parametrize('compact_records', [False, True])
+def test_parquet_batch_rows(tmp_path, comments, compact_records):
+    # The batch tool's records keep every column of the dataset, so they end up as the same rows as the comments
+    dataset = pytest.importorskip('pyarrow.dataset')
+    batch_comment_downloader = pytest.importorskip('batch_comment_downloader')
+    from youtube_comment_downloader.parquet import ParquetDatasetWriter
+
+    batch = batch_comment_downloader.BatchCommentDownloader(output_dir=str(tmp_path / 'batch'),
+                                                            compact_records=compact_records)
+    sources = {'batch': batch.comment_rows(batch.format_comments(comments, VIDEO_INFO)), 'comments': comments}
+    tables = {}
+    for name, rows in sources.items():
+        with ParquetDatasetWriter(str(tmp_path / name), crawl_date='2024-05-01') as writer:
+            writer.write(rows, keyword='fixture', video_id=VIDEO_INFO['视频ID'])
+        tables[name] = dataset.dataset(str(tmp_path / name), partitioning='hive').to_table()
+
+    assert tables['batch'].schema == tables['comments'].schema
+    rows = tables['batch'].to_pylist()
+    assert rows == tables['comments'].to_pylist()
+    assert any(row['paid'] for row in rows)
+    assert any(row['reply'] for row in rows) and not all(row['reply'] for row in rows)
+
+
+@pytest.mark.benchmark(group='to-json')
+@pytest.mark.parametrize('pretty', [True, False])
+@pytest.mark.parametrize('count', [0, 50])
+def test_simple_batch_save_comments(tmp_path, comments, pretty, count):
+    # The same formats as the command line tool: {"comments": [...]} with --pretty, one comment per line without
+    simple_batch_downloader = pytest.importorskip('simple_batch_downloader')
+    batch = simple_batch_downloader.SimpleBatchDownloader(output_dir=str(tmp_path))
+    output_path = str(tmp_path / 'comments.json')
+    batch.save_comments(comments[:count], output_path, pretty)
+    with open(output_path, encoding='utf-8') as fp:
+        saved = json.load(fp)['comments'] if pretty else [json.loads(line) for line in fp]
+    assert saved == comments[:count]
+
+
+def test_to_json(benchmark, comments):
+    benchmark(lambda: [to_json(comment) for comment in comments])
+
+
+@pytest.mark.benchmark(group='to-json')
+def test_to_json_pretty(benchmark, comments):
+    benchmark(lambda: [to_json(comment, indent=4) for comment in comments])
+
+
+@pytest.mark.benchmark(group='writers')
+@pytest.mark.parametrize('extension', ['.ndjson', '.ndjson.gz'])
+def test_ndjson_writer(benchmark, tmp_path, comments, extension):
+    def write():
+        with NdjsonWriter(str(tmp_path / ('comments' + extension))) as writer:
+            writer.write_all(comments)
+    benchmark(write)
+
+
+@pytest.mark.benchmark(group='writers')
+def test_csv_writer(benchmark, tmp_path, comments):
+    def write():
+        with CsvWriter(str(tmp_path / 'comments.csv'), comments[0].keys()) as writer:
+            writer.write_all(comments)
+    benchmark(write)
+
+
+@pytest.mark.benchmark(group='format-comments')
+def test_format_comments(benchmark, batch, comments):
+    records = benchmark(batch.format_comments, comments, VIDEO_INFO)
+    assert len(records) == len(comments)
+
+
+@pytest.mark.benchmark(group='format-comments')
+def test_save_video_comments(benchmark, batch, tmp_path, comments):
+    # Formatting and streaming the comments of a video to CSV, as the batch tool does for every video
+    output_path = str(tmp_path / 'video.csv')
+    assert benchmark(batch.save_video_comments, comments, VIDEO_INFO, output_path) == len(comments)
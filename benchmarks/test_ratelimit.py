@@ -0,0 +1,108 @@
+import pytest
+
+from youtube_comment_downloader import ratelimit
+from youtube_comment_downloader.ratelimit import RateLimiter
+
+
+class FakeTime:
+    # Stands in for the time module of the rate limiter: sleeping moves the clock forward instead of waiting
+
+    def __init__(self):
+        self.now = 1000.0
+        self.slept = []
+
+    def time(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.slept.append(seconds)
+        self.now += seconds
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = FakeTime()
+    monkeypatch.setattr(ratelimit, 'time', clock)
+    return clock
+
+
+def acquire_wait(limiter, clock):
+    # How long acquire() blocked
+    start = clock.now
+    limiter.acquire()
+    return clock.now - start
+
+
+def report_throttled(limiter):
+    # From another process, so that only the shared memory connects it to the parent
+    limiter.feedback(429, .1)
+
+
+def test_rate_increases_up_to_max_rate(clock):
+    limiter = RateLimiter(rate=1, max_rate=3, increase=1)
+    rates = []
+    for _ in range(5):
+        limiter.feedback(200, .1)
+        rates.append(limiter.rate)
+    # Additive increase: every success adds increase / rate, i.e. `increase` per second of traffic
+    assert rates == pytest.approx([2, 2.5, 2.9, 3, 3])
+
+
+def test_rate_decreases_on_errors(clock):
+    limiter = RateLimiter(rate=16, min_rate=1, decrease=.5, target_latency=3)
+    for status_code, latency in [(429, .1), (503, .1), (None, .1), (200, 5), (403, .1)]:
+        limiter.feedback(status_code, latency)
+    # Halved on a throttled response, a server error, a failed request and a slow response, down to min_rate
+    assert limiter.rate == 1
+
+
+def test_acquire_paces_requests(clock):
+    limiter = RateLimiter(rate=2, burst=3)
+    # The burst is sent right away, after that the bucket refills at the rate
+    assert [acquire_wait(limiter, clock) for _ in range(5)] == [0, 0, 0, .5, .5]
+    clock.now += 10
+    assert [acquire_wait(limiter, clock) for _ in range(4)] == [0, 0, 0, .5]
+
+
+def test_circuit_breaker(clock):
+    limiter = RateLimiter(rate=2, burst=5, trip_errors=3, trip_window=10, cooldown=60)
+    limiter.feedback(429, .1)
+    limiter.feedback(413, .1)
+    assert not limiter.is_open
+    limiter.feedback(429, .1)
+    assert limiter.is_open
+
+    # Open: nothing is sent until the cooldown has passed, then a single request probes the server (half-open)
+    assert acquire_wait(limiter, clock) == 60
+    assert not limiter.is_open
+    assert acquire_wait(limiter, clock) == pytest.approx(1 / limiter.rate)
+
+    # Closed again: once the probe got through, the bucket refills up to the burst as before
+    clock.now += 60
+    assert [acquire_wait(limiter, clock) for _ in range(5)] == [0] * 5
+
+
+def test_circuit_breaker_window(clock):
+    # Throttled responses only count towards the breaker within the window
+    limiter = RateLimiter(trip_errors=3, trip_window=10, cooldown=60)
+    for _ in range(2):
+        limiter.feedback(429, .1)
+    clock.now += 11
+    for _ in range(2):
+        limiter.feedback(429, .1)
+        assert not limiter.is_open
+    # Other errors slow the rate down, but do not trip the breaker
+    limiter.feedback(503, .1)
+    assert not limiter.is_open
+    limiter.feedback(429, .1)
+    assert limiter.is_open
+
+
+def test_shared_state():
+    # With processes=True a worker process changes the rate of the limiter in the parent process
+    limiter = RateLimiter(rate=8, decrease=.5, processes=True)
+    process = limiter.ctx.Process(target=report_throttled, args=(limiter,))
+    process.start()
+    process.join(30)
+    assert process.exitcode == 0
+    assert limiter.rate == 4
@@ -0,0 +1,52 @@
+import datetime
+import itertools
+
+import dateparser
+import pytest
+
+from youtube_comment_downloader import relative_time
+from youtube_comment_downloader.relative_time import parse_relative_time, _parse_relative_time
+
+# The vocabulary of a typical 1000-comment video: a handful of distinct relative times, repeated
+TIMES = ['%d %s ago' % (n, unit + ('s' if n > 1 else ''))
+         for n, unit in itertools.product([1, 2, 3, 6, 11], ['hour', 'day', 'week', 'month', 'year'])]
+COMMENTS = [TIMES[i % len(TIMES)] for i in range(1000)]
+
+
+@pytest.mark.parametrize('text', TIMES + ['6 天前', '2 週前', '6 日前', '3 か月前', '2주 전'])
+def test_matches_dateparser(text):
+    now = datetime.datetime.fromtimestamp(relative_time.clock())
+    assert parse_relative_time(text) == dateparser.parse(text, settings={'RELATIVE_BASE': now}).timestamp()
+
+
+@pytest.mark.parametrize('text', ['3 weeks ago', '6 天前', 'hace 2 semanas'])
+def test_pinned_anchor(text):
+    now = datetime.datetime(2024, 5, 1, 12, 30, 15)
+    expected = dateparser.parse(text, settings={'RELATIVE_BASE': now}).timestamp()
+    assert parse_relative_time(text, now=now.timestamp()) == expected
+    # The clock only matters when no anchor is given
+    assert parse_relative_time(text, now=now.timestamp()) != parse_relative_time(text)
+
+
+def test_frozen_clock():
+    # The tests parse every relative time against the same anchor (see conftest.py)
+    assert relative_time.clock() == relative_time.clock()
+    assert parse_relative_time('2 days ago') == relative_time.clock() - 2 * 86400
+
+
+def test_falls_back_to_dateparser():
+    assert parse_relative_time('hace 2 semanas', 'es') is not None
+    assert parse_relative_time('not a date', 'en') is None
+
+
+@pytest.mark.benchmark(group='relative-time')
+def test_dateparser_per_comment(benchmark):
+    benchmark.pedantic(lambda: [dateparser.parse(text).timestamp() for text in COMMENTS], rounds=3)
+
+
+@pytest.mark.benchmark(group='relative-time')
+def test_relative_time_per_comment(benchmark):
+    def run():
+        _parse_relative_time.cache_clear()
+        return [parse_relative_time(text, 'en') for text in COMMENTS]
+    benchmark(run)
@@ -0,0 +1,63 @@
+import pytest
+
+from youtube_comment_downloader.downloader import YoutubeCommentDownloader, RESPONSE_KEYS
+
+
+def endpoint(token):
+    return {'clickTrackingParams': 'CAAQ',
+            'commandMetadata': {'webCommandMetadata': {'sendPost': True, 'apiUrl': '/youtubei/v1/next'}},
+            'continuationCommand': {'token': token, 'request': 'CONTINUATION_REQUEST_TYPE_WATCH_NEXT'}}
+
+
+def make_response(num_comments=20):
+    # A continuation response shaped like the ones returned by /youtubei/v1/next
+    items, mutations = [], []
+    for i in range(num_comments):
+        cid = 'Ugz%021d' % i
+        items.append({'commentThreadRenderer': {
+            'commentViewModel': {'commentViewModel': {'commentId': cid, 'commentKey': 'ck' + cid,
+                                                      'commentSurfaceKey': 'sk' + cid, 'toolbarStateKey': 'tk' + cid,
+                                                      'rendererContext': {'loggingContext': {'x': [1, 2, 3]}}}},
+            'replies': {'commentRepliesRenderer': {'contents': [
+                {'continuationItemRenderer': {'continuationEndpoint': endpoint('replies' + cid)}}]}},
+            'renderingPriority': 'RENDERING_PRIORITY_UNKNOWN'}})
+        mutations.append({'entityKey': 'ck' + cid, 'type': 'ENTITY_MUTATION_TYPE_REPLACE', 'payload': {
+            'commentEntityPayload': {
+                'key': 'ck' + cid,
+                'properties': {'commentId': cid, 'content': {'content': 'Comment number %d' % i},
+                               'publishedTime': '%d days ago' % (i + 1), 'toolbarStateKey': 'tk' + cid},
+                'author': {'channelId': 'UC%022d' % i, 'displayName': '@user%d' % i,
+                           'avatarThumbnailUrl': 'https://yt3.ggpht.com/%d=s88-c-k-c0x00ffffff-no-rj' % i},
+                'toolbar': {'likeCountNotliked': str(i), 'replyCount': '1'}}}})
+        mutations.append({'entityKey': 'tk' + cid, 'payload': {'engagementToolbarStateEntityPayload': {
+            'key': 'tk' + cid, 'heartState': 'TOOLBAR_HEART_STATE_UNHEARTED'}}})
+        mutations.append({'entityKey': 'sk' + cid, 'payload': {'commentSurfaceEntityPayload': {
+            'key': 'sk' + cid, 'pdgCommentChip': {'chipText': {'simpleText': '$2.00'}} if i % 10 == 0 else {}}}})
+    items.append({'continuationItemRenderer': {'continuationEndpoint': endpoint('next-page')}})
+    return {'responseContext': {'serviceTrackingParams': [{'service': 'GFEEDBACK', 'params': [{'key': 'e'}] * 10}]},
+            'onResponseReceivedEndpoints': [{'appendContinuationItemsAction': {
+                'targetId': 'comments-section', 'continuationItems': items}}],
+            'frameworkUpdates': {'entityBatchUpdate': {'mutations': mutations}}}
+
+
+def search_all(response):
+    return {key: list(YoutubeCommentDownloader.search_dict(response, key)) for key in RESPONSE_KEYS}
+
+
+@pytest.fixture(scope='module')
+def response():
+    return make_response()
+
+
+def test_index_matches_search_dict(response):
+    assert YoutubeCommentDownloader.index_response(response) == search_all(response)
+
+
+@pytest.mark.benchmark(group='response-index')
+def test_search_dict_per_key(benchmark, response):
+    benchmark(search_all, response)
+
+
+@pytest.mark.benchmark(group='response-index')
+def test_index_dict_single_pass(benchmark, response):
+    benchmark(YoutubeCommentDownloader.index_response, response)
@@ -0,0 +1,116 @@
+import email.utils
+import time
+
+import pytest
+
+from conftest import make_response
+from youtube_comment_downloader.downloader import YoutubeCommentDownloader
+from youtube_comment_downloader.retry import RetryPolicy, RequestFailedError, SUCCESS, RETRY, GIVE_UP
+
+ENDPOINT = {'commandMetadata': {'webCommandMetadata': {'apiUrl': '/youtubei/v1/next'}},
+            'continuationCommand': {'token': 'token'}}
+YTCFG = {'INNERTUBE_CONTEXT': {'client': {}}, 'INNERTUBE_API_KEY': 'key'}
+
+
+class StatusSession:
+    # Answers the API requests with the given status codes, each either a number or a (status code, Retry-After)
+    # tuple, and then with HTTP 200
+
+    def __init__(self, *statuses):
+        self.statuses = list(statuses)
+        self.requests = 0
+
+    def post(self, url, **kwargs):
+        self.requests += 1
+        response = make_response(url, b'{"responseContext": {}}')
+        if self.statuses:
+            status = self.statuses.pop(0)
+            response.status_code, retry_after = status if isinstance(status, tuple) else (status, None)
+            if retry_after is not None:
+                response.headers['Retry-After'] = retry_after
+        return response
+
+
+def request(session, **kwargs):
+    downloader = YoutubeCommentDownloader(retry_policy=RetryPolicy(**dict({'backoff': .001, 'jitter': 0}, **kwargs)))
+    downloader.session = session
+    return downloader.ajax_request(ENDPOINT, YTCFG)
+
+
+def http_date(seconds_from_now):
+    return email.utils.formatdate(time.time() + seconds_from_now, usegmt=True)
+
+
+@pytest.mark.parametrize('value, expected', [('120', 120.0), ('1.5', 1.5), ('-3', 0.0), ('soon', None), ('', None),
+                                             (None, None)])
+def test_parse_retry_after_seconds(value, expected):
+    assert RetryPolicy.parse_retry_after(value) == expected
+
+
+def test_parse_retry_after_date():
+    assert RetryPolicy.parse_retry_after(http_date(60)) == pytest.approx(60, abs=2)
+    assert RetryPolicy.parse_retry_after(http_date(-60)) == 0.0
+
+
+def test_retry_after_takes_precedence():
+    policy = RetryPolicy(backoff=1, factor=2, max_backoff=30, jitter=0, max_retry_after=100)
+    assert [policy.delay(attempt) for attempt in range(7)] == [1, 2, 4, 8, 16, 30, 30]
+    assert policy.delay(0, '10') == 10
+    assert policy.delay(0, '1000') == 100
+    assert policy.delay(3, http_date(40)) == pytest.approx(40, abs=2)
+
+
+def test_deadline():
+    policy = RetryPolicy(retries=10, backoff=5, factor=2, jitter=0, timeout=60, deadline=8)
+    now = time.time()
+    assert policy.backoff_time(0, now) == 5
+    # The second backoff (10 seconds) or a Retry-After would end after the deadline
+    assert policy.backoff_time(1, now) is None
+    assert policy.backoff_time(0, now, retry_after='9') is None
+    assert policy.backoff_time(0, now - 4) is None
+    # The attempt timeout is cut short by the deadline
+    assert policy.attempt_timeout(now - 6) == pytest.approx(2, abs=.5)
+    assert policy.attempt_timeout(now - 60) == .001
+    assert RetryPolicy(timeout=60).attempt_timeout(now - 600) == 60
+
+
+@pytest.mark.parametrize('status_code, expected', [(200, SUCCESS), (429, RETRY), (503, RETRY), (403, GIVE_UP),
+                                                   (413, GIVE_UP), (404, GIVE_UP)])
+def test_classify(status_code, expected):
+    assert RetryPolicy().classify(status_code) == expected
+
+
+def test_classify_errors():
+    # Connection errors and unreadable responses are retried, whatever the status code
+    assert RetryPolicy().classify(error=ConnectionError()) == RETRY
+    assert RetryPolicy().classify(200, ValueError()) == RETRY
+
+
+@pytest.mark.parametrize('status_code', [403, 413])
+def test_request_gives_up(status_code):
+    session = StatusSession(status_code)
+    assert request(session) == {}
+    assert session.requests == 1
+
+
+def test_request_retries_429_and_5xx():
+    session = StatusSession(429, (429, '0'), 503)
+    assert request(session) == {'responseContext': {}}
+    assert session.requests == 4
+
+
+def test_request_fails_after_retries():
+    session = StatusSession(*[429] * 10)
+    with pytest.raises(RequestFailedError) as info:
+        request(session, retries=3)
+    assert (info.value.status_code, info.value.attempts, session.requests) == (429, 3, 3)
+
+
+def test_request_fails_at_deadline():
+    # Waiting as long as the server asks would end after the deadline
+    session = StatusSession((429, '30'))
+    start_time = time.time()
+    with pytest.raises(RequestFailedError) as info:
+        request(session, deadline=5)
+    assert time.time() - start_time < 1
+    assert (info.value.attempts, session.requests) == (1, 1)
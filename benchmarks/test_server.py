@@ -0,0 +1,344 @@
+import asyncio
+import itertools
+import json
+import os
+import subprocess
+import sys
+import time
+
+import pytest
+import requests
+
+from conftest import FIXTURES_DIR
+from youtube_comment_downloader.downloader import YoutubeCommentDownloader
+from youtube_comment_downloader import pool as pool_module
+from youtube_comment_downloader.pool import CommentPool, iter_comments
+from youtube_comment_downloader.ratelimit import RateLimiter
+from youtube_comment_downloader.retry import RetryPolicy
+from youtube_comment_downloader.server import InnertubeServer, RecordedSource
+from youtube_comment_downloader.synthetic import SyntheticSource
+
+VIDEO_ID = 'ScMzIvxBSi4'
+
+
+@pytest.fixture(scope='module')
+def source():
+    return RecordedSource.from_directory(FIXTURES_DIR)
+
+
+@pytest.fixture(scope='module')
+def server(source):
+    with InnertubeServer(source) as server:
+        yield server
+
+
+@pytest.fixture(scope='module')
+def expected(continuations):
+    cids = set()
+    for response in continuations.values():
+        for payload in YoutubeCommentDownloader.search_dict(json.loads(response), 'commentEntityPayload'):
+            cids.add(payload['properties']['commentId'])
+    return cids
+
+
+def download(base_url, **kwargs):
+    downloader = YoutubeCommentDownloader(base_url=base_url, **kwargs)
+    return [comment['cid'] for comment in downloader.get_comments(VIDEO_ID, sleep=0)]
+
+
+def test_downloads_every_comment(server, expected):
+    cids = download(server.url)
+    assert len(cids) == len(set(cids))
+    assert set(cids) == expected
+
+
+def test_synthesized_continuation_falls_back(server, expected):
+    # The server does not know the synthesized token, so the downloader has to fetch the watch page after all
+    assert set(download(server.url + '/', synthesize_continuations=True)) == expected
+
+
+def test_consent(source, expected):
+    with InnertubeServer(source, consent=True) as server:
+        assert set(download(server.url)) == expected
+        assert server.requests['/consent'] == 1
+        assert server.requests['/save'] == 1
+
+
+@pytest.mark.parametrize('consent', [False, True])
+def test_async_parity(source, consent):
+    # The async downloader yields the same comments as the synchronous one, also when it has to accept the consent
+    # form of a server on an IP address
+    pytest.importorskip('aiohttp')
+    from youtube_comment_downloader.async_downloader import AsyncYoutubeCommentDownloader
+
+    async def download_async(base_url):
+        async with AsyncYoutubeCommentDownloader(base_url=base_url) as downloader:
+            return [comment async for comment in downloader.get_comments(VIDEO_ID, sleep=0)]
+
+    with InnertubeServer(source, consent=consent) as server:
+        comments = asyncio.run(download_async(server.url))
+        expected_comments = list(YoutubeCommentDownloader(base_url=server.url).get_comments(VIDEO_ID, sleep=0))
+        assert server.requests['/save'] == (2 if consent else 0)
+    assert len(comments) > 0
+    assert comments == expected_comments
+
+
+def test_gather_stops_with_full_queue(monkeypatch):
+    # Leaving the merged stream early cancels the videos still in flight, even while they wait for room in the queue
+    pytest.importorskip('aiohttp')
+    from youtube_comment_downloader.async_downloader import AsyncYoutubeCommentDownloader
+
+    async def get_comments(self, youtube_id, *args, **kwargs):
+        for i in itertools.count():
+            yield {'cid': '%s.%d' % (youtube_id, i)}
+            await asyncio.sleep(0)
+
+    async def gather():
+        async with AsyncYoutubeCommentDownloader() as downloader:
+            stream = downloader.gather_comments(['a', 'b'])
+            async for youtube_id, comment in stream:
+                # Gives the videos time to fill the queue
+                await asyncio.sleep(.1)
+                break
+            await asyncio.wait_for(stream.aclose(), 5)
+
+    monkeypatch.setattr(AsyncYoutubeCommentDownloader, 'get_comments', get_comments)
+    asyncio.run(gather())
+
+
+@pytest.mark.parametrize('name, dependency', [('AsyncYoutubeCommentDownloader', 'aiohttp'),
+                                              ('ParquetDatasetWriter', 'pyarrow'),
+                                              ('SqliteCommentStore', 'sqlite3')])
+def test_imported_lazily(name, dependency):
+    # Importing the package does not load an optional dependency, using the class that needs it does
+    pytest.importorskip(dependency)
+    code = ('import sys, youtube_comment_downloader; loaded = {0!r} in sys.modules; '
+            'youtube_comment_downloader.{1}; print(loaded, {0!r} in sys.modules)').format(dependency, name)
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    output = subprocess.run([sys.executable, '-c', code], cwd=root, capture_output=True, text=True, check=True)
+    assert output.stdout.split() == ['False', 'True']
+
+
+def test_errors_are_retried(source, expected):
+    with InnertubeServer(source, error_rate=.2) as server:
+        assert set(download(server.url, retry_policy=RetryPolicy(retries=20, backoff=.001, jitter=0))) == expected
+        assert server.requests['/youtubei/v1/next'] > len(source.continuations)
+
+
+def test_unknown_paths(server):
+    assert requests.get(server.url + '/results').status_code == 404
+    assert requests.post(server.url + '/youtubei/v1/next', data=b'{}').status_code == 400
+    assert requests.post(server.url + '/youtubei/v1/next', json={'continuation': 'x'}).json() == {'responseContext': {}}
+
+
+@pytest.mark.parametrize('error, logged', [(ConnectionResetError, False), (BrokenPipeError, False),
+                                           (ValueError, True)])
+def test_client_disconnects_are_not_logged(server, capsys, error, logged):
+    try:
+        raise error()
+    except error:
+        server.handle_error(None, ('127.0.0.1', 0))
+    assert (error.__name__ in capsys.readouterr().err) == logged
+
+
+def test_comment_pool(server, expected):
+    # With a rate limiter the workers do not sleep between pages, so a generous one runs them at full speed
+    rate_limiter = RateLimiter(rate=1000, max_rate=1000, burst=100)
+    with CommentPool(workers=4, downloader_kwargs={'base_url': server.url}, rate_limiter=rate_limiter) as pool:
+        results = list(pool.imap_unordered([VIDEO_ID] * 4))
+    assert len(results) == 4
+    for index, comments, error, elapsed in results:
+        assert error is None
+        assert set(comment['cid'] for comment in comments) == expected
+
+
+def test_iter_comments_timeout(source):
+    # The timeout also ends a request that is still waiting for the server, here the watch page
+    with InnertubeServer(source, latency=2) as server:
+        start_time = time.time()
+        with pytest.raises((TimeoutError, requests.exceptions.Timeout)):
+            list(iter_comments(VIDEO_ID, timeout=.5, downloader_kwargs={'base_url': server.url}))
+        assert time.time() - start_time < 1.5
+    assert pool_module._local.downloader.deadline is None
+
+
+def test_comment_pool_processes(server, expected):
+    # Worker processes are replaced after every video and share the state of the rate limiter
+    rate_limiter = RateLimiter(rate=1000, max_rate=2000, burst=100, increase=1000, processes=True)
+    with CommentPool(workers=2, processes=True, max_tasks_per_worker=1, downloader_kwargs={'base_url': server.url},
+                     rate_limiter=rate_limiter) as pool:
+        results = list(pool.imap_unordered([VIDEO_ID] * 3))
+    assert len(results) == 3
+    for index, comments, error, elapsed in results:
+        assert error is None
+        assert set(comment['cid'] for comment in comments) == expected
+    # Every successful request in a worker raised the shared rate
+    assert rate_limiter.rate > 1000
+
+
+@pytest.mark.parametrize('adaptive_rate', [True, False])
+def test_batch_pool_rate_limiter(server, tmp_path, monkeypatch, adaptive_rate):
+    batch_comment_downloader = pytest.importorskip('batch_comment_downloader')
+    batch = batch_comment_downloader.BatchCommentDownloader(output_dir=str(tmp_path), workers=2,
+                                                            adaptive_rate=adaptive_rate, base_url=server.url)
+    pools = []
+    create_comment_pool = batch.create_comment_pool
+    monkeypatch.setattr(batch, 'create_comment_pool', lambda: pools.append(create_comment_pool()) or pools[-1])
+    videos = [{'视频ID': VIDEO_ID, '标题': 'video', 'URL': 'https://www.youtube.com/watch?v=' + VIDEO_ID}]
+    batch.batch_download_comments_by_keyword({'keyword': videos}, limit=5, output_format='ndjson', delay=0)
+
+    rate_limiter = pools[0].rate_limiter
+    if adaptive_rate:
+        # The workers reported their successful requests to the limiter, which raised its rate
+        assert rate_limiter.rate > 5.0
+    else:
+        assert rate_limiter is None
+
+
+def test_batch_keyword_download(server, expected, tmp_path):
+    batch_comment_downloader = pytest.importorskip('batch_comment_downloader')
+    batch = batch_comment_downloader.BatchCommentDownloader(output_dir=str(tmp_path), base_url=server.url)
+    videos = [{'视频ID': VIDEO_ID, '标题': 'video', 'URL': 'https://www.youtube.com/watch?v=' + VIDEO_ID}]
+    results = batch.batch_download_comments_by_keyword({'keyword': videos}, limit=None, output_format='ndjson',
+                                                        delay=0)
+    output = tmp_path / 'comments' / results['关键词详情']['keyword']['输出文件']
+    with open(output, encoding='utf-8') as fp:
+        assert set(json.loads(line)['评论ID'] for line in fp) == expected
+
+
+def test_batch_deduplicates_videos(tmp_path):
+    # Search results link the same video with tracking parameters that differ between keywords
+    batch_comment_downloader = pytest.importorskip('batch_comment_downloader')
+    source = SyntheticSource(comments=30, reply_ratio=0)
+    url = 'https://www.youtube.com/watch?v=' + VIDEO_ID
+    keyword_results = {
+        'cats': [{'视频ID': 'unknown', '标题': 'video', 'URL': url + '&pp=ygUEY2F0cw%3D%3D'},
+                 {'视频ID': 'unknown', '标题': 'video', 'URL': url + '&pp=ygUEY2F0cw%3D%3D&t=10s'},
+                 {'视频ID': 'unknown', '标题': 'short', 'URL': 'https://www.youtube.com/shorts/'}],
+        'dogs': [{'视频ID': 'unknown', '标题': 'video', 'URL': url + '&si=AbCdEfGh'},
+                 {'视频ID': 'unknown', '标题': 'channel', 'URL': 'https://www.youtube.com/@channel'}],
+    }
+    batch = batch_comment_downloader.BatchCommentDownloader(output_dir=str(tmp_path))
+    normalized = batch.normalize_keyword_results(keyword_results)
+    assert {keyword: [(video['视频ID'], video['URL']) for video in videos] for keyword, videos in normalized.items()} == \
+        {'cats': [(VIDEO_ID, url)], 'dogs': [(VIDEO_ID, url)]}
+
+    with InnertubeServer(source) as server:
+        batch = batch_comment_downloader.BatchCommentDownloader(output_dir=str(tmp_path), base_url=server.url)
+        results = batch.batch_download_comments_by_keyword(keyword_results, limit=None, output_format='ndjson',
+                                                            delay=0)
+        assert server.requests['/watch'] == 1
+    assert (results['总视频数'], results['跨关键词重复视频数'], results['成功视频数']) == (1, 1, 1)
+    for keyword in keyword_results:
+        with open(tmp_path / 'comments' / results['关键词详情'][keyword]['输出文件'], encoding='utf-8') as fp:
+            records = [json.loads(line) for line in fp]
+        assert sorted(record['评论ID'] for record in records) == sorted(source.cids())
+        assert set(record['关键词'] for record in records) == {keyword}
+
+
+def test_batch_incremental_keeps_comments(tmp_path):
+    # A re-crawl only downloads the comments since the last run, which are added to the saved comments of the video
+    batch_comment_downloader = pytest.importorskip('batch_comment_downloader')
+    source = SyntheticSource(comments=50, reply_ratio=0)
+    videos = [{'视频ID': VIDEO_ID, '标题': 'video', 'URL': 'https://www.youtube.com/watch?v=' + VIDEO_ID}]
+    counts = []
+    with InnertubeServer(source) as server:
+        for _ in range(2):
+            batch = batch_comment_downloader.BatchCommentDownloader(output_dir=str(tmp_path), incremental=True,
+                                                                    base_url=server.url)
+            batch.batch_download_comments_by_keyword({'keyword': videos}, limit=None, output_format='ndjson', delay=0)
+            _, video_status = batch.load_manifest()
+            counts.append(video_status[VIDEO_ID]['评论数'])
+            with open(video_status[VIDEO_ID]['输出文件'], encoding='utf-8') as fp:
+                cids = [record['评论ID'] for record in json.load(fp)]
+            assert len(cids) == len(set(cids))
+            assert set(cids) == set(source.cids())
+    assert counts == [source.count(), 0]
+
+
+@pytest.mark.parametrize('workers', [0, 2])
+def test_simple_batch_base_url(tmp_path, workers):
+    # Videos are downloaded in a subprocess of the command line tool, or in a pool, from the local server
+    simple_batch_downloader = pytest.importorskip('simple_batch_downloader')
+    source = SyntheticSource(comments=30, reply_ratio=0)
+    with InnertubeServer(source) as server:
+        batch = simple_batch_downloader.SimpleBatchDownloader(output_dir=str(tmp_path), workers=workers,
+                                                              base_url=server.url)
+        video_info = batch.extract_video_info_from_url('https://www.youtube.com/watch?v=' + VIDEO_ID)
+        success, output_path = batch.download_comments_for_video(video_info, limit=100)
+        assert server.requests['/watch'] == 1
+    assert success
+    with open(output_path, encoding='utf-8') as fp:
+        assert sorted(comment['cid'] for comment in json.load(fp)['comments']) == sorted(source.cids())
+
+
+class DisabledComments:
+    # Serves the watch page without its comment section for one of the videos
+
+    def __init__(self, source, video_id):
+        self.source = source
+        self.video_id = video_id
+
+    def watch_page(self, youtube_id):
+        page = self.source.watch_page(youtube_id)
+        return page.replace(b'continuationItemRenderer', b'hiddenItemRenderer') if youtube_id == self.video_id else page
+
+    def continuation(self, token):
+        return self.source.continuation(token)
+
+
+def test_batch_resume(source, expected, tmp_path, monkeypatch):
+    batch_comment_downloader = pytest.importorskip('batch_comment_downloader')
+    video_ids = ['videoAAAAAA', 'disabledBBB', 'videoCCCCCC']
+    videos = [{'视频ID': video_id, '标题': video_id, 'URL': 'https://www.youtube.com/watch?v=' + video_id}
+              for video_id in video_ids]
+
+    with InnertubeServer(DisabledComments(source, video_ids[1])) as server:
+        batch = batch_comment_downloader.BatchCommentDownloader(output_dir=str(tmp_path), base_url=server.url)
+        # Every video is pending as soon as the run starts
+        monkeypatch.setattr(batch, 'save_video_records', lambda video_id, records, merge=False: 1 / 0)
+        with pytest.raises(ZeroDivisionError):
+            batch.batch_download_comments_by_keyword({'keyword': videos}, limit=20, output_format='ndjson', delay=0)
+        _, video_status = batch.load_manifest()
+        assert {video_id: entry['状态'] for video_id, entry in video_status.items()} == \
+            dict.fromkeys(video_ids, batch_comment_downloader.VIDEO_PENDING)
+        monkeypatch.undo()
+
+        # Interrupted after the first two videos: one is done and the comments of the other are disabled
+        save_video_records = batch.save_video_records
+        monkeypatch.setattr(batch, 'save_video_records', lambda video_id, records, merge=False:
+                            1 / (video_id != video_ids[2]) and save_video_records(video_id, records, merge))
+        with pytest.raises(ZeroDivisionError):
+            batch.batch_download_comments_by_keyword({'keyword': videos}, limit=20, output_format='ndjson', delay=0)
+        _, video_status = batch.load_manifest()
+        assert [video_status[video_id]['状态'] for video_id in video_ids] == \
+            [batch_comment_downloader.VIDEO_DONE, batch_comment_downloader.VIDEO_DISABLED,
+             batch_comment_downloader.VIDEO_PENDING]
+
+        # Only the pending video is downloaded again
+        batch = batch_comment_downloader.BatchCommentDownloader(output_dir=str(tmp_path), base_url=server.url)
+        downloaded = []
+        update_manifest = batch.update_manifest
+        monkeypatch.setattr(batch, 'update_manifest', lambda video_info, *args, **kwargs:
+                            downloaded.append(video_info['视频ID']) or update_manifest(video_info, *args, **kwargs))
+        results = batch.batch_download_comments_by_keyword(None, limit=20, output_format='ndjson', delay=0,
+                                                            resume=True)
+        assert downloaded == [video_ids[2]]
+
+    _, video_status = batch.load_manifest()
+    assert [video_status[video_id]['状态'] for video_id in video_ids] == \
+        [batch_comment_downloader.VIDEO_DONE, batch_comment_downloader.VIDEO_DISABLED,
+         batch_comment_downloader.VIDEO_DONE]
+    output = tmp_path / 'comments' / results['关键词详情']['keyword']['输出文件']
+    with open(output, encoding='utf-8') as fp:
+        records = [json.loads(line) for line in fp]
+    for video_id in (video_ids[0], video_ids[2]):
+        cids = [record['评论ID'] for record in records if record['视频ID'] == video_id]
+        assert len(cids) == len(set(cids)) == 20 and set(cids) <= expected
+    assert not any(record['视频ID'] == video_ids[1] for record in records)
+
+
+@pytest.mark.benchmark(group='extraction')
+def test_extraction_loop_http(benchmark, server):
+    # The whole crawl of a video over HTTP, with connection reuse
+    benchmark(download, server.url)
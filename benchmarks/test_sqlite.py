@@ -0,0 +1,98 @@
+import sqlite3
+
+import pytest
+
+from conftest import ReplaySession
+from test_extraction import download
+from test_output import VIDEO_INFO
+from youtube_comment_downloader.sqlite import SqliteCommentStore
+from youtube_comment_downloader.writers import parse_count
+
+
+@pytest.fixture(scope='module')
+def comments(watch_page, continuations):
+    return download(ReplaySession(watch_page, continuations))
+
+
+@pytest.fixture
+def store(tmp_path):
+    with SqliteCommentStore(str(tmp_path / 'comments.sqlite'), batch_size=50) as store:
+        yield store
+
+
+def rows(store, columns='cid, votes, replies, time_parsed, first_seen, last_seen'):
+    return {row[0]: row[1:] for row in store.connection.execute('SELECT %s FROM comments' % columns)}
+
+
+def test_batch_rows_keep_counts(store, comments, tmp_path):
+    batch_comment_downloader = pytest.importorskip('batch_comment_downloader')
+    batch = batch_comment_downloader.BatchCommentDownloader(output_dir=str(tmp_path / 'batch'))
+    store.write(batch.comment_rows(batch.format_comments(comments, VIDEO_INFO)), keyword='fixture')
+
+    stored = rows(store, 'cid, votes, replies')
+    assert any(comment['votes'].endswith('K') for comment in comments)
+    assert stored == {comment['cid']: (parse_count(comment['votes']), parse_count(comment['replies']))
+                      for comment in comments}
+
+
+def test_batch_rows_keep_fields(comments, tmp_path):
+    # Rows upserted from batch records are the same as those of the comments themselves, also for records that an
+    # earlier version saved without the reply and paid columns
+    batch_comment_downloader = pytest.importorskip('batch_comment_downloader')
+    batch = batch_comment_downloader.BatchCommentDownloader(output_dir=str(tmp_path / 'batch'))
+    records = batch.format_comments(comments, VIDEO_INFO)
+    old_records = [{column: value for column, value in record.items() if column not in ('是否为回复', '付费金额')}
+                   for record in records]
+    columns = 'cid, video_id, text, time, author, channel, votes, replies, photo, heart, reply, time_parsed, paid'
+
+    stored = {}
+    for name, source in [('comments', comments), ('batch', batch.comment_rows(records)),
+                         ('old', batch.comment_rows(old_records))]:
+        with SqliteCommentStore(str(tmp_path / (name + '.sqlite'))) as store:
+            store.write(source, VIDEO_INFO['视频ID'])
+            stored[name] = rows(store, columns)
+
+    assert stored['batch'] == stored['comments']
+    # The fixture has paid comments and replies
+    assert any(paid for *_, reply, time_parsed, paid in stored['batch'].values())
+    assert any(reply for *_, reply, time_parsed, paid in stored['batch'].values())
+    # The reply flag of old records follows from the comment ID, the paid amount is lost
+    assert stored['old'] == {cid: row[:-1] + (None,) for cid, row in stored['comments'].items()}
+
+
+def test_upsert_on_cid(store, comments):
+    assert store.write(comments, VIDEO_INFO['视频ID']) == len(comments)
+    first = rows(store)
+
+    # A later crawl of the same video: the counts changed and the relative times are less precise
+    recrawl = [dict(comment, votes=str(parse_count(comment['votes']) + 1), replies='7', time_parsed=1.0)
+               for comment in comments]
+    store.write(recrawl, VIDEO_INFO['视频ID'])
+
+    assert store.count() == store.count(VIDEO_INFO['视频ID']) == len(comments)
+    second = rows(store)
+    for comment in comments:
+        votes, replies, time_parsed, first_seen, last_seen = second[comment['cid']]
+        assert (votes, replies) == (parse_count(comment['votes']) + 1, 7)
+        assert time_parsed == first[comment['cid']][2]
+        assert first_seen == first[comment['cid']][3]
+        assert last_seen >= first[comment['cid']][4]
+
+
+def test_keywords(store, comments):
+    store.write(comments[:10], 'video1', keyword='cats')
+    store.write(comments[10:20], 'video2', keyword='cats')
+    store.write(comments[:10], 'video1', keyword='dogs')
+    store.write(comments[:10], 'video1', keyword='cats')
+
+    keywords = sorted(store.connection.execute('SELECT video_id, keyword FROM video_keywords'))
+    assert keywords == [('video1', 'cats'), ('video1', 'dogs'), ('video2', 'cats')]
+    query = 'SELECT COUNT(*) FROM comments JOIN video_keywords USING (video_id) WHERE keyword = ?'
+    assert store.connection.execute(query, ('cats',)).fetchone()[0] == 20
+    assert store.connection.execute(query, ('dogs',)).fetchone()[0] == 10
+
+
+def test_readable_while_open(store, comments):
+    store.write(comments, VIDEO_INFO['视频ID'])
+    with sqlite3.connect(store.path) as reader:
+        assert reader.execute('SELECT COUNT(*) FROM comments').fetchone()[0] == len(comments)
@@ -0,0 +1,90 @@
+import tracemalloc
+
+import pytest
+
+from conftest import ReplaySession, make_response
+from youtube_comment_downloader import jsonlib
+from youtube_comment_downloader.downloader import YoutubeCommentDownloader, SORT_BY_POPULAR, SORT_BY_RECENT
+from youtube_comment_downloader.server import InnertubeServer
+from youtube_comment_downloader.synthetic import SyntheticSource
+from youtube_comment_downloader.writers import NdjsonWriter
+
+
+class SyntheticSession(ReplaySession):
+    # Generates every response when it is requested, so that large videos never have to be held in memory
+
+    def __init__(self, source):
+        super(SyntheticSession, self).__init__(source.watch_page(), None)
+        self.source = source
+
+    def post(self, url, json=None, **kwargs):
+        self.requests += 1
+        return make_response(url, self.source.continuation(json['continuation']) or b'{}')
+
+
+def download(session, sort_by=SORT_BY_RECENT):
+    downloader = YoutubeCommentDownloader()
+    downloader.session = session
+    return downloader.get_comments('synthetic', sort_by, sleep=0)
+
+
+@pytest.fixture(scope='module')
+def source():
+    return SyntheticSource(comments=1000, reply_ratio=.3, reply_depth=25, paid_ratio=.05)
+
+
+@pytest.fixture(scope='module')
+def responses(source):
+    return {token: jsonlib.encode(response) for token, response in source.responses()}
+
+
+@pytest.mark.parametrize('sort_by', [SORT_BY_POPULAR, SORT_BY_RECENT])
+def test_extracts_every_comment(source, sort_by):
+    comments = list(download(SyntheticSession(source), sort_by))
+    assert sorted(comment['cid'] for comment in comments) == sorted(source.cids())
+    assert 0 < sum('paid' in comment for comment in comments) < len(comments) / 10
+
+
+def test_deterministic(source, responses):
+    same = SyntheticSource(comments=1000, reply_ratio=.3, reply_depth=25, paid_ratio=.05)
+    assert all(same.continuation(token) == response for token, response in responses.items())
+    assert same.continuation('page-50') is None
+    assert same.continuation('replies-1000-0') is None
+    assert same.continuation('comments-section') is None
+
+
+def test_served():
+    small = SyntheticSource(comments=200, reply_depth=30)
+    with InnertubeServer(small) as server:
+        downloader = YoutubeCommentDownloader(base_url=server.url)
+        assert sorted(comment['cid'] for comment in downloader.get_comments('synthetic', sleep=0)) == \
+            sorted(small.cids())
+
+
+def test_memory_does_not_grow(tmp_path):
+    # Streaming the comments of a video to a file takes as much memory for 4000 comment threads as for 500
+    def peak(comments):
+        tracemalloc.start()
+        with NdjsonWriter(str(tmp_path / 'comments.ndjson')) as writer:
+            writer.write_all(download(SyntheticSession(SyntheticSource(comments))))
+        size = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        return size
+    assert peak(4000) < 1.5 * peak(500)
+
+
+@pytest.mark.benchmark(group='synthetic')
+def test_extraction_loop_synthetic(benchmark, source, responses):
+    # Per comment cost of the extraction loop, without generating the responses
+    comments = benchmark(lambda: list(download(ReplaySession(source.watch_page(), responses))))
+    assert len(comments) == source.count()
+
+
+@pytest.mark.benchmark(group='synthetic')
+def test_write_ndjson_synthetic(benchmark, source, responses, tmp_path):
+    comments = list(download(ReplaySession(source.watch_page(), responses)))
+
+    def write():
+        with NdjsonWriter(str(tmp_path / 'comments.ndjson')) as writer:
+            writer.write_all(comments)
+    benchmark(write)
@@ -0,0 +1,103 @@
+import json
+import os
+
+import pytest
+
+from conftest import ReplaySession
+from test_extraction import VIDEO_URL
+from youtube_comment_downloader.downloader import YoutubeCommentDownloader, SORT_BY_RECENT
+from youtube_comment_downloader.watermark import Watermark
+
+
+class TokenSession(ReplaySession):
+    # Remembers the continuation tokens in the order they were requested
+
+    def __init__(self, watch_page, continuations):
+        super(TokenSession, self).__init__(watch_page, continuations)
+        self.tokens = []
+
+    def post(self, url, json=None, **kwargs):
+        self.tokens.append(json['continuation'])
+        return super(TokenSession, self).post(url, json, **kwargs)
+
+
+def crawl(session, watermark=None, since=None, stop_after=None):
+    downloader = YoutubeCommentDownloader()
+    downloader.session = session
+    generator = downloader.get_comments_from_url(VIDEO_URL, SORT_BY_RECENT, sleep=0, watermark=watermark, since=since)
+    comments = []
+    for comment in generator:
+        comments.append(comment)
+        if len(comments) == stop_after:
+            break
+    generator.close()
+    return comments
+
+
+def top_level(comments):
+    return [comment['cid'] for comment in comments if not comment['reply']]
+
+
+@pytest.fixture(scope='module')
+def comments(watch_page, continuations):
+    return crawl(ReplaySession(watch_page, continuations))
+
+
+def save_watermark(path, cids):
+    with open(path, 'w', encoding='utf-8') as fp:
+        json.dump({'cids': cids}, fp)
+
+
+def test_complete_crawl_saves_watermark(watch_page, continuations, comments, tmp_path):
+    path = str(tmp_path / 'watermark.json')
+    crawled = crawl(ReplaySession(watch_page, continuations), path)
+    assert [comment['cid'] for comment in crawled] == [comment['cid'] for comment in comments]
+
+    watermark = Watermark(path)
+    assert watermark.load()
+    assert watermark.cids == top_level(crawled)[:len(watermark.cids)]
+    assert watermark.time_parsed == max(comment['time_parsed'] for comment in crawled if not comment['reply'])
+
+    # Nothing is new in a re-crawl, which stops on the first page
+    session = ReplaySession(watch_page, continuations)
+    assert top_level(crawl(session, path)) == []
+    assert session.requests < len(continuations) / 2
+
+
+def test_stops_at_known_comment(watch_page, continuations, comments, tmp_path):
+    # Four comments were posted since the last crawl
+    path = str(tmp_path / 'watermark.json')
+    save_watermark(path, top_level(comments)[4:10])
+    assert top_level(crawl(ReplaySession(watch_page, continuations), path)) == top_level(comments)[:4]
+
+
+def test_pinned_comment_is_skipped(watch_page, continuations, comments, tmp_path):
+    # The first comment is known, but may be pinned: the crawl goes on until the next known comment
+    path = str(tmp_path / 'watermark.json')
+    save_watermark(path, [top_level(comments)[0]] + top_level(comments)[4:10])
+    assert top_level(crawl(ReplaySession(watch_page, continuations), path)) == top_level(comments)[1:4]
+
+
+def test_since(watch_page, continuations, comments):
+    # Halfway between two relative times, so that the time passing between the crawls does not matter
+    times = [comment['time_parsed'] for comment in comments if not comment['reply']]
+    index = next(i for i in range(1, len(times)) if times[i] < times[i - 1])
+    since = (times[index - 1] + times[index]) / 2
+
+    new = crawl(ReplaySession(watch_page, continuations), since=since)
+    assert top_level(new) == top_level(comments)[:index]
+    assert all(comment['time_parsed'] >= since for comment in new)
+
+
+def test_partial_crawl_does_not_save(watch_page, continuations, comments, tmp_path):
+    path = str(tmp_path / 'watermark.json')
+    crawl(ReplaySession(watch_page, continuations), path, stop_after=10)
+    assert not os.path.exists(path)
+
+    # A page that could not be fetched ends the crawl early as well
+    session = TokenSession(watch_page, continuations)
+    crawl(session)
+    missing = dict(continuations)
+    del missing[session.tokens[len(session.tokens) // 2]]
+    assert len(crawl(ReplaySession(watch_page, missing), path)) < len(comments)
+    assert not os.path.exists(path)
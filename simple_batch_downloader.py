@@ -9,20 +9,40 @@ import os
 import sys
 import time
 import json
-import csv
 import subprocess
 from datetime import datetime
 
+from youtube_comment_downloader import INDENT
+from youtube_comment_downloader.pool import CommentPool, download_comments
+from youtube_comment_downloader.ratelimit import RateLimiter
+from youtube_comment_downloader.writers import JsonWriter, NdjsonWriter
+
 
 class SimpleBatchDownloader:
-    def __init__(self, output_dir="simple_batch_output"):
+    def __init__(self, output_dir="simple_batch_output", workers=0, use_processes=False, max_tasks_per_worker=50,
+                 synthesize_continuations=True, use_cache=True, adaptive_rate=True, base_url=None):
         """
         初始化简化版批量下载器
         
         Args:
             output_dir (str): 输出目录
+            workers (int): 进程内并发下载数 (0=每个视频启动一个子进程)
+            use_processes (bool): 并发时使用进程池而不是线程池
+            max_tasks_per_worker (int): 每个工作者下载多少个视频后被替换
+            synthesize_continuations (bool): 并发下载时直接构造评论区continuation, 跳过后续视频的观看页面
+            use_cache (bool): 在输出目录下缓存ytcfg、cookie和排序入口, 重新下载时跳过观看页面
+            adaptive_rate (bool): 并发下载时所有工作者共用一个根据响应自动调整速率的限流器
+            base_url (str): 代替 https://www.youtube.com 发送请求的地址 (如本地测试服务器)
         """
         self.output_dir = output_dir
+        self.workers = workers
+        self.use_processes = use_processes
+        self.max_tasks_per_worker = max_tasks_per_worker
+        self.cache_dir = os.path.join(output_dir, "cache") if use_cache else None
+        self.base_url = base_url
+        self.downloader_kwargs = {'synthesize_continuations': synthesize_continuations, 'cache': self.cache_dir,
+                                  'base_url': base_url}
+        self.adaptive_rate = adaptive_rate
         
         # 创建输出目录
         if not os.path.exists(output_dir):
@@ -40,6 +60,8 @@ class SimpleBatchDownloader:
         print(f"📁 输出目录: {output_dir}")
         print(f"  📂 评论目录: {self.comments_dir}")
         print(f"  📂 日志目录: {self.logs_dir}")
+        if workers:
+            print(f"⚡ 并发下载: {workers} 个{'进程' if use_processes else '线程'}")
 
     def extract_video_id(self, url):
         """从YouTube URL中提取视频ID"""
@@ -96,6 +118,22 @@ class SimpleBatchDownloader:
         output_filename = f"{video_id}_{safe_title}.json"
         output_path = os.path.join(self.comments_dir, output_filename)
         
+        if self.workers:
+            # 进程内下载，直接调用YoutubeCommentDownloader
+            try:
+                print(f"⬇️ 正在下载评论: {video_title[:50]}...")
+                comments = download_comments(video_id, sort, language, limit, timeout=300,
+                                             downloader_kwargs=self.downloader_kwargs)
+                self.save_comments(comments, output_path, pretty)
+                print(f"✅ 评论下载成功: {output_filename}")
+                return True, output_path
+            except TimeoutError:
+                print(f"⏰ 下载超时: {video_title}")
+                return False, None
+            except Exception as e:
+                print(f"❌ 下载出错: {e}")
+                return False, None
+        
         # 构建命令
         cmd = [
             sys.executable, "-m", "youtube_comment_downloader",
@@ -107,6 +145,12 @@ class SimpleBatchDownloader:
         
         if language:
             cmd.extend(["--language", language])
+        
+        if self.cache_dir:
+            cmd.extend(["--cache", self.cache_dir])
+        
+        if self.base_url:
+            cmd.extend(["--base-url", self.base_url])
             
         if pretty:
             cmd.append("--pretty")
@@ -130,6 +174,61 @@ class SimpleBatchDownloader:
             print(f"❌ 下载出错: {e}")
             return False, None
 
+    def save_comments(self, comments, output_path, pretty=True):
+        """以与命令行工具相同的格式保存评论"""
+        with (JsonWriter(output_path, indent=INDENT) if pretty else NdjsonWriter(output_path)) as writer:
+            writer.write_all(comments)
+
+    def iter_sequential_downloads(self, video_list, limit, sort, language, pretty, delay):
+        """逐个下载视频评论，返回 (序号, 视频信息, 是否成功, 输出文件, 耗时)"""
+        for i, video_info in enumerate(video_list, 1):
+            print(f"\n{'='*60}")
+            print(f"正在处理第 {i}/{len(video_list)} 个视频")
+            
+            start_time = time.time()
+            success, output_path = self.download_comments_for_video(
+                video_info, limit, sort, language, pretty
+            )
+            yield i, video_info, success, output_path, time.time() - start_time
+            
+            # 添加延迟
+            if i < len(video_list) and delay > 0:
+                print(f"⏱️ 等待 {delay} 秒后继续...")
+                time.sleep(delay)
+
+    def iter_pool_downloads(self, video_list, limit, sort, language, pretty):
+        """并发下载视频评论并保存，按完成顺序返回 (序号, 视频信息, 是否成功, 输出文件, 耗时)"""
+        valid_videos = []
+        for i, video_info in enumerate(video_list, 1):
+            if video_info.get('视频ID', 'unknown') == 'unknown':
+                print(f"❌ 无效的视频ID: {video_info.get('标题', 'unknown')}")
+                yield i, video_info, False, None, 0.0
+            else:
+                valid_videos.append((i, video_info))
+        
+        video_ids = [video_info['视频ID'] for _, video_info in valid_videos]
+        print(f"⬇️ 使用 {self.workers} 个工作者并发下载 {len(video_ids)} 个视频的评论...")
+        
+        with CommentPool(self.workers, processes=self.use_processes,
+                         max_tasks_per_worker=self.max_tasks_per_worker,
+                         downloader_kwargs=self.downloader_kwargs,
+                         rate_limiter=RateLimiter(processes=self.use_processes) if self.adaptive_rate else None) as pool:
+            for index, comments, error, elapsed in pool.imap_unordered(video_ids, sort, language, limit, timeout=300):
+                i, video_info = valid_videos[index]
+                video_id = video_info['视频ID']
+                video_title = video_info.get('标题', 'unknown')
+                
+                if error is not None:
+                    print(f"❌ [{i}/{len(video_list)}] 评论下载失败: {video_title} ({error})")
+                    yield i, video_info, False, None, elapsed
+                    continue
+                
+                safe_title = "".join(c for c in video_title if c.isalnum() or c in (' ', '-', '_')).strip()[:50]
+                output_path = os.path.join(self.comments_dir, f"{video_id}_{safe_title}.json")
+                self.save_comments(comments, output_path, pretty)
+                print(f"✅ [{i}/{len(video_list)}] 评论下载成功: {len(comments)} 条评论")
+                yield i, video_info, True, output_path, elapsed
+
     def batch_download_comments(self, video_list, limit=100, sort=1, language=None, pretty=True, delay=2):
         """
         批量下载评论
@@ -160,16 +259,12 @@ class SimpleBatchDownloader:
             log.write(f"参数设置: limit={limit}, sort={sort}, language={language}, pretty={pretty}\n")
             log.write("="*80 + "\n\n")
             
-            for i, video_info in enumerate(video_list, 1):
-                print(f"\n{'='*60}")
-                print(f"正在处理第 {i}/{len(video_list)} 个视频")
-                
-                start_time = time.time()
-                success, output_path = self.download_comments_for_video(
-                    video_info, limit, sort, language, pretty
-                )
-                end_time = time.time()
-                
+            if self.workers:
+                video_results = self.iter_pool_downloads(video_list, limit, sort, language, pretty)
+            else:
+                video_results = self.iter_sequential_downloads(video_list, limit, sort, language, pretty, delay)
+            
+            for i, video_info, success, output_path, elapsed in video_results:
                 # 记录日志
                 log_entry = f"[{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] "
                 log_entry += f"视频 {i}/{len(video_list)}: {video_info.get('标题', 'unknown')[:50]}\n"
@@ -185,16 +280,11 @@ class SimpleBatchDownloader:
                     failed_videos.append(video_info)
                     log_entry += f"状态: ❌ 失败\n"
                 
-                log_entry += f"耗时: {end_time - start_time:.2f}秒\n"
+                log_entry += f"耗时: {elapsed:.2f}秒\n"
                 log_entry += "-" * 80 + "\n\n"
                 
                 log.write(log_entry)
                 log.flush()
-                
-                # 添加延迟
-                if i < len(video_list) and delay > 0:
-                    print(f"⏱️ 等待 {delay} 秒后继续...")
-                    time.sleep(delay)
             
             # 写入最终统计
             log.write(f"\n批量下载完成时间: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\n")
@@ -381,6 +471,11 @@ def main():
             except:
                 delay = 2
             
+            try:
+                downloader.workers = int(input("并发下载数 (0=逐个启动子进程, 默认0): ").strip() or "0")
+            except:
+                downloader.workers = 0
+            
             # 批量下载评论
             download_results = downloader.batch_download_comments(
                 video_list, limit, sort, language, pretty, delay
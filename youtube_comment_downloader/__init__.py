@@ -1,21 +1,33 @@
 import argparse
-import io
-import json
+import importlib
 import os
 import sys
 import time
 
-from .downloader import YoutubeCommentDownloader, SORT_BY_POPULAR, SORT_BY_RECENT
+import dateparser
+
+from .downloader import YoutubeCommentDownloader, CommentsDisabledError, SORT_BY_POPULAR, SORT_BY_RECENT
+from .cache import BootstrapCache
+from .checkpoint import Checkpoint
+from .pool import CommentPool
+from .ratelimit import RateLimiter
+from .record import Comment
+from .retry import RetryPolicy, RequestFailedError
+from .watermark import Watermark
+from .writers import CsvWriter, JsonWriter, NdjsonWriter, open_text, open_writer, to_json
 
 INDENT = 4
 
+# Classes that pull in optional dependencies are only imported when they are used: name -> module
+LAZY_IMPORTS = {'AsyncYoutubeCommentDownloader': '.async_downloader',
+                'ParquetDatasetWriter': '.parquet',
+                'SqliteCommentStore': '.sqlite'}
+
 
-def to_json(comment, indent=None):
-    comment_str = json.dumps(comment, ensure_ascii=False, indent=indent)
-    if indent is None:
-        return comment_str
-    padding = ' ' * (2 * indent) if indent else ''
-    return ''.join(padding + line for line in comment_str.splitlines(True))
+def __getattr__(name):
+    if name in LAZY_IMPORTS:
+        return getattr(importlib.import_module(LAZY_IMPORTS[name], __name__), name)
+    raise AttributeError('module {!r} has no attribute {!r}'.format(__name__, name))
 
 
 def main(argv = None):
@@ -23,12 +35,31 @@ def main(argv = None):
     parser.add_argument('--help', '-h', action='help', default=argparse.SUPPRESS, help='Show this help message and exit')
     parser.add_argument('--youtubeid', '-y', help='ID of Youtube video for which to download the comments')
     parser.add_argument('--url', '-u', help='Youtube URL for which to download the comments')
-    parser.add_argument('--output', '-o', help='Output filename (output format is line delimited JSON)')
+    parser.add_argument('--output', '-o', help='Output filename (output format is line delimited JSON). '
+                                               'Output ending in .gz or .zst is compressed')
     parser.add_argument('--pretty', '-p', action='store_true', help='Change the output format to indented JSON')
     parser.add_argument('--limit', '-l', type=int, help='Limit the number of comments')
     parser.add_argument('--language', '-a', type=str, default=None, help='Language for Youtube generated text (e.g. en)')
     parser.add_argument('--sort', '-s', type=int, default=SORT_BY_RECENT,
                         help='Whether to download popular (0) or recent comments (1). Defaults to 1')
+    parser.add_argument('--reply-concurrency', type=int, default=0,
+                        help='Number of reply threads to expand concurrently. Defaults to 0 (sequential)')
+    parser.add_argument('--cache', type=str, default=None,
+                        help='Directory for caching cookies, ytcfg and sort endpoints between runs')
+    parser.add_argument('--checkpoint', type=str, default=None,
+                        help='Checkpoint file for resuming an interrupted download (the output file is appended to)')
+    parser.add_argument('--watermark', type=str, default=None,
+                        help='Watermark file of the video: only download comments posted since the last complete run')
+    parser.add_argument('--since', type=str, default=None,
+                        help='Only download comments posted after this date (e.g. 2024-05-01 or "2 weeks ago")')
+    parser.add_argument('--max-size', type=float, default=None,
+                        help='Start a new numbered output file once the output reaches this size in MB')
+    parser.add_argument('--base-url', type=str, default=None,
+                        help='Send requests to this URL instead of https://www.youtube.com (e.g. a local test server)')
+    parser.add_argument('--record', type=str, default=None,
+                        help='Save every HTTP exchange to this cassette file (compressed if it ends in .gz or .zst)')
+    parser.add_argument('--replay', type=str, default=None,
+                        help='Serve the HTTP exchanges of this cassette file instead of using the network')
 
     try:
         args = parser.parse_args() if argv is None else parser.parse_args(argv)
@@ -43,40 +74,55 @@ def main(argv = None):
             parser.print_usage()
             raise ValueError('you need to specify a Youtube ID/URL and an output filename')
 
+        if args.record and args.replay:
+            raise ValueError('can not record and replay at the same time')
+
+        since = None
+        if args.since:
+            since = dateparser.parse(args.since)
+            if since is None:
+                raise ValueError('can not parse --since date: ' + args.since)
+            since = since.timestamp()
+
+        resume = args.checkpoint and os.path.exists(args.checkpoint)
+        if resume and pretty:
+            raise ValueError('can not resume indented JSON output, remove --pretty or the checkpoint file')
+
         if os.sep in output:
             outdir = os.path.dirname(output)
             if not os.path.exists(outdir):
                 os.makedirs(outdir)
 
         print('Downloading Youtube comments for', youtube_id or youtube_url)
-        downloader = YoutubeCommentDownloader()
+        downloader = YoutubeCommentDownloader(cache=args.cache, base_url=args.base_url,
+                                              cassette=args.record or args.replay, replay=bool(args.replay))
         generator = (
-            downloader.get_comments(youtube_id, args.sort, args.language)
+            downloader.get_comments(youtube_id, args.sort, args.language, reply_concurrency=args.reply_concurrency,
+                                    checkpoint=args.checkpoint, watermark=args.watermark, since=since)
             if youtube_id
-            else downloader.get_comments_from_url(youtube_url, args.sort, args.language)
+            else downloader.get_comments_from_url(youtube_url, args.sort, args.language,
+                                                  reply_concurrency=args.reply_concurrency, checkpoint=args.checkpoint,
+                                                  watermark=args.watermark, since=since)
         )
 
+        max_bytes = int(args.max_size * 1024 * 1024) if args.max_size else None
+        writer = JsonWriter(output, indent=INDENT, max_bytes=max_bytes) if pretty else \
+            NdjsonWriter(output, append=resume, max_bytes=max_bytes)
+
         count = 1
-        with io.open(output, 'w', encoding='utf8') as fp:
+        with writer:
             sys.stdout.write('Downloaded %d comment(s)\r' % count)
             sys.stdout.flush()
             start_time = time.time()
 
-            if pretty:
-                fp.write('{\n' + ' ' * INDENT + '"comments": [\n')
-
-            comment = next(generator, None)
-            while comment:
-                comment_str = to_json(comment, indent=INDENT if pretty else None)
-                comment = None if limit and count >= limit else next(generator, None)  # Note that this is the next comment
-                comment_str = comment_str + ',' if pretty and comment is not None else comment_str
-                print(comment_str.decode('utf-8') if isinstance(comment_str, bytes) else comment_str, file=fp)
+            for comment in generator:
+                writer.write(comment)
                 sys.stdout.write('Downloaded %d comment(s)\r' % count)
                 sys.stdout.flush()
+                if limit and count >= limit:
+                    break
                 count += 1
-
-            if pretty:
-                fp.write(' ' * INDENT +']\n}')
+            generator.close()
         print('\n[{:.2f} seconds] Done!'.format(time.time() - start_time))
 
     except Exception as e:
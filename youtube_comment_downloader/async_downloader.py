@@ -0,0 +1,177 @@
+import asyncio
+import time
+from http.cookies import SimpleCookie
+
+try:
+    import aiohttp
+except ImportError:
+    aiohttp = None
+
+from .downloader import YoutubeCommentDownloader, CommentsDisabledError, USER_AGENT, SORT_BY_RECENT, site_urls
+from . import jsonlib
+from .record import Comment
+from .retry import RetryPolicy, RequestFailedError, GIVE_UP
+
+# All parsing is shared with the synchronous downloader so that both produce identical comment dicts
+parser = YoutubeCommentDownloader
+
+_DONE = object()
+
+
+class AsyncYoutubeCommentDownloader:
+
+    def __init__(self, connections=100, retry_policy=None, compact=False, base_url=None):
+        if aiohttp is None:
+            raise ImportError('AsyncYoutubeCommentDownloader requires aiohttp (pip install aiohttp)')
+        self.connections = connections
+        self.retry_policy = retry_policy or RetryPolicy()
+        self.record = Comment if compact else dict
+        self.base_url, self.video_url, self.consent_url = site_urls(base_url)
+        self.session = None
+
+    async def __aenter__(self):
+        await self.open()
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.close()
+
+    async def open(self):
+        if self.session is None:
+            # One pooled connector is shared by every video handled by this downloader
+            connector = aiohttp.TCPConnector(limit=self.connections)
+            # By default aiohttp drops cookies set by a host that is an IP address, such as a local stand-in for
+            # Youtube (base_url), which would send the downloader back to the consent form forever
+            self.session = aiohttp.ClientSession(connector=connector, headers={'User-Agent': USER_AGENT},
+                                                 cookie_jar=aiohttp.CookieJar(unsafe=True))
+            cookie = SimpleCookie()
+            cookie['CONSENT'] = 'YES+cb'
+            cookie['CONSENT']['domain'] = '.youtube.com'
+            self.session.cookie_jar.update_cookies(cookie)
+
+    async def close(self):
+        if self.session is not None:
+            await self.session.close()
+            self.session = None
+
+    async def ajax_request(self, endpoint, ytcfg, retries=None, sleep=None, timeout=None):
+        policy = self.retry_policy.replace(retries=retries, backoff=sleep, timeout=timeout)
+        url = self.base_url + endpoint['commandMetadata']['webCommandMetadata']['apiUrl']
+
+        data = {'context': ytcfg['INNERTUBE_CONTEXT'],
+                'continuation': endpoint['continuationCommand']['token']}
+
+        start_time = time.time()
+        for attempt in range(max(1, policy.retries)):
+            status_code, retry_after, error = None, None, None
+            client_timeout = aiohttp.ClientTimeout(total=policy.attempt_timeout(start_time))
+            try:
+                async with self.session.post(url, params={'key': ytcfg['INNERTUBE_API_KEY']}, json=data,
+                                             timeout=client_timeout) as response:
+                    status_code = response.status
+                    retry_after = response.headers.get('Retry-After')
+                    if status_code == 200:
+                        return jsonlib.decode(await response.read())
+            except (asyncio.TimeoutError, aiohttp.ClientError, ValueError) as e:
+                error = e
+
+            if policy.classify(status_code, error) == GIVE_UP:
+                return {}
+            delay = policy.backoff_time(attempt, start_time, retry_after)
+            if delay is None:
+                break
+            await asyncio.sleep(delay)
+
+        raise RequestFailedError('Request to {} failed after {} attempt(s) ({})'.format(
+            url, attempt + 1, error or 'HTTP {}'.format(status_code)), status_code, attempt + 1)
+
+    async def get_comments(self, youtube_id, *args, **kwargs):
+        async for comment in self.get_comments_from_url(self.video_url.format(youtube_id=youtube_id),
+                                                         *args, **kwargs):
+            yield comment
+
+    async def get_comments_from_url(self, youtube_url, sort_by=SORT_BY_RECENT, language=None, sleep=.1):
+        await self.open()
+
+        timeout = aiohttp.ClientTimeout(total=self.retry_policy.timeout)
+        async with self.session.get(youtube_url, timeout=timeout) as response:
+            html = await response.text()
+            response_url = str(response.url)
+
+        if 'consent' in response_url:
+            # We may get redirected to a separate page for cookie consent. If this happens we agree automatically.
+            params = {key: str(value) for key, value in parser.consent_params(html, youtube_url).items()}
+            async with self.session.post(self.consent_url, params=params, timeout=timeout) as response:
+                html = await response.text()
+
+        ytcfg, data = parser.parse_watch_page(html, language)
+        if not ytcfg:
+            return  # Unable to extract configuration
+
+        if not parser.has_comments(data):
+            raise CommentsDisabledError('Comments are disabled for ' + youtube_url)
+
+        sort_menu = parser.sort_menu(data)
+        if not sort_menu:
+            # No sort menu. Maybe this is a request for community posts?
+            section_list = next(parser.search_dict(data, 'sectionListRenderer'), {})
+            continuations = list(parser.search_dict(section_list, 'continuationEndpoint'))
+            # Retry..
+            data = await self.ajax_request(continuations[0], ytcfg) if continuations else {}
+            sort_menu = parser.sort_menu(data)
+        if not sort_menu or sort_by >= len(sort_menu):
+            raise RuntimeError('Failed to set sorting')
+        continuations = [sort_menu[sort_by]['serviceEndpoint']]
+
+        while continuations:
+            continuation = continuations.pop()
+            response = await self.ajax_request(continuation, ytcfg)
+
+            if not response:
+                break
+
+            index = parser.index_response(response)
+            parser.raise_for_error(index)
+            parser.queue_continuations(index, continuations)
+            for comment in parser.parse_comments(index, ytcfg['INNERTUBE_CONTEXT']['client'].get('hl'), self.record):
+                yield comment
+            await asyncio.sleep(sleep)
+
+    async def gather_comments(self, youtube_ids, *args, **kwargs):
+        # Merges the comment streams of many videos into a single stream of (youtube_id, comment) tuples.
+        # At most `concurrency` videos are in flight at once. Like asyncio.gather, the first error is raised unless
+        # return_exceptions is set, in which case the exception is yielded in place of a comment.
+        concurrency = kwargs.pop('concurrency', None) or self.connections
+        return_exceptions = kwargs.pop('return_exceptions', False)
+
+        await self.open()
+        queue = asyncio.Queue(maxsize=1000)
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def produce(youtube_id):
+            async with semaphore:
+                try:
+                    async for comment in self.get_comments(youtube_id, *args, **kwargs):
+                        await queue.put((youtube_id, comment))
+                except Exception as e:
+                    await queue.put((youtube_id, e))
+                # Not in a finally block: a cancelled producer has no consumer left to tell, and waiting for room in a
+                # full queue would keep the cancellation below from ever finishing
+                await queue.put((youtube_id, _DONE))
+
+        youtube_ids = list(youtube_ids)
+        tasks = [asyncio.ensure_future(produce(youtube_id)) for youtube_id in youtube_ids]
+        try:
+            remaining = len(tasks)
+            while remaining:
+                youtube_id, item = await queue.get()
+                if item is _DONE:
+                    remaining -= 1
+                    continue
+                if isinstance(item, Exception) and not return_exceptions:
+                    raise item
+                yield youtube_id, item
+        finally:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
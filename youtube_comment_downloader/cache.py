@@ -0,0 +1,93 @@
+import hashlib
+import json
+import os
+import tempfile
+import time
+
+from .record import json_default
+
+# Default time-to-live (in seconds) per kind of entry
+DEFAULT_TTLS = {'cookies': 24 * 3600,
+                'ytcfg': 6 * 3600,
+                'sort_endpoint': 24 * 3600}
+
+
+def write_json_atomic(filename, data):
+    # Readers either see the old file or the new one, never a partially written file
+    directory = os.path.dirname(filename) or '.'
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_filename = tempfile.mkstemp(dir=directory, suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'w', encoding='utf-8') as fp:
+            json.dump(data, fp, ensure_ascii=False, default=json_default)
+        os.replace(tmp_filename, filename)
+    except BaseException:
+        os.remove(tmp_filename)
+        raise
+
+
+class BootstrapCache:
+    # Everything the downloader learns from a watch page, stored on disk so that re-crawls can start right away.
+    # Every entry is a separate JSON file that is written to a temporary file first and then moved into place with
+    # os.replace, so workers (threads or processes) can share a cache directory without locking.
+
+    def __init__(self, path, ttls=None):
+        self.path = path
+        self.ttls = dict(DEFAULT_TTLS, **(ttls or {}))
+
+    def __eq__(self, other):
+        return isinstance(other, BootstrapCache) and (self.path, self.ttls) == (other.path, other.ttls)
+
+    def __ne__(self, other):
+        return not self == other
+
+    def filename(self, kind, key):
+        digest = hashlib.sha1(str(key).encode('utf-8')).hexdigest()
+        return os.path.join(self.path, kind, digest + '.json')
+
+    def get(self, kind, key):
+        try:
+            with open(self.filename(kind, key), encoding='utf-8') as fp:
+                entry = json.load(fp)
+        except (OSError, ValueError):
+            return None
+        if entry.get('key') != key or entry.get('expires', 0) < time.time():
+            return None
+        return entry['value']
+
+    def set(self, kind, key, value, ttl=None):
+        ttl = self.ttls.get(kind, 0) if ttl is None else ttl
+        entry = {'key': key, 'expires': time.time() + ttl, 'value': value}
+
+        write_json_atomic(self.filename(kind, key), entry)
+
+    def delete(self, kind, key):
+        try:
+            os.remove(self.filename(kind, key))
+        except OSError:
+            pass
+
+    def get_cookies(self, cookie_jar):
+        for cookie in self.get('cookies', 'youtube') or []:
+            cookie_jar.set(cookie['name'], cookie['value'], domain=cookie['domain'], path=cookie['path'],
+                           expires=cookie['expires'], secure=cookie['secure'])
+
+    def set_cookies(self, cookie_jar):
+        self.set('cookies', 'youtube', [{'name': cookie.name, 'value': cookie.value, 'domain': cookie.domain,
+                                         'path': cookie.path, 'expires': cookie.expires, 'secure': cookie.secure}
+                                        for cookie in cookie_jar])
+
+    def get_ytcfg(self, language=None):
+        return self.get('ytcfg', language or '')
+
+    def set_ytcfg(self, ytcfg, language=None):
+        self.set('ytcfg', language or '', ytcfg)
+
+    def get_sort_endpoint(self, youtube_id, sort_by):
+        return self.get('sort_endpoint', '%s:%d' % (youtube_id, sort_by))
+
+    def set_sort_endpoint(self, youtube_id, sort_by, endpoint):
+        self.set('sort_endpoint', '%s:%d' % (youtube_id, sort_by), endpoint)
+
+    def delete_sort_endpoint(self, youtube_id, sort_by):
+        self.delete('sort_endpoint', '%s:%d' % (youtube_id, sort_by))
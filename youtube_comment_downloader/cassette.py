@@ -0,0 +1,176 @@
+import base64
+import collections
+import gzip
+import io
+import threading
+import urllib.parse
+
+import requests
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+from . import jsonlib
+
+# A cassette holds the HTTP exchanges of a crawl as JSON lines, in the order they happened. Every exchange is
+# compressed on its own (for files ending in .gz or .zst) and appended with a single write, so the file is readable
+# even when a crawl is killed, and the downloaders of a thread pool can record to the same file.
+
+# Response headers worth keeping, the rest only takes space
+RECORDED_HEADERS = ('Content-Type', 'Retry-After')
+
+_write_lock = threading.Lock()
+
+
+class UnrecordedRequestError(LookupError):
+    pass
+
+
+def strip_host(url):
+    return urllib.parse.urlsplit(url)._replace(scheme='', netloc='').geturl()
+
+
+def request_key(method, url, json=None):
+    # Identifies a request regardless of the host (and so of base_url), also in URL parameters such as the continue
+    # URL of the consent form, and regardless of the API key
+    url = urllib.parse.urlsplit(url)
+    query = [(key, strip_host(value) if value.startswith(('http://', 'https://')) else value)
+             for key, value in urllib.parse.parse_qsl(url.query, keep_blank_values=True) if key != 'key']
+    return method, url.path, urllib.parse.urlencode(query), (json or {}).get('continuation')
+
+
+def compress(path, data):
+    lower = path.lower()
+    if lower.endswith('.gz'):
+        return gzip.compress(data, compresslevel=6)
+    if lower.endswith('.zst'):
+        if zstandard is None:
+            raise ImportError('writing .zst files requires zstandard (pip install zstandard)')
+        return zstandard.ZstdCompressor().compress(data)
+    return data
+
+
+def open_cassette(path):
+    # Opens a cassette for reading lines, decompressing all gzip members/zstd frames
+    lower = path.lower()
+    if lower.endswith('.gz'):
+        return gzip.open(path, 'rb')
+    if lower.endswith('.zst'):
+        if zstandard is None:
+            raise ImportError('reading .zst files requires zstandard (pip install zstandard)')
+        reader = zstandard.ZstdDecompressor().stream_reader(io.open(path, 'rb'), read_across_frames=True)
+        return io.BufferedReader(reader)
+    return io.open(path, 'rb')
+
+
+def make_response(exchange):
+    if 'error' in exchange:
+        raise getattr(requests.exceptions, exchange['error'], requests.exceptions.RequestException)(
+            exchange['message'])
+    response = requests.Response()
+    response.status_code = exchange['status']
+    response.url = exchange['response_url']
+    response.headers.update(exchange['headers'])
+    response.encoding = exchange['encoding']
+    if 'body_base64' in exchange:
+        response._content = base64.b64decode(exchange['body_base64'])
+    else:
+        response._content = exchange['body'].encode('utf-8')
+    response._content_consumed = True
+    return response
+
+
+class RecordingSession:
+    # Wraps a requests.Session and appends every exchange made through get/post to a cassette file. Failed requests
+    # (connection errors, timeouts) are recorded too, so that a replay takes the same retries.
+
+    def __init__(self, path, session=None):
+        self.path = path
+        self.session = session or requests.Session()
+
+    def __getattr__(self, name):
+        # headers, cookies, close, ...
+        return getattr(self.session, name)
+
+    def get(self, url, **kwargs):
+        return self.request('GET', url, **kwargs)
+
+    def post(self, url, **kwargs):
+        return self.request('POST', url, **kwargs)
+
+    def request(self, method, url, params=None, json=None, **kwargs):
+        url = requests.Request(method, url, params=params).prepare().url
+        exchange = {'method': method, 'url': url, 'token': (json or {}).get('continuation')}
+        try:
+            response = self.session.request(method, url, json=json, **kwargs)
+            exchange.update(self.response_fields(response))
+        except requests.exceptions.RequestException as e:
+            exchange.update({'error': type(e).__name__, 'message': str(e)})
+            self.write(exchange)
+            raise
+        self.write(exchange)
+        return response
+
+    @staticmethod
+    def response_fields(response):
+        # Reads the whole response, also if it was requested with stream=True
+        fields = {'status': response.status_code, 'response_url': response.url, 'encoding': response.encoding,
+                  'headers': {name: response.headers[name] for name in RECORDED_HEADERS if name in response.headers}}
+        try:
+            fields['body'] = response.content.decode('utf-8')
+        except UnicodeDecodeError:
+            fields['body_base64'] = base64.b64encode(response.content).decode('ascii')
+        return fields
+
+    def write(self, exchange):
+        data = compress(self.path, jsonlib.encode(exchange) + b'\n')
+        with _write_lock, io.open(self.path, 'ab') as fp:
+            fp.write(data)
+
+
+class ReplaySession:
+    # Serves the exchanges of a cassette instead of making requests. Every recorded exchange is served once, to the
+    # first request that matches it (see request_key). The cassette is read as far as needed to find the next
+    # exchange for a request, so a replay in the order of the recording only holds a few exchanges in memory.
+    # A request that is not in the rest of the cassette raises an UnrecordedRequestError.
+
+    def __init__(self, path):
+        self.path = path
+        self.headers = {}
+        self.cookies = requests.cookies.RequestsCookieJar()
+        self.fp = open_cassette(path)
+        self.pending = collections.defaultdict(collections.deque)
+        self.lock = threading.Lock()
+        self.requests = 0
+
+    def get(self, url, **kwargs):
+        return self.request('GET', url, **kwargs)
+
+    def post(self, url, **kwargs):
+        return self.request('POST', url, **kwargs)
+
+    def request(self, method, url, params=None, json=None, **kwargs):
+        url = requests.Request(method, url, params=params).prepare().url
+        key = request_key(method, url, json)
+        with self.lock:
+            self.requests += 1
+            exchange = self.next_exchange(key)
+        if exchange is None:
+            raise UnrecordedRequestError('%s %s (continuation %s) is not in %s' % (method, url, key[3], self.path))
+        return make_response(exchange)
+
+    def next_exchange(self, key):
+        if self.pending[key]:
+            return self.pending[key].popleft()
+        for line in self.fp:
+            exchange = jsonlib.decode(line)
+            exchange_key = request_key(exchange['method'], exchange['url'], {'continuation': exchange['token']})
+            if exchange_key == key:
+                return exchange
+            self.pending[exchange_key].append(exchange)
+        return None
+
+    def close(self):
+        self.fp.close()
@@ -0,0 +1,55 @@
+import json
+import os
+
+from .cache import write_json_atomic
+
+
+class Checkpoint:
+    # Progress of a single video: the ytcfg, the continuations that still need to be fetched and the IDs of the
+    # comments that were yielded so far. The file is rewritten after every page and removed once the video is done.
+
+    def __init__(self, path):
+        self.path = path
+        self.key = None
+        self.ytcfg = None
+        self.continuations = []
+        self.replies = []
+        self.emitted = set()
+
+    def load(self, key):
+        # Returns True if the file holds the progress for the same key (url, sort_by and language)
+        self.key = key
+        self.ytcfg, self.continuations, self.replies, self.emitted = None, [], [], set()
+        try:
+            with open(self.path, encoding='utf-8') as fp:
+                data = json.load(fp)
+        except (OSError, ValueError):
+            return False
+        if data.get('key') != key:
+            return False
+
+        self.ytcfg = data['ytcfg']
+        self.continuations = data['continuations']
+        self.replies = data['replies']
+        self.emitted = set(data['emitted'])
+        return True
+
+    def add(self, cid):
+        # Returns False if the comment was already yielded before
+        if cid in self.emitted:
+            return False
+        self.emitted.add(cid)
+        return True
+
+    def save(self, ytcfg, continuations, replies=()):
+        write_json_atomic(self.path, {'key': self.key,
+                                      'ytcfg': ytcfg,
+                                      'continuations': list(continuations),
+                                      'replies': list(replies),
+                                      'emitted': list(self.emitted)})
+
+    def remove(self):
+        try:
+            os.remove(self.path)
+        except OSError:
+            pass
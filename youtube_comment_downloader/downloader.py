@@ -1,14 +1,28 @@
 from __future__ import print_function
 
+import base64
+import concurrent.futures
+import copy
 import json
 import re
 import time
+import urllib.parse
 
-import dateparser
 import requests
 
+from .cache import BootstrapCache
+from .cassette import RecordingSession, ReplaySession
+from . import jsonlib
+from .checkpoint import Checkpoint
+from .record import Comment
+from .relative_time import parse_relative_time
+from .retry import RetryPolicy, RequestFailedError, GIVE_UP
+from .watermark import Watermark
+
+YOUTUBE_BASE_URL = 'https://www.youtube.com'
 YOUTUBE_VIDEO_URL = 'https://www.youtube.com/watch?v={youtube_id}'
 YOUTUBE_CONSENT_URL = 'https://consent.youtube.com/save'
+YOUTUBE_NEXT_API_URL = '/youtubei/v1/next'
 
 USER_AGENT = 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/79.0.3945.130 Safari/537.36'
 
@@ -17,135 +31,568 @@ SORT_BY_RECENT = 1
 
 YT_CFG_RE = r'ytcfg\.set\s*\(\s*({.+?})\s*\)\s*;'
 YT_INITIAL_DATA_RE = r'(?:window\s*\[\s*["\']ytInitialData["\']\s*\]|ytInitialData)\s*=\s*({.+?})\s*;\s*(?:var\s+meta|</script|\n)'
+# Markers in front of the ytcfg and ytInitialData objects, used when scanning a streamed watch page
+YT_CFG_START_RE = r'ytcfg\.set\s*\(\s*(?={)'
+YT_INITIAL_DATA_START_RE = r'(?:window\s*\[\s*["\']ytInitialData["\']\s*\]|ytInitialData)\s*=\s*(?={)'
 YT_HIDDEN_INPUT_RE = r'<input\s+type="hidden"\s+name="([A-Za-z0-9_]+)"\s+value="([A-Za-z0-9_\-\.]*)"\s*(?:required|)\s*>'
 
+# Keys collected from every continuation response in a single pass (see index_dict)
+RESPONSE_KEYS = frozenset(['externalErrorMessage',
+                           'reloadContinuationItemsCommand',
+                           'appendContinuationItemsAction',
+                           'commentSurfaceEntityPayload',
+                           'engagementToolbarStateEntityPayload',
+                           'commentEntityPayload',
+                           'commentViewModel'])
+
+WATCH_PAGE_CHUNK_SIZE = 16384
+
+
+def site_urls(base_url=None):
+    # Returns the base, video and consent URLs. A stand-in for Youtube serves the consent form itself, at /save.
+    if not base_url:
+        return YOUTUBE_BASE_URL, YOUTUBE_VIDEO_URL, YOUTUBE_CONSENT_URL
+    base_url = base_url.rstrip('/')
+    return base_url, base_url + '/watch?v={youtube_id}', base_url + '/save'
+
+
+class CommentsDisabledError(RuntimeError):
+    # Raised when the watch page has no comment section, so that callers can tell a video without comments apart
+    # from a download that failed
+    pass
+
 
 class YoutubeCommentDownloader:
 
-    def __init__(self):
+    def __init__(self, stream_bootstrap=True, synthesize_continuations=False, cache=None, rate_limiter=None,
+                 retry_policy=None, compact=False, base_url=None, cassette=None, replay=False):
+        self.stream_bootstrap = stream_bootstrap
+        # Requests go to base_url instead of Youtube if given, e.g. to a local stand-in server (see server.py)
+        self.base_url, self.video_url, self.consent_url = site_urls(base_url)
+        # Yield Comment objects instead of dicts, which take a fraction of the memory when comments are kept around
+        self.record = Comment if compact else dict
+        self.retry_policy = retry_policy or RetryPolicy()
+        # An optional RateLimiter, possibly shared with other downloaders
+        self.rate_limiter = rate_limiter
+        # A time.time() by which the current download has to end (see pool.iter_comments). Requests time out at the
+        # deadline at the latest, and none is sent after it.
+        self.deadline = None
+        self.synthesize_continuations = synthesize_continuations
+        self.ytcfg = None
+        # Either a BootstrapCache or the path of its directory
+        self.cache = BootstrapCache(cache) if isinstance(cache, str) else cache
         self.session = requests.Session()
+        # Record every exchange to the cassette file at this path, or with replay=True, serve the recorded exchanges
+        # instead of touching the network. Replays do not sleep between pages or before retries.
+        self.replay = bool(cassette and replay)
+        if self.replay:
+            self.session = ReplaySession(cassette)
+            self.retry_policy = self.retry_policy.replace(max_backoff=0, max_retry_after=0)
+        elif cassette:
+            self.session = RecordingSession(cassette, self.session)
         self.session.headers['User-Agent'] = USER_AGENT
         self.session.cookies.set('CONSENT', 'YES+cb', domain='.youtube.com')
+        if self.cache:
+            self.cache.get_cookies(self.session.cookies)
+
+    def request_timeout(self, timeout=None):
+        # The timeout of a request (by default that of the retry policy), shortened so that it ends at the deadline
+        timeout = timeout or self.retry_policy.timeout
+        if self.deadline is None:
+            return timeout
+        remaining = self.deadline - time.time()
+        if remaining <= 0:
+            raise TimeoutError('Download deadline passed')
+        return min(timeout, remaining) if timeout else remaining
+
+    def limited_request(self, request, *args, **kwargs):
+        # Waits for the rate limiter (if any) and tells it how the request went
+        kwargs['timeout'] = self.request_timeout(kwargs.get('timeout'))
+        if self.rate_limiter is None:
+            return request(*args, **kwargs)
 
-    def ajax_request(self, endpoint, ytcfg, retries=5, sleep=20, timeout=60):
-        url = 'https://www.youtube.com' + endpoint['commandMetadata']['webCommandMetadata']['apiUrl']
+        self.rate_limiter.acquire()
+        start_time = time.time()
+        status_code = None
+        try:
+            response = request(*args, **kwargs)
+            status_code = response.status_code
+            return response
+        finally:
+            self.rate_limiter.feedback(status_code, time.time() - start_time)
+
+    def ajax_request(self, endpoint, ytcfg, retries=None, sleep=None, timeout=None):
+        # retries, sleep (the initial backoff) and timeout override the corresponding settings of the retry policy
+        policy = self.retry_policy.replace(retries=retries, backoff=sleep, timeout=timeout)
+        url = self.base_url + endpoint['commandMetadata']['webCommandMetadata']['apiUrl']
 
         data = {'context': ytcfg['INNERTUBE_CONTEXT'],
                 'continuation': endpoint['continuationCommand']['token']}
 
-        for _ in range(retries):
+        start_time = time.time()
+        for attempt in range(max(1, policy.retries)):
+            status_code, retry_after, error = None, None, None
             try:
-                response = self.session.post(url, params={'key': ytcfg['INNERTUBE_API_KEY']}, json=data, timeout=timeout)
-                if response.status_code == 200:
-                    return response.json()
-                if response.status_code in [403, 413]:
-                    return {}
-            except requests.exceptions.Timeout:
-                pass
-            time.sleep(sleep)
+                response = self.limited_request(self.session.post, url, params={'key': ytcfg['INNERTUBE_API_KEY']},
+                                                json=data, timeout=policy.attempt_timeout(start_time))
+                status_code = response.status_code
+                retry_after = response.headers.get('Retry-After')
+                if status_code == 200:
+                    return jsonlib.decode(response.content)
+            except (requests.exceptions.RequestException, ValueError) as e:
+                error = e
+
+            if policy.classify(status_code, error) == GIVE_UP:
+                return {}
+            delay = policy.backoff_time(attempt, start_time, retry_after)
+            if delay is None:
+                break
+            if self.deadline is not None:
+                # The next attempt fails right away if the deadline passes in the meantime
+                delay = min(delay, max(0, self.deadline - time.time()))
+            time.sleep(delay)
+
+        raise RequestFailedError('Request to {} failed after {} attempt(s) ({})'.format(
+            url, attempt + 1, error or 'HTTP {}'.format(status_code)), status_code, attempt + 1)
 
     def get_comments(self, youtube_id, *args, **kwargs):
-        return self.get_comments_from_url(YOUTUBE_VIDEO_URL.format(youtube_id=youtube_id), *args, **kwargs)
+        return self.get_comments_from_url(self.video_url.format(youtube_id=youtube_id), *args, **kwargs)
 
-    def get_comments_from_url(self, youtube_url, sort_by=SORT_BY_RECENT, language=None, sleep=.1):
-        response = self.session.get(youtube_url)
+    def get_comments_from_url(self, youtube_url, sort_by=SORT_BY_RECENT, language=None, sleep=.1, reply_concurrency=0,
+                              checkpoint=None, watermark=None, since=None):
+        # If a checkpoint (a Checkpoint or the path of its file) is given, the progress is saved after every page. A
+        # later call for the same video resumes from there and only yields the comments that weren't yielded yet.
+        # If a watermark (a Watermark or the path of its file) or a since timestamp is given, only the comments that
+        # are newer than the last complete crawl or than since are yielded, and no further pages are fetched.
+        sleep = 0 if self.replay else sleep
+        checkpoint = Checkpoint(checkpoint) if isinstance(checkpoint, str) else checkpoint
+        watermark = Watermark(watermark) if isinstance(watermark, str) else watermark
+        if since is not None:
+            watermark = watermark or Watermark()
+            watermark.since = since
+        if watermark:
+            if sort_by != SORT_BY_RECENT:
+                raise ValueError('A watermark or since cutoff requires sorting by recent comments')
+            watermark.load()
 
-        if 'consent' in str(response.url):
-            # We may get redirected to a separate page for cookie consent. If this happens we agree automatically.
-            params = dict(re.findall(YT_HIDDEN_INPUT_RE, response.text))
-            params.update({'continue': youtube_url, 'set_eom': False, 'set_ytc': True, 'set_apyt': True})
-            response = self.session.post(YOUTUBE_CONSENT_URL, params=params)
+        ytcfg, continuations, replies, index = None, None, [], None
+        if checkpoint and checkpoint.load([youtube_url, sort_by, language]):
+            ytcfg, continuations, replies = checkpoint.ytcfg, checkpoint.continuations, checkpoint.replies
+
+        if not ytcfg and self.cache:
+            ytcfg, continuations, index = self.start_from_cache(youtube_url, sort_by, language)
+
+        if not ytcfg and self.synthesize_continuations:
+            ytcfg, continuations, index = self.start_from_synthesized_continuation(youtube_url, sort_by, language)
+
+        if not ytcfg:
+            ytcfg, continuations = self.start_from_watch_page(youtube_url, sort_by, language)
+            if not ytcfg:
+                return
+
+        if reply_concurrency:
+            comments = self.get_comments_concurrently(continuations, ytcfg, sleep, reply_concurrency, index, replies,
+                                                      checkpoint, watermark)
+        else:
+            comments = self.get_comments_sequentially(continuations + replies, ytcfg, sleep, index, checkpoint,
+                                                      watermark)
+        try:
+            for comment in comments:
+                yield comment
+        finally:
+            # Make sure the checkpoint is saved right away when the caller stops early
+            comments.close()
+
+    def get_comments_sequentially(self, continuations, ytcfg, sleep, index=None, checkpoint=None, watermark=None):
+        # If index is given, it is the (already fetched) response for the last continuation
+        stack, finished, complete = list(continuations), False, True
+        try:
+            while continuations:
+                continuation = continuations.pop()
+                if index is None:
+                    response = self.ajax_request(continuation, ytcfg)
+
+                    if not response:
+                        complete = False
+                        break
 
-        html = response.text
-        ytcfg = json.loads(self.regex_search(html, YT_CFG_RE, default=''))
+                    index = self.index_response(response)
+
+                self.raise_for_error(index)
+                comments, until = self.parse_comments(index, ytcfg['INNERTUBE_CONTEXT']['client'].get('hl'),
+                                                      self.record), None
+                if watermark:
+                    comments, until = watermark.filter(comments)
+                self.queue_continuations(index, continuations, until=until)
+                for comment in comments:
+                    if checkpoint is None or checkpoint.add(comment['cid']):
+                        yield comment
+                index = None
+
+                stack = list(continuations)
+                if checkpoint:
+                    checkpoint.save(ytcfg, stack)
+                time.sleep(sleep)
+            finished = True
+        finally:
+            if watermark and finished and complete:
+                watermark.save()
+            if checkpoint and finished:
+                checkpoint.remove()
+            elif checkpoint:
+                # When interrupted halfway through a page, that page is fetched again on resume
+                checkpoint.save(ytcfg, stack)
+
+    def start_from_watch_page(self, youtube_url, sort_by, language):
+        ytcfg, data = self.fetch_watch_page(youtube_url)
         if not ytcfg:
-            return  # Unable to extract configuration
+            return None, None  # Unable to extract configuration
+
+        # Keep the configuration around, so that later videos can skip the watch page
+        self.ytcfg = copy.deepcopy(ytcfg)
         if language:
             ytcfg['INNERTUBE_CONTEXT']['client']['hl'] = language
+        if self.cache:
+            self.cache.set_cookies(self.session.cookies)
+            self.cache.set_ytcfg(ytcfg, language)
 
-        data = json.loads(self.regex_search(html, YT_INITIAL_DATA_RE, default=''))
-
-        item_section = next(self.search_dict(data, 'itemSectionRenderer'), None)
-        renderer = next(self.search_dict(item_section, 'continuationItemRenderer'), None) if item_section else None
-        if not renderer:
-            # Comments disabled?
-            return
+        if not self.has_comments(data):
+            raise CommentsDisabledError('Comments are disabled for ' + youtube_url)
 
-        sort_menu = next(self.search_dict(data, 'sortFilterSubMenuRenderer'), {}).get('subMenuItems', [])
+        sort_menu = self.sort_menu(data)
         if not sort_menu:
             # No sort menu. Maybe this is a request for community posts?
             section_list = next(self.search_dict(data, 'sectionListRenderer'), {})
             continuations = list(self.search_dict(section_list, 'continuationEndpoint'))
             # Retry..
             data = self.ajax_request(continuations[0], ytcfg) if continuations else {}
-            sort_menu = next(self.search_dict(data, 'sortFilterSubMenuRenderer'), {}).get('subMenuItems', [])
+            sort_menu = self.sort_menu(data)
         if not sort_menu or sort_by >= len(sort_menu):
             raise RuntimeError('Failed to set sorting')
-        continuations = [sort_menu[sort_by]['serviceEndpoint']]
 
-        while continuations:
-            continuation = continuations.pop()
-            response = self.ajax_request(continuation, ytcfg)
+        youtube_id = self.extract_video_id(youtube_url)
+        if self.cache and youtube_id:
+            for sort_index, sort_item in enumerate(sort_menu):
+                self.cache.set_sort_endpoint(youtube_id, sort_index, sort_item['serviceEndpoint'])
+        return ytcfg, [sort_menu[sort_by]['serviceEndpoint']]
 
-            if not response:
-                break
+    def start_from_cache(self, youtube_url, sort_by, language):
+        # Re-crawls start with the sort endpoint and ytcfg that were cached when the watch page was last fetched
+        youtube_id = self.extract_video_id(youtube_url)
+        ytcfg = self.cache.get_ytcfg(language)
+        endpoint = self.cache.get_sort_endpoint(youtube_id, sort_by) if youtube_id else None
+        if not ytcfg or not endpoint:
+            return None, None, None
+
+        index = self.first_comment_page(endpoint, ytcfg)
+        if index is None:
+            self.cache.delete_sort_endpoint(youtube_id, sort_by)
+            return None, None, None
+        return ytcfg, [endpoint], index
+
+    def start_from_synthesized_continuation(self, youtube_url, sort_by, language):
+        # Instead of fetching the watch page, build the continuation of the comment section ourselves and send it
+        # along with the ytcfg of an earlier video. If the server doesn't return any comment section actions, the
+        # caller falls back to the watch page.
+        youtube_id = self.extract_video_id(youtube_url)
+        ytcfg = self.ytcfg or (self.cache.get_ytcfg(language) if self.cache else None)
+        if not youtube_id or not ytcfg:
+            return None, None, None
+
+        ytcfg = copy.deepcopy(ytcfg)
+        if language:
+            ytcfg['INNERTUBE_CONTEXT']['client']['hl'] = language
+
+        endpoint = self.comments_continuation(youtube_id, sort_by)
+        index = self.first_comment_page(endpoint, ytcfg)
+        if index is None:
+            return None, None, None
+        return ytcfg, [endpoint], index
+
+    def first_comment_page(self, endpoint, ytcfg):
+        # Returns the index of the first comment page, or None if the response has no comment section actions
+        response = self.ajax_request(endpoint, ytcfg)
+        index = self.index_response(response) if response else None
+        if not index or index['externalErrorMessage'] or \
+                not (index['reloadContinuationItemsCommand'] or index['appendContinuationItemsAction']):
+            return None
+        return index
+
+    def get_comments_concurrently(self, continuations, ytcfg, sleep, reply_concurrency, index=None, replies=None,
+                                  checkpoint=None, watermark=None):
+        # The top-level page chain is fetched in this thread, while reply threads are expanded in the background
+        # by up to reply_concurrency workers. Comments are yielded as soon as their page arrives, so replies are not
+        # necessarily emitted right after their parent comment.
+        replies = list(replies or [])
+        pending = {}  # future -> continuation
+        pages = []  # (continuation, index) tuples that still need to be yielded
+        stack, finished, complete = None, False, True
+        executor = concurrent.futures.ThreadPoolExecutor(reply_concurrency)
+        try:
+            while continuations or replies or pending:
+                while replies and len(pending) < reply_concurrency:
+                    continuation = replies.pop(0)
+                    pending[executor.submit(self.ajax_request, continuation, ytcfg)] = continuation
+
+                if continuations:
+                    continuation = continuations.pop()
+                    if index is None:
+                        response = self.ajax_request(continuation, ytcfg)
+                        index = self.index_response(response) if response else None
+                    if index is not None:
+                        pages.append((continuation, index))
+                    else:
+                        del continuations[:]
+                        complete = False
+                    index = None
+                    done = [future for future in pending if future.done()]
+                else:
+                    done, _ = concurrent.futures.wait(pending, return_when=concurrent.futures.FIRST_COMPLETED)
+
+                for future in done:
+                    if future.result():
+                        pages.append((pending[future], self.index_response(future.result())))
+                    else:
+                        complete = False
+                    del pending[future]
+
+                yielded = bool(pages)
+                while pages:
+                    continuation, page = pages[0]
+                    stack = (list(continuations), replies + [continuation])
+                    self.raise_for_error(page)
+                    comments, until = self.parse_comments(page, ytcfg['INNERTUBE_CONTEXT']['client'].get('hl'),
+                                                          self.record), None
+                    if watermark:
+                        comments, until = watermark.filter(comments)
+                    self.queue_continuations(page, continuations, replies, until)
+                    for comment in comments:
+                        if checkpoint is None or checkpoint.add(comment['cid']):
+                            yield comment
+                    pages.pop(0)
+                    stack = None
+
+                if checkpoint and yielded:
+                    checkpoint.save(ytcfg, continuations, replies + list(pending.values()))
+                if yielded and continuations:
+                    time.sleep(sleep)
+            finished = True
+        finally:
+            executor.shutdown(wait=False, cancel_futures=True)
+            if watermark and finished and complete:
+                watermark.save()
+            if checkpoint:
+                if finished:
+                    checkpoint.remove()
+                else:
+                    # Everything that was fetched but not yielded yet is fetched again on resume
+                    midway = stack is not None
+                    continuations, replies = stack if midway else (continuations, replies)
+                    unfinished = [continuation for continuation, _ in pages[1 if midway else 0:]]
+                    checkpoint.save(ytcfg, continuations, replies + list(pending.values()) + unfinished)
+
+    def fetch_watch_page(self, youtube_url, language=None):
+        response = self.limited_request(self.session.get, youtube_url, stream=self.stream_bootstrap)
+
+        if 'consent' in str(response.url):
+            # We may get redirected to a separate page for cookie consent. If this happens we agree automatically.
+            params = self.consent_params(response.text, youtube_url)
+            response = self.limited_request(self.session.post, self.consent_url, params=params,
+                                            stream=self.stream_bootstrap)
+
+        if not self.stream_bootstrap:
+            return self.parse_watch_page(response.text, language)
+
+        try:
+            response.encoding = response.encoding or 'utf-8'
+            chunks = response.iter_content(WATCH_PAGE_CHUNK_SIZE, decode_unicode=True)
+            return self.parse_watch_page_stream(chunks, language)
+        finally:
+            # Once both objects have been found, the rest of the page is not downloaded
+            response.close()
+
+    @staticmethod
+    def extract_video_id(youtube_url):
+        url = urllib.parse.urlparse(youtube_url)
+        if url.hostname == 'youtu.be':
+            return url.path.strip('/') or None
+        query = urllib.parse.parse_qs(url.query)
+        if query.get('v'):
+            return query['v'][0]
+        match = re.match(r'/(?:shorts|embed|live)/([A-Za-z0-9_-]+)', url.path)
+        return match.group(1) if match else None
+
+    @staticmethod
+    def comments_continuation(youtube_id, sort_by=SORT_BY_RECENT):
+        # The token is a base64 encoded protobuf message:
+        # {2: {2: video_id}, 3: 6, 6: {4: {4: video_id, 6: sort_by, 15: 2}, 8: 'comments-section'}}
+        def varint(value):
+            result = bytearray()
+            while value > 0x7f:
+                result.append(value & 0x7f | 0x80)
+                value >>= 7
+            result.append(value)
+            return bytes(result)
+
+        def field(number, value):
+            if isinstance(value, int):
+                return varint(number << 3) + varint(value)
+            value = value.encode('utf-8') if isinstance(value, str) else value
+            return varint(number << 3 | 2) + varint(len(value)) + value
+
+        options = field(4, youtube_id) + field(6, sort_by) + field(15, 2)
+        message = field(2, field(2, youtube_id)) + field(3, 6) + \
+            field(6, field(4, options) + field(8, 'comments-section'))
+        token = base64.urlsafe_b64encode(message).decode('ascii').replace('=', '%3D')
+        return {'commandMetadata': {'webCommandMetadata': {'apiUrl': YOUTUBE_NEXT_API_URL}},
+                'continuationCommand': {'token': token}}
+
+    @staticmethod
+    def consent_params(html, youtube_url):
+        params = dict(re.findall(YT_HIDDEN_INPUT_RE, html))
+        params.update({'continue': youtube_url, 'set_eom': False, 'set_ytc': True, 'set_apyt': True})
+        return params
+
+    @classmethod
+    def parse_watch_page(cls, html, language=None):
+        ytcfg = jsonlib.decode(cls.regex_search(html, YT_CFG_RE, default=''))
+        if not ytcfg:
+            return None, None
+        if language:
+            ytcfg['INNERTUBE_CONTEXT']['client']['hl'] = language
+
+        data = jsonlib.decode(cls.regex_search(html, YT_INITIAL_DATA_RE, default=''))
+        return ytcfg, data
 
-            error = next(self.search_dict(response, 'externalErrorMessage'), None)
-            if error:
-                raise RuntimeError('Error returned from server: ' + error)
-
-            actions = list(self.search_dict(response, 'reloadContinuationItemsCommand')) + \
-                      list(self.search_dict(response, 'appendContinuationItemsAction'))
-            for action in actions:
-                for item in action.get('continuationItems', []):
-                    if action['targetId'] in ['comments-section',
-                                              'engagement-panel-comments-section',
-                                              'shorts-engagement-panel-comments-section']:
-                        # Process continuations for comments and replies.
-                        continuations[:0] = [ep for ep in self.search_dict(item, 'continuationEndpoint')]
-                    if action['targetId'].startswith('comment-replies-item') and 'continuationItemRenderer' in item:
-                        # Process the 'Show more replies' button
-                        continuations.append(next(self.search_dict(item, 'buttonRenderer'))['command'])
-
-            surface_payloads = self.search_dict(response, 'commentSurfaceEntityPayload')
-            payments = {payload['key']: next(self.search_dict(payload, 'simpleText'), '')
-                        for payload in surface_payloads if 'pdgCommentChip' in payload}
-            if payments:
-                # We need to map the payload keys to the comment IDs.
-                view_models = [vm['commentViewModel'] for vm in self.search_dict(response, 'commentViewModel')]
-                surface_keys = {vm['commentSurfaceKey']: vm['commentId']
-                                for vm in view_models if 'commentSurfaceKey' in vm}
-                payments = {surface_keys[key]: payment for key, payment in payments.items() if key in surface_keys}
-
-            toolbar_payloads = self.search_dict(response, 'engagementToolbarStateEntityPayload')
-            toolbar_states = {payload['key']: payload for payload in toolbar_payloads}
-            for comment in reversed(list(self.search_dict(response, 'commentEntityPayload'))):
-                properties = comment['properties']
-                cid = properties['commentId']
-                author = comment['author']
-                toolbar = comment['toolbar']
-                toolbar_state = toolbar_states[properties['toolbarStateKey']]
-                result = {'cid': cid,
-                          'text': properties['content']['content'],
-                          'time': properties['publishedTime'],
-                          'author': author['displayName'],
-                          'channel': author['channelId'],
-                          'votes': toolbar['likeCountNotliked'].strip() or "0",
-                          'replies': toolbar['replyCount'],
-                          'photo': author['avatarThumbnailUrl'],
-                          'heart': toolbar_state.get('heartState', '') == 'TOOLBAR_HEART_STATE_HEARTED',
-                          'reply': '.' in cid}
+    @classmethod
+    def parse_watch_page_stream(cls, chunks, language=None):
+        # Looks for ytcfg and ytInitialData while the page is coming in. Both objects sit inside a <script> element,
+        # so once a closing tag shows up after a marker, the object is decoded in one go with raw_decode.
+        # If anything unexpected happens, the whole page is read and handed to parse_watch_page.
+        decoder = json.JSONDecoder()
+        markers = {'ytcfg': YT_CFG_START_RE, 'data': YT_INITIAL_DATA_START_RE}
+        starts, scan_from, found = {}, {'ytcfg': 0, 'data': 0}, {}
+        failed = False
 
+        html = ''
+        for chunk in chunks:
+            html += chunk
+            for name, pattern in markers.items():
+                if name in found:
+                    continue
+                if name not in starts:
+                    match = re.compile(pattern).search(html, scan_from[name])
+                    if not match:
+                        # Markers may be split across chunks
+                        scan_from[name] = max(len(html) - 64, 0)
+                        continue
+                    starts[name] = scan_from[name] = match.end()
+
+                end = html.find('</script', scan_from[name])
+                if end < 0:
+                    scan_from[name] = max(len(html) - 8, starts[name])
+                    continue
                 try:
-                    result['time_parsed'] = dateparser.parse(result['time'].split('(')[0].strip()).timestamp()
-                except AttributeError:
-                    pass
+                    found[name] = decoder.raw_decode(html, starts[name])[0]
+                except ValueError:
+                    found[name] = None
+                    failed = True
+
+            if len(found) == len(markers) and not failed:
+                break
+
+        if failed or len(found) < len(markers):
+            return cls.parse_watch_page(html, language)
+
+        ytcfg, data = found['ytcfg'], found['data']
+        if language:
+            ytcfg['INNERTUBE_CONTEXT']['client']['hl'] = language
+        return ytcfg, data
+
+    @classmethod
+    def has_comments(cls, data):
+        item_section = next(cls.search_dict(data, 'itemSectionRenderer'), None)
+        renderer = next(cls.search_dict(item_section, 'continuationItemRenderer'), None) if item_section else None
+        return bool(renderer)
+
+    @classmethod
+    def sort_menu(cls, data):
+        return next(cls.search_dict(data, 'sortFilterSubMenuRenderer'), {}).get('subMenuItems', [])
+
+    @classmethod
+    def index_response(cls, response):
+        return cls.index_dict(response, RESPONSE_KEYS)
+
+    @staticmethod
+    def raise_for_error(index):
+        error = next(iter(index['externalErrorMessage']), None)
+        if error:
+            raise RuntimeError('Error returned from server: ' + error)
+
+    @classmethod
+    def queue_continuations(cls, index, continuations, replies=None, until=None):
+        # If a separate replies list is given, reply continuations are added to it instead of to continuations.
+        # If until is given (the ID of a top-level comment), nothing is queued for that comment thread and the items
+        # after it, and the next page is not queued at all.
+        replies = continuations if replies is None else replies
+        actions = index['reloadContinuationItemsCommand'] + index['appendContinuationItemsAction']
+        stopped = False
+        for action in actions:
+            for item in action.get('continuationItems', []):
+                if action['targetId'] in ['comments-section',
+                                          'engagement-panel-comments-section',
+                                          'shorts-engagement-panel-comments-section']:
+                    if until is not None:
+                        stopped = stopped or 'commentThreadRenderer' not in item or \
+                            next(cls.search_dict(item, 'commentId'), None) == until
+                        if stopped:
+                            continue
+                    # Process continuations for comments and replies.
+                    queue = replies if 'commentThreadRenderer' in item else continuations
+                    queue[:0] = [ep for ep in cls.search_dict(item, 'continuationEndpoint')]
+                if action['targetId'].startswith('comment-replies-item') and 'continuationItemRenderer' in item:
+                    # Process the 'Show more replies' button
+                    replies.append(next(cls.search_dict(item, 'buttonRenderer'))['command'])
+
+    @classmethod
+    def parse_comments(cls, index, language=None, record=dict):
+        surface_payloads = index['commentSurfaceEntityPayload']
+        payments = {payload['key']: next(cls.search_dict(payload, 'simpleText'), '')
+                    for payload in surface_payloads if 'pdgCommentChip' in payload}
+        if payments:
+            # We need to map the payload keys to the comment IDs.
+            view_models = [vm['commentViewModel'] for vm in index['commentViewModel']]
+            surface_keys = {vm['commentSurfaceKey']: vm['commentId']
+                            for vm in view_models if 'commentSurfaceKey' in vm}
+            payments = {surface_keys[key]: payment for key, payment in payments.items() if key in surface_keys}
+
+        toolbar_payloads = index['engagementToolbarStateEntityPayload']
+        toolbar_states = {payload['key']: payload for payload in toolbar_payloads}
+        for comment in reversed(index['commentEntityPayload']):
+            properties = comment['properties']
+            cid = properties['commentId']
+            author = comment['author']
+            toolbar = comment['toolbar']
+            toolbar_state = toolbar_states[properties['toolbarStateKey']]
+            result = {'cid': cid,
+                      'text': properties['content']['content'],
+                      'time': properties['publishedTime'],
+                      'author': author['displayName'],
+                      'channel': author['channelId'],
+                      'votes': toolbar['likeCountNotliked'].strip() or "0",
+                      'replies': toolbar['replyCount'],
+                      'photo': author['avatarThumbnailUrl'],
+                      'heart': toolbar_state.get('heartState', '') == 'TOOLBAR_HEART_STATE_HEARTED',
+                      'reply': '.' in cid}
+
+            time_parsed = parse_relative_time(result['time'].split('(')[0].strip(), language)
+            if time_parsed is not None:
+                result['time_parsed'] = time_parsed
 
-                if cid in payments:
-                    result['paid'] = payments[cid]
+            if cid in payments:
+                result['paid'] = payments[cid]
 
-                yield result
-            time.sleep(sleep)
+            yield result if record is dict else record(**result)
 
     @staticmethod
     def regex_search(text, pattern, group=1, default=None):
@@ -165,3 +612,27 @@ class YoutubeCommentDownloader:
                         stack.append(value)
             elif isinstance(current_item, list):
                 stack.extend(current_item)
+
+    @staticmethod
+    def index_dict(partial, search_keys, index=None):
+        # Same as calling search_dict once for every key in search_keys, but with a single traversal.
+        # Returns a dict with a list of values per key, ordered like search_dict would yield them.
+        index = {key: [] for key in search_keys} if index is None else index
+        stack = [partial]
+        while stack:
+            current_item = stack.pop()
+            if isinstance(current_item, dict):
+                for key, value in current_item.items():
+                    if key in search_keys:
+                        index[key].append(value)
+                        # Other keys may be nested inside this value. JSON never contains tuples, so a tuple on
+                        # the stack marks a subtree that is searched for the remaining keys only.
+                        stack.append((value, key))
+                    else:
+                        stack.append(value)
+            elif isinstance(current_item, list):
+                stack.extend(current_item)
+            elif isinstance(current_item, tuple):
+                value, found_key = current_item
+                YoutubeCommentDownloader.index_dict(value, search_keys - {found_key}, index)
+        return index
@@ -0,0 +1,45 @@
+import json
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+from .record import json_default
+
+# The JSON backend used to decode responses and to encode comments. orjson is used when it is installed, otherwise the
+# json module. Both decode from bytes and encode to UTF-8 bytes, so the output can be written without decoding it.
+# The output of the backends only differs in whitespace: orjson writes no spaces after separators.
+
+
+def _json_encode(obj, indent=None):
+    return json.dumps(obj, ensure_ascii=False, indent=indent, default=json_default).encode('utf-8')
+
+
+def _orjson_encode(obj, indent=None):
+    if indent is None:
+        return orjson.dumps(obj, default=json_default)
+    if indent == 2:
+        return orjson.dumps(obj, default=json_default, option=orjson.OPT_INDENT_2)
+    # orjson only indents by 2 spaces
+    return _json_encode(obj, indent)
+
+
+BACKENDS = {'json': (_json_encode, json.loads)}
+if orjson is not None:
+    BACKENDS['orjson'] = (_orjson_encode, orjson.loads)
+
+backend = encode = decode = None
+
+
+def use_backend(name=None):
+    # Switches the backend ('json' or 'orjson'), by default to the fastest one that is installed
+    global backend, encode, decode
+    name = name or ('orjson' if 'orjson' in BACKENDS else 'json')
+    if name not in BACKENDS:
+        raise ValueError('JSON backend %s is not available' % name)
+    backend = name
+    encode, decode = BACKENDS[name]
+
+
+use_backend()
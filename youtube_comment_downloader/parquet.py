@@ -0,0 +1,99 @@
+import datetime
+import os
+import time
+import urllib.parse
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = pq = None
+
+from .writers import parse_count
+
+
+def comment_schema():
+    # Typed columns for the comments yielded by YoutubeCommentDownloader. Strings that repeat a lot are dictionary
+    # encoded, so they are stored (and loaded) once per row group.
+    text = pa.dictionary(pa.int32(), pa.string())
+    return pa.schema([('video_id', text),
+                      ('cid', pa.string()),
+                      ('text', pa.string()),
+                      ('time', pa.string()),
+                      ('author', text),
+                      ('channel', text),
+                      ('votes', pa.int64()),
+                      ('replies', pa.int64()),
+                      ('photo', text),
+                      ('heart', pa.bool_()),
+                      ('reply', pa.bool_()),
+                      ('time_parsed', pa.float64()),
+                      ('paid', pa.string())])
+
+
+class ParquetDatasetWriter:
+    # Writes comments to a Parquet dataset that is partitioned by keyword and crawl date (hive style, e.g.
+    # root/keyword=cats/crawl_date=2024-05-01/part-1714521600.parquet). Every call to write adds a row group to the
+    # file of its partition, so videos can be written as soon as they finish. The dataset can be read with
+    # pyarrow.dataset.dataset(root, partitioning='hive') or pandas.read_parquet(root, columns=[...]).
+
+    def __init__(self, root, crawl_date=None, compression='zstd'):
+        if pa is None:
+            raise ImportError('ParquetDatasetWriter requires pyarrow (pip install pyarrow)')
+        self.root = root
+        self.crawl_date = crawl_date or datetime.date.today().isoformat()
+        self.compression = compression
+        self.schema = comment_schema()
+        # Every run writes new files, so earlier runs of the same day are kept
+        self.basename = 'part-%d.parquet' % int(time.time() * 1000)
+        self.writers = {}
+        self.count = 0
+
+    def partition_path(self, keyword):
+        keyword = urllib.parse.quote(keyword or '', safe='')
+        return os.path.join(self.root, 'keyword=' + keyword, 'crawl_date=' + self.crawl_date)
+
+    def write(self, comments, keyword='', video_id=None):
+        # comments are dicts as yielded by YoutubeCommentDownloader. Returns the number of rows written.
+        columns = {name: [] for name in self.schema.names}
+        for comment in comments:
+            cid = comment.get('cid', '')
+            time_parsed = comment.get('time_parsed')
+            columns['video_id'].append(comment.get('video_id', video_id))
+            columns['cid'].append(cid)
+            columns['text'].append(comment.get('text'))
+            columns['time'].append(comment.get('time'))
+            columns['author'].append(comment.get('author'))
+            columns['channel'].append(comment.get('channel'))
+            columns['votes'].append(parse_count(comment.get('votes')))
+            columns['replies'].append(parse_count(comment.get('replies')))
+            columns['photo'].append(comment.get('photo'))
+            columns['heart'].append(bool(comment.get('heart', False)))
+            columns['reply'].append(bool(comment.get('reply', '.' in cid)))
+            columns['time_parsed'].append(float(time_parsed) if time_parsed not in (None, '') else None)
+            columns['paid'].append(comment.get('paid'))
+        if not columns['cid']:
+            return 0
+
+        table = pa.Table.from_pydict(columns, schema=self.schema)
+        writer = self.writers.get(keyword)
+        if writer is None:
+            directory = self.partition_path(keyword)
+            os.makedirs(directory, exist_ok=True)
+            writer = self.writers[keyword] = pq.ParquetWriter(os.path.join(directory, self.basename), self.schema,
+                                                              compression=self.compression)
+        writer.write_table(table)
+        self.count += table.num_rows
+        return table.num_rows
+
+    def close(self):
+        # The footer of a Parquet file is written on close, so the files can only be read after this
+        for writer in self.writers.values():
+            writer.close()
+        self.writers = {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
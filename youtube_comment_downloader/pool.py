@@ -0,0 +1,131 @@
+import concurrent.futures
+import multiprocessing
+import os
+import sys
+import threading
+import time
+
+from .downloader import YoutubeCommentDownloader, SORT_BY_RECENT
+from .retry import RequestFailedError
+
+_local = threading.local()
+
+
+def _get_downloader(max_tasks=None, downloader_kwargs=None):
+    # Every worker (thread or process) keeps its own downloader, so the requests.Session, its TLS connections
+    # and the consent cookie are reused across videos. After max_tasks videos the downloader is replaced.
+    downloader_kwargs = downloader_kwargs or {}
+    downloader = getattr(_local, 'downloader', None)
+    if downloader is None or (max_tasks and _local.tasks >= max_tasks) or _local.kwargs != downloader_kwargs:
+        if downloader is not None:
+            downloader.session.close()
+        downloader = _local.downloader = YoutubeCommentDownloader(**downloader_kwargs)
+        downloader.rate_limiter = getattr(_local, 'rate_limiter', None)
+        _local.kwargs = downloader_kwargs
+        _local.tasks = 0
+    _local.tasks += 1
+    return downloader
+
+
+def iter_comments(youtube_id, sort_by=SORT_BY_RECENT, language=None, limit=None, timeout=None, max_tasks=None,
+                  downloader_kwargs=None, watermark=None, since=None):
+    # Yields the comments of a video as they arrive, using the downloader of the current worker
+    downloader = _get_downloader(max_tasks, downloader_kwargs)
+    deadline = time.time() + timeout if timeout else None
+
+    count = 0
+    # With a rate limiter the pace is set by the limiter instead of a fixed sleep between pages
+    sleep = 0 if downloader.rate_limiter else .1
+    generator = downloader.get_comments(youtube_id, sort_by, language, sleep, watermark=watermark, since=since)
+    # Also cuts short a request that is still running at the deadline. The downloader is shared by the videos of the
+    # worker, so the deadline is cleared again afterwards.
+    downloader.deadline = deadline
+    try:
+        for comment in generator:
+            yield comment
+            count += 1
+            if limit and count >= limit:
+                break
+            if deadline and time.time() > deadline:
+                raise TimeoutError('Timed out after %d comment(s)' % count)
+    finally:
+        generator.close()
+        downloader.deadline = None
+
+
+def download_comments(*args, **kwargs):
+    return list(iter_comments(*args, **kwargs))
+
+
+def _init_worker(rate_limiter):
+    _local.rate_limiter = rate_limiter
+
+
+def _run_task(index, youtube_id, kwargs):
+    start_time = time.time()
+    kwargs = dict(kwargs)
+    watermark_dir = kwargs.pop('watermark_dir', None)
+    if watermark_dir:
+        kwargs['watermark'] = os.path.join(watermark_dir, youtube_id + '.json')
+    try:
+        comments, error = download_comments(youtube_id, **kwargs), None
+    except Exception as e:
+        comments, error = [], e
+    return index, comments, error, time.time() - start_time
+
+
+class CommentPool:
+
+    def __init__(self, workers=4, processes=False, max_tasks_per_worker=50, downloader_kwargs=None,
+                 rate_limiter=None):
+        self.max_tasks_per_worker = max_tasks_per_worker
+        # Passed on to YoutubeCommentDownloader, e.g. {'synthesize_continuations': True}
+        self.downloader_kwargs = downloader_kwargs
+        # The rate limiter is shared by all workers. For a process pool it needs to be created with processes=True.
+        self.rate_limiter = rate_limiter
+        kwargs = {'initializer': _init_worker, 'initargs': (rate_limiter,)}
+        if processes:
+            # The worker processes have to come from the same multiprocessing context as the shared state of the rate
+            # limiter. Replacing workers (max_tasks_per_child) requires a context other than fork anyway.
+            kwargs['mp_context'] = getattr(rate_limiter, 'ctx', None) or multiprocessing.get_context('spawn')
+            if max_tasks_per_worker and sys.version_info >= (3, 11):
+                # Worker processes are replaced after max_tasks_per_worker videos
+                kwargs['max_tasks_per_child'] = max_tasks_per_worker
+            self.executor = concurrent.futures.ProcessPoolExecutor(workers, **kwargs)
+        else:
+            self.executor = concurrent.futures.ThreadPoolExecutor(workers, **kwargs)
+
+    def imap_unordered(self, youtube_ids, sort_by=SORT_BY_RECENT, language=None, limit=None, timeout=None,
+                       reschedule=2, watermark_dir=None, since=None):
+        # Yields (index, comments, error, elapsed) tuples in order of completion. Videos that failed with a
+        # RequestFailedError are put at the back of the queue, up to `reschedule` times. If watermark_dir is given,
+        # every video keeps a watermark file in it, so only comments posted since the last complete run are returned.
+        kwargs = {'sort_by': sort_by, 'language': language, 'limit': limit,
+                  'timeout': timeout, 'max_tasks': self.max_tasks_per_worker,
+                  'downloader_kwargs': self.downloader_kwargs, 'watermark_dir': watermark_dir, 'since': since}
+        youtube_ids = list(youtube_ids)
+        attempts = [0] * len(youtube_ids)
+        pending = set(self.executor.submit(_run_task, index, youtube_id, kwargs)
+                      for index, youtube_id in enumerate(youtube_ids))
+        try:
+            while pending:
+                done, pending = concurrent.futures.wait(pending, return_when=concurrent.futures.FIRST_COMPLETED)
+                for future in done:
+                    index, comments, error, elapsed = future.result()
+                    if isinstance(error, RequestFailedError) and attempts[index] < reschedule:
+                        attempts[index] += 1
+                        pending.add(self.executor.submit(_run_task, index, youtube_ids[index], kwargs))
+                        continue
+                    yield index, comments, error, elapsed
+        finally:
+            for future in pending:
+                future.cancel()
+
+    def close(self):
+        self.executor.shutdown(wait=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
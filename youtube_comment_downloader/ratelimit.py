@@ -0,0 +1,93 @@
+import multiprocessing
+import threading
+import time
+
+# Responses that mean we are being throttled or blocked
+THROTTLE_STATUS_CODES = frozenset([403, 413, 429])
+
+# Positions in the shared state array
+_TOKENS, _UPDATED, _RATE, _OPEN_UNTIL, _ERRORS, _WINDOW_START = range(6)
+
+
+class RateLimiter:
+    # Token bucket shared by every downloader that uses it. The refill rate (requests per second) follows AIMD:
+    # it grows by `increase` per second of successful traffic and is multiplied by `decrease` on every error or slow
+    # response. If `trip_errors` throttled responses (403/413/429) arrive within `trip_window` seconds, the circuit
+    # breaker opens and every worker pauses for `cooldown` seconds.
+    #
+    # With processes=True the state lives in shared memory, so the limiter can be handed to worker processes when
+    # they are started (e.g. through the initializer of a ProcessPoolExecutor). The shared memory comes from the
+    # multiprocessing context ctx (by default 'spawn'), and the worker processes have to be started from the same one:
+    # CommentPool uses the context of its rate limiter.
+
+    def __init__(self, rate=5.0, min_rate=.2, max_rate=50.0, burst=5, increase=.5, decrease=.5, target_latency=3.0,
+                 trip_errors=5, trip_window=30.0, cooldown=60.0, processes=False, ctx=None):
+        self.min_rate = min_rate
+        self.max_rate = max_rate
+        self.burst = burst
+        self.increase = increase
+        self.decrease = decrease
+        self.target_latency = target_latency
+        self.trip_errors = trip_errors
+        self.trip_window = trip_window
+        self.cooldown = cooldown
+
+        state = [burst, time.time(), rate, 0, 0, 0]
+        if processes or ctx is not None:
+            self.ctx = ctx or multiprocessing.get_context('spawn')
+            self.state = self.ctx.Array('d', state)
+            self.lock = self.state.get_lock()
+        else:
+            self.ctx = None
+            self.state = state
+            self.lock = threading.Lock()
+
+    @property
+    def rate(self):
+        return self.state[_RATE]
+
+    @property
+    def is_open(self):
+        return self.state[_OPEN_UNTIL] > time.time()
+
+    def acquire(self):
+        # Blocks until a request may be sent
+        while True:
+            with self.lock:
+                now = time.time()
+                if self.state[_OPEN_UNTIL] > now:
+                    wait = self.state[_OPEN_UNTIL] - now
+                else:
+                    elapsed = max(0, now - self.state[_UPDATED])
+                    tokens = min(self.burst, self.state[_TOKENS] + elapsed * self.state[_RATE])
+                    self.state[_UPDATED] = now
+                    if tokens >= 1:
+                        self.state[_TOKENS] = tokens - 1
+                        return
+                    self.state[_TOKENS] = tokens
+                    wait = (1 - tokens) / self.state[_RATE]
+            time.sleep(wait)
+
+    def feedback(self, status_code, latency):
+        # Reports the outcome of a request. A status_code of None means the request failed without a response.
+        with self.lock:
+            now = time.time()
+            rate = self.state[_RATE]
+            if status_code is None or status_code >= 500 or status_code in THROTTLE_STATUS_CODES \
+                    or latency > self.target_latency:
+                self.state[_RATE] = max(self.min_rate, rate * self.decrease)
+            else:
+                self.state[_RATE] = min(self.max_rate, rate + self.increase / rate)
+
+            if status_code in THROTTLE_STATUS_CODES:
+                if now - self.state[_WINDOW_START] > self.trip_window:
+                    self.state[_WINDOW_START] = now
+                    self.state[_ERRORS] = 0
+                self.state[_ERRORS] += 1
+                if self.state[_ERRORS] >= self.trip_errors:
+                    # Open the circuit: nobody sends anything until the cooldown has passed, then a single request
+                    # probes whether the server accepts traffic again
+                    self.state[_OPEN_UNTIL] = now + self.cooldown
+                    self.state[_ERRORS] = 0
+                    self.state[_TOKENS] = 1
+                    self.state[_UPDATED] = now + self.cooldown
@@ -0,0 +1,63 @@
+import sys
+from collections.abc import Mapping, MutableMapping
+
+# Fields of the comments yielded by YoutubeCommentDownloader, in the order of the comment dicts
+FIELDS = ('cid', 'text', 'time', 'author', 'channel', 'votes', 'replies', 'photo', 'heart', 'reply', 'time_parsed',
+          'paid')
+FIELD_SET = frozenset(FIELDS)
+# Strings that repeat across the comments of a video, e.g. every reply by the same author
+INTERNED_FIELDS = frozenset(['author', 'channel', 'photo'])
+
+
+class Comment(MutableMapping):
+    # A comment as yielded by YoutubeCommentDownloader(compact=True). It can be used like the comment dict
+    # (comment['text'], comment.get('paid'), dict(comment), comparing to a dict), but the fields are kept in slots
+    # instead of a dict per comment, and the author, channel and photo strings are interned so each of them is stored
+    # once. Like in the dict, time_parsed and paid are missing when there is no value. Only these fields can be set.
+
+    __slots__ = FIELDS
+
+    def __init__(self, **fields):
+        for key, value in fields.items():
+            self[key] = value
+
+    def __getitem__(self, key):
+        if key not in FIELD_SET:
+            raise KeyError(key)
+        try:
+            return getattr(self, key)
+        except AttributeError:
+            raise KeyError(key)
+
+    def __setitem__(self, key, value):
+        if key not in FIELD_SET:
+            raise KeyError(key)
+        if key in INTERNED_FIELDS and type(value) is str:
+            value = sys.intern(value)
+        setattr(self, key, value)
+
+    def __delitem__(self, key):
+        if key not in FIELD_SET:
+            raise KeyError(key)
+        try:
+            delattr(self, key)
+        except AttributeError:
+            raise KeyError(key)
+
+    def __iter__(self):
+        for key in FIELDS:
+            if hasattr(self, key):
+                yield key
+
+    def __len__(self):
+        return sum(1 for _ in self)
+
+    def __repr__(self):
+        return 'Comment(%r)' % dict(self)
+
+
+def json_default(obj):
+    # Passed to json.dump(s) as default, so that Comment and other mappings are written as JSON objects
+    if isinstance(obj, Mapping):
+        return dict(obj)
+    raise TypeError('Object of type %s is not JSON serializable' % type(obj).__name__)
@@ -0,0 +1,59 @@
+import datetime
+import functools
+import re
+import time
+
+import dateparser
+from dateutil.relativedelta import relativedelta
+
+# Youtube shows the publish time of a comment as a short relative string ("2 weeks ago", "6 天前", "6 日前", ...).
+# The forms below are parsed with a single regex match; anything else is handed to dateparser.
+RELATIVE_TIME_PATTERNS = {
+    'en': (re.compile(r'(\d+) (second|minute|hour|day|week|month|year)s? ago'),
+           {'second': 'seconds', 'minute': 'minutes', 'hour': 'hours', 'day': 'days',
+            'week': 'weeks', 'month': 'months', 'year': 'years'}),
+    'zh': (re.compile(r'(\d+) ?(秒|分钟|分鐘|小时|小時|天|周|週|个月|個月|年)前'),
+           {'秒': 'seconds', '分钟': 'minutes', '分鐘': 'minutes', '小时': 'hours', '小時': 'hours', '天': 'days',
+            '周': 'weeks', '週': 'weeks', '个月': 'months', '個月': 'months', '年': 'years'}),
+    'ja': (re.compile(r'(\d+) ?(秒|分|時間|日|週間|か月|ヶ月|年)前'),
+           {'秒': 'seconds', '分': 'minutes', '時間': 'hours', '日': 'days', '週間': 'weeks',
+            'か月': 'months', 'ヶ月': 'months', '年': 'years'}),
+    'ko': (re.compile(r'(\d+) ?(초|분|시간|일|주|개월|년) 전'),
+           {'초': 'seconds', '분': 'minutes', '시간': 'hours', '일': 'days', '주': 'weeks',
+            '개월': 'months', '년': 'years'}),
+}
+
+# Results are cached per (text, language, anchor bucket). Within a bucket, every comment with the same relative
+# time gets the same timestamp, so the result may differ from calling dateparser directly by less than a bucket.
+ANCHOR_BUCKET = 1
+
+# Relative times are parsed against clock() unless a now timestamp is given. The anchor therefore moves on between
+# calls, and two crawls of the same video a second apart can differ in their time_parsed values. Pass now, or replace
+# clock (as the tests do), to pin it.
+clock = time.time
+
+
+def parse_relative_time(text, language=None, now=None):
+    # Returns a POSIX timestamp (like dateparser.parse(text).timestamp()) or None if the text can't be parsed
+    language = language.split('-')[0].lower() if language else None
+    now = clock() if now is None else now
+    return _parse_relative_time(text, language, int(now // ANCHOR_BUCKET))
+
+
+@functools.lru_cache(maxsize=4096)
+def _parse_relative_time(text, language, bucket):
+    anchor = datetime.datetime.fromtimestamp(bucket * ANCHOR_BUCKET)
+
+    patterns = [RELATIVE_TIME_PATTERNS[language]] if language in RELATIVE_TIME_PATTERNS \
+        else RELATIVE_TIME_PATTERNS.values()
+    for pattern, units in patterns:
+        match = pattern.fullmatch(text)
+        if match:
+            # Same arithmetic as dateparser: naive local time minus a calendar-aware delta
+            delta = relativedelta(**{units[match.group(2)]: int(match.group(1))})
+            return (anchor - delta).timestamp()
+
+    try:
+        return dateparser.parse(text, settings={'RELATIVE_BASE': anchor}).timestamp()
+    except AttributeError:
+        return None
@@ -0,0 +1,98 @@
+import copy
+import email.utils
+import random
+import time
+
+# What to do with a response or an exception
+SUCCESS = 'success'
+RETRY = 'retry'
+GIVE_UP = 'give_up'
+
+
+class RequestFailedError(RuntimeError):
+    # Raised once a request has exhausted its retries. Callers that download many videos can put the video back in
+    # their queue instead of treating it as done.
+
+    def __init__(self, message, status_code=None, attempts=0):
+        super(RequestFailedError, self).__init__(message)
+        self.status_code = status_code
+        self.attempts = attempts
+
+    def __reduce__(self):
+        # Keep the attributes when the error is sent back from a worker process
+        return self.__class__, (self.args[0], self.status_code, self.attempts)
+
+
+class RetryPolicy:
+    # Exponential backoff with full jitter: before retry n (starting at 0) we sleep a random time between
+    # (1 - jitter) * d and d, where d = min(max_backoff, backoff * factor ** n). A Retry-After header takes
+    # precedence, up to max_retry_after seconds. Every attempt has its own timeout, and the whole request gives up
+    # once `deadline` seconds have passed.
+
+    # 403 is not retried: Youtube answers it when the request itself is refused (e.g. a bot check), which waiting
+    # does not change
+    retry_status_codes = frozenset([429, 500, 502, 503, 504])
+    give_up_status_codes = frozenset([403, 413])
+
+    def __init__(self, retries=5, backoff=1.0, factor=2.0, max_backoff=30.0, jitter=1.0, timeout=60, deadline=None,
+                 max_retry_after=300.0):
+        self.retries = retries
+        self.backoff = backoff
+        self.factor = factor
+        self.max_backoff = max_backoff
+        self.jitter = jitter
+        self.timeout = timeout
+        self.deadline = deadline
+        self.max_retry_after = max_retry_after
+
+    def replace(self, **kwargs):
+        policy = copy.copy(self)
+        for key, value in kwargs.items():
+            if value is not None:
+                setattr(policy, key, value)
+        return policy
+
+    def classify(self, status_code=None, error=None):
+        # Connection errors, timeouts and unreadable responses (error is set) are worth another try
+        if error is not None or status_code in self.retry_status_codes:
+            return RETRY
+        if status_code == 200:
+            return SUCCESS
+        return GIVE_UP
+
+    def delay(self, attempt, retry_after=None):
+        retry_after = self.parse_retry_after(retry_after)
+        if retry_after is not None:
+            return min(retry_after, self.max_retry_after)
+        delay = min(self.max_backoff, self.backoff * self.factor ** attempt)
+        return delay * (1 - self.jitter * random.random())
+
+    @staticmethod
+    def parse_retry_after(value):
+        # Retry-After is either a number of seconds or an HTTP date
+        if not value:
+            return None
+        try:
+            return max(0.0, float(value))
+        except ValueError:
+            pass
+        try:
+            return max(0.0, email.utils.parsedate_to_datetime(value).timestamp() - time.time())
+        except (TypeError, ValueError, IndexError):
+            return None
+
+    def attempt_timeout(self, start_time):
+        # The timeout of the next attempt, shortened so that it ends before the deadline
+        if not self.deadline:
+            return self.timeout
+        remaining = max(.001, self.deadline - (time.time() - start_time))
+        return min(self.timeout, remaining) if self.timeout else remaining
+
+    def backoff_time(self, attempt, start_time, retry_after=None):
+        # How long to wait before the next attempt, or None if there are no attempts or no time left
+        if attempt + 1 >= self.retries:
+            return None
+        delay = self.delay(attempt, retry_after)
+        if self.deadline and time.time() + delay - start_time >= self.deadline:
+            return None
+        return delay
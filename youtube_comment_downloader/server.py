@@ -0,0 +1,210 @@
+import argparse
+import collections
+import gzip
+import json
+import os
+import random
+import sys
+import threading
+import time
+import urllib.parse
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from .synthetic import SyntheticSource
+
+CONSENT_PAGE = '''<!DOCTYPE html><html><body><form action="/save" method="POST">
+<input type="hidden" name="gl" value="US">
+<input type="hidden" name="m" value="0">
+<input type="hidden" name="pc" value="yt">
+<input type="hidden" name="continue" value="{continue_url}">
+<input type="hidden" name="hl" value="en">
+<input type="submit" value="Accept all"></form></body></html>'''
+
+
+def read_file(path):
+    # Reads a fixture, gzipped or not
+    for name in (path, path + '.gz'):
+        if os.path.exists(name):
+            with (gzip.open(name, 'rb') if name.endswith('.gz') else open(name, 'rb')) as fp:
+                return fp.read()
+    raise FileNotFoundError(path)
+
+
+class RecordedSource:
+    # Serves a recorded watch page (for every video) and the recorded /youtubei/v1/next responses, by continuation
+    # token. The fixtures in benchmarks/fixtures are in this format.
+
+    def __init__(self, watch_page, continuations):
+        self.page = watch_page if isinstance(watch_page, bytes) else watch_page.encode('utf-8')
+        self.continuations = {token: response if isinstance(response, bytes) else json.dumps(response).encode('utf-8')
+                              for token, response in continuations.items()}
+
+    @classmethod
+    def from_directory(cls, path):
+        # Reads watch_page.html and continuations.json from path, either of which may be gzipped
+        return cls(read_file(os.path.join(path, 'watch_page.html')),
+                   json.loads(read_file(os.path.join(path, 'continuations.json'))))
+
+    def watch_page(self, youtube_id):
+        return self.page
+
+    def continuation(self, token):
+        # Returns the response as bytes, or None for an unknown token
+        return self.continuations.get(token)
+
+
+class InnertubeHandler(BaseHTTPRequestHandler):
+    # Keep-alive, so that a requests.Session reuses its connections like it does with Youtube
+    protocol_version = 'HTTP/1.1'
+    # Headers and body are sent separately, which with Nagle's algorithm stalls every response on a delayed ACK
+    disable_nagle_algorithm = True
+
+    def do_GET(self):
+        url = urllib.parse.urlparse(self.path)
+        query = urllib.parse.parse_qs(url.query)
+        self.server.admit(url.path)
+
+        if url.path == '/watch':
+            if self.server.consent and 'CONSENT=' not in self.headers.get('Cookie', ''):
+                location = '/consent?' + urllib.parse.urlencode({'continue': self.path})
+                return self.send_body(b'', status=302, headers={'Location': location})
+            return self.send_body(self.server.source.watch_page(query.get('v', [''])[0]),
+                                  'text/html; charset=utf-8')
+        if url.path == '/consent':
+            page = CONSENT_PAGE.format(continue_url=query.get('continue', ['/'])[0])
+            return self.send_body(page.encode('utf-8'), 'text/html; charset=utf-8')
+        self.send_body(b'Not Found', status=404)
+
+    def do_POST(self):
+        url = urllib.parse.urlparse(self.path)
+        body = self.rfile.read(int(self.headers.get('Content-Length') or 0))
+        self.server.admit(url.path)
+
+        if url.path == '/save':
+            # Accepts the consent form and sends the browser back to the watch page
+            continue_url = urllib.parse.parse_qs(url.query).get('continue', ['/'])[0]
+            continue_url = urllib.parse.urlparse(continue_url)
+            location = continue_url.path + ('?' + continue_url.query if continue_url.query else '')
+            return self.send_body(b'', status=302, headers={'Location': location,
+                                                            'Set-Cookie': 'CONSENT=YES+cb; Path=/'})
+        if url.path.startswith('/youtubei/v1/'):
+            if self.server.error_rate and random.random() < self.server.error_rate:
+                return self.send_body(b'{"error": {"code": 429}}', 'application/json', status=429)
+            try:
+                token = json.loads(body)['continuation']
+            except (ValueError, KeyError, TypeError):
+                return self.send_body(b'{"error": {"code": 400}}', 'application/json', status=400)
+            # Like Youtube, answer an unknown continuation with a response without any comments
+            response = self.server.source.continuation(token)
+            return self.send_body(response if response is not None else b'{"responseContext": {}}',
+                                  'application/json')
+        self.send_body(b'Not Found', status=404)
+
+    def send_body(self, body, content_type='text/plain', status=200, headers=None):
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            BaseHTTPRequestHandler.log_message(self, format, *args)
+
+
+class InnertubeServer(ThreadingHTTPServer):
+    # A local stand-in for the parts of Youtube that YoutubeCommentDownloader uses: the watch page, the consent form
+    # and the /youtubei/v1/... continuation API. Point the downloader at it with base_url=server.url. Pages come from
+    # a source (RecordedSource or SyntheticSource). latency is added to every request, and a share of error_rate API
+    # requests is answered with HTTP 429, to test retries and rate limiting. With consent=True, watch pages redirect
+    # to the consent form until it has been submitted.
+
+    daemon_threads = True
+
+    def __init__(self, source, host='127.0.0.1', port=0, latency=0, error_rate=0, consent=False, verbose=False):
+        super(InnertubeServer, self).__init__((host, port), InnertubeHandler)
+        self.source = source
+        self.latency = latency
+        self.error_rate = error_rate
+        self.consent = consent
+        self.verbose = verbose
+        self.requests = collections.Counter()
+        self.lock = threading.Lock()
+        self.thread = None
+
+    @property
+    def url(self):
+        host, port = self.server_address[:2]
+        return 'http://%s:%d' % (host, port)
+
+    def admit(self, path):
+        # Counts the request and adds the latency
+        with self.lock:
+            self.requests[path] += 1
+        if self.latency:
+            time.sleep(self.latency)
+
+    def handle_error(self, request, client_address):
+        # A client that hangs up early, like a crawl that stops at its limit, is not an error of the server
+        if isinstance(sys.exc_info()[1], (ConnectionResetError, BrokenPipeError)):
+            return
+        super(InnertubeServer, self).handle_error(request, client_address)
+
+    def start(self):
+        # Serves from a background thread
+        self.thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+        if self.thread:
+            self.thread.join()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Serve recorded Youtube pages for offline crawling and load tests')
+    parser.add_argument('--fixtures', '-f', help='Directory with watch_page.html(.gz) and continuations.json(.gz)')
+    parser.add_argument('--comments', '-c', type=int, help='Serve generated videos with this many comment threads')
+    parser.add_argument('--page-size', type=int, default=20, help='Generated comment threads per page')
+    parser.add_argument('--reply-ratio', type=float, default=.2, help='Share of generated threads with replies')
+    parser.add_argument('--reply-depth', type=int, default=10, help='Maximum number of replies of a generated thread')
+    parser.add_argument('--paid-ratio', type=float, default=.01, help='Share of generated comments with a paid chip')
+    parser.add_argument('--text-length', type=int, default=20, help='Average words per generated comment')
+    parser.add_argument('--host', default='127.0.0.1', help='Host to listen on. Defaults to 127.0.0.1')
+    parser.add_argument('--port', '-p', type=int, default=8000, help='Port to listen on. Defaults to 8000')
+    parser.add_argument('--latency', type=float, default=0, help='Seconds added to every request')
+    parser.add_argument('--error-rate', type=float, default=0, help='Share of API requests answered with HTTP 429')
+    parser.add_argument('--consent', action='store_true', help='Redirect to a consent form first')
+    parser.add_argument('--verbose', '-v', action='store_true', help='Log every request')
+    args = parser.parse_args(argv)
+    if bool(args.fixtures) == bool(args.comments):
+        parser.error('either --fixtures or --comments is required')
+
+    if args.fixtures:
+        source = RecordedSource.from_directory(args.fixtures)
+    else:
+        source = SyntheticSource(args.comments, args.page_size, args.reply_ratio, args.reply_depth,
+                                 paid_ratio=args.paid_ratio, text_length=args.text_length)
+    server = InnertubeServer(source, args.host, args.port, args.latency,
+                             args.error_rate, args.consent, args.verbose)
+    print('Serving on', server.url, '(use --base-url', server.url + ')')
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,119 @@
+import itertools
+import sqlite3
+import time
+
+from .writers import parse_count
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS comments (
+    cid TEXT PRIMARY KEY,
+    video_id TEXT,
+    text TEXT,
+    time TEXT,
+    author TEXT,
+    channel TEXT,
+    votes INTEGER,
+    replies INTEGER,
+    photo TEXT,
+    heart INTEGER,
+    reply INTEGER,
+    time_parsed REAL,
+    paid TEXT,
+    first_seen REAL,
+    last_seen REAL
+);
+CREATE INDEX IF NOT EXISTS comments_video_id ON comments (video_id);
+CREATE INDEX IF NOT EXISTS comments_channel ON comments (channel);
+CREATE INDEX IF NOT EXISTS comments_time_parsed ON comments (time_parsed);
+CREATE TABLE IF NOT EXISTS video_keywords (
+    video_id TEXT,
+    keyword TEXT,
+    PRIMARY KEY (video_id, keyword)
+);
+CREATE INDEX IF NOT EXISTS video_keywords_keyword ON video_keywords (keyword);
+'''
+
+# A comment that is downloaded again keeps its row. The counts and the text are updated, while time_parsed is kept:
+# the relative time of the earliest crawl is the most precise one.
+UPSERT = '''
+INSERT INTO comments (cid, video_id, text, time, author, channel, votes, replies, photo, heart, reply, time_parsed,
+                      paid, first_seen, last_seen)
+VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+ON CONFLICT (cid) DO UPDATE SET
+    text = excluded.text,
+    time = excluded.time,
+    author = excluded.author,
+    photo = excluded.photo,
+    votes = excluded.votes,
+    replies = excluded.replies,
+    heart = excluded.heart,
+    paid = COALESCE(excluded.paid, comments.paid),
+    time_parsed = COALESCE(comments.time_parsed, excluded.time_parsed),
+    last_seen = excluded.last_seen
+'''
+
+BATCH_SIZE = 1000
+
+
+class SqliteCommentStore:
+    # Stores comments in a single SQLite database, one row per comment ID. Comments are written in transactions of
+    # batch_size rows, and the keywords a video was found under are kept in a separate table, so one store can hold
+    # every crawl of every video and be queried without loading it into memory, e.g.:
+    #   SELECT c.* FROM comments c JOIN video_keywords k USING (video_id) WHERE k.keyword = ? ORDER BY votes DESC
+
+    def __init__(self, path, batch_size=BATCH_SIZE):
+        self.path = path
+        self.batch_size = batch_size
+        self.connection = sqlite3.connect(path)
+        # Readers can query the store while a crawl is writing to it
+        self.connection.execute('PRAGMA journal_mode=WAL')
+        self.connection.execute('PRAGMA synchronous=NORMAL')
+        self.connection.executescript(SCHEMA)
+
+    def write(self, comments, video_id=None, keyword=None):
+        # comments are dicts as yielded by YoutubeCommentDownloader. Returns the number of comments written.
+        now = time.time()
+        video_ids = set([video_id]) if video_id else set()
+        rows = (self.row(comment, video_id, now, video_ids) for comment in comments)
+        count = 0
+        while True:
+            batch = list(itertools.islice(rows, self.batch_size))
+            if not batch:
+                break
+            with self.connection:
+                self.connection.executemany(UPSERT, batch)
+            count += len(batch)
+        if keyword is not None:
+            for video_id in video_ids:
+                self.add_keyword(video_id, keyword)
+        return count
+
+    @staticmethod
+    def row(comment, video_id, now, video_ids):
+        cid = comment.get('cid', '')
+        time_parsed = comment.get('time_parsed')
+        video_id = comment.get('video_id', video_id)
+        video_ids.add(video_id)
+        return (cid, video_id, comment.get('text'), comment.get('time'), comment.get('author'), comment.get('channel'),
+                parse_count(comment.get('votes')), parse_count(comment.get('replies')), comment.get('photo'),
+                bool(comment.get('heart', False)), bool(comment.get('reply', '.' in cid)),
+                float(time_parsed) if time_parsed not in (None, '') else None, comment.get('paid'), now, now)
+
+    def add_keyword(self, video_id, keyword):
+        with self.connection:
+            self.connection.execute('INSERT OR IGNORE INTO video_keywords (video_id, keyword) VALUES (?, ?)',
+                                    (video_id, keyword))
+
+    def count(self, video_id=None):
+        if video_id is None:
+            return self.connection.execute('SELECT COUNT(*) FROM comments').fetchone()[0]
+        return self.connection.execute('SELECT COUNT(*) FROM comments WHERE video_id = ?', (video_id,)).fetchone()[0]
+
+    def close(self):
+        self.connection.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
@@ -0,0 +1,230 @@
+import json
+import random
+
+from . import jsonlib
+
+# Generates the watch page and /youtubei/v1/next responses of a video with any number of comments, shaped like the
+# real ones: comment threads with commentViewModels, and their commentEntityPayload,
+# engagementToolbarStateEntityPayload and commentSurfaceEntityPayload mutations (in reverse order, like on Youtube),
+# reply pages behind 'Show more replies' buttons and paid comment chips. Pages are generated from their continuation
+# token when they are requested, and every comment from a seed of its own, so a page looks the same every time and a
+# video with a million comments takes no memory. SyntheticSource can be served by InnertubeServer.
+
+API_URL = '/youtubei/v1/next'
+
+WORDS = ('this video is great thanks for sharing I learned a lot from the explanation at the end who is watching in '
+         '2024 the music at 3:15 is amazing 太好了 非常 有用 すごい 動画 정말 좋아요 😂 👍').split()
+LIKES = ['', '', '1', '3', '7', '42', '356', '1.2K', '15K']
+TIME_UNITS = [('year', 365 * 86400), ('month', 30 * 86400), ('week', 7 * 86400), ('day', 86400), ('hour', 3600),
+              ('minute', 60), ('second', 1)]
+SORT_TOKENS = ('sort-top', 'sort-newest')
+
+
+def endpoint(token):
+    return {'clickTrackingParams': 'CBIQ7ZUCIhMI',
+            'commandMetadata': {'webCommandMetadata': {'sendPost': True, 'apiUrl': API_URL}},
+            'continuationCommand': {'token': token, 'request': 'CONTINUATION_REQUEST_TYPE_WATCH_NEXT'}}
+
+
+def relative_time(seconds):
+    seconds = max(1, seconds)
+    for unit, length in TIME_UNITS:
+        if seconds >= length or unit == 'second':
+            count = max(1, seconds // length)
+            return '%d %s%s ago' % (count, unit, 's' if count > 1 else '')
+
+
+def view_model(cid):
+    return {'commentViewModel': {'commentViewModel': {
+        'commentId': cid, 'commentKey': 'ck' + cid, 'commentSurfaceKey': 'sk' + cid, 'toolbarStateKey': 'tk' + cid,
+        'sharedKey': 'sh' + cid,
+        'rendererContext': {'loggingContext': {'loggingDirectives': {'trackingParams': 'CAAQ',
+                                                                     'visibility': {'types': '12'}}}}}}}
+
+
+def wrap(action, target, items, mutations):
+    return {'responseContext': {'visitorData': 'Cgt4eHh4',
+                                'serviceTrackingParams': [{'service': 'GFEEDBACK',
+                                                           'params': [{'key': 'logged_in', 'value': '0'}] * 6}],
+                                'mainAppWebResponseContext': {'loggedOut': True}},
+            'trackingParams': 'CAAQg2ciEwi',
+            'onResponseReceivedEndpoints': [{'clickTrackingParams': 'CAAQ',
+                                             action: {'targetId': target, 'continuationItems': items}}],
+            'frameworkUpdates': {'entityBatchUpdate': {'mutations': mutations,
+                                                       'timestamp': {'seconds': '1714521600', 'nanos': 0}}}}
+
+
+class SyntheticSource:
+    # A video with `comments` comment threads, `page_size` per page. A share of reply_ratio threads has between 1
+    # and reply_depth replies, `reply_page_size` per reply page, and a share of paid_ratio comments has a paid chip.
+    # Comment texts are text_length words long on average. Comments are interval seconds apart, the newest first.
+
+    def __init__(self, comments=1000, page_size=20, reply_ratio=.2, reply_depth=10, reply_page_size=10,
+                 paid_ratio=.01, text_length=20, interval=60, seed=0):
+        if page_size < 1 or reply_page_size < 1:
+            raise ValueError('page_size and reply_page_size need to be at least 1')
+        if not 0 <= reply_depth < 65536:
+            raise ValueError('reply_depth needs to be between 0 and 65535')
+        self.comments = comments
+        self.page_size = page_size
+        self.reply_ratio = reply_ratio
+        self.reply_depth = reply_depth
+        self.reply_page_size = reply_page_size
+        self.paid_ratio = paid_ratio
+        self.text_length = text_length
+        self.interval = interval
+        self.seed = seed
+
+    @property
+    def pages(self):
+        return max(1, -(-self.comments // self.page_size))
+
+    def rng(self, thread, reply=-1):
+        # Every comment has a random generator of its own
+        return random.Random((self.seed << 48) | (thread << 16) | (reply + 1))
+
+    def cid(self, thread, reply=-1):
+        cid = 'Ugz%016dAaABAg' % thread
+        return cid if reply < 0 else cid + '.%022d' % reply
+
+    def reply_count(self, thread):
+        rng = self.rng(thread)
+        return rng.randint(1, self.reply_depth) if self.reply_depth and rng.random() < self.reply_ratio else 0
+
+    def count(self):
+        # The number of comments including replies. Goes through every thread, so it takes a while for large videos.
+        return sum(1 + self.reply_count(thread) for thread in range(self.comments))
+
+    def cids(self):
+        for thread in range(self.comments):
+            yield self.cid(thread)
+            for reply in range(self.reply_count(thread)):
+                yield self.cid(thread, reply)
+
+    def text(self, rng):
+        words = max(1, int(rng.expovariate(1.0 / self.text_length))) if self.text_length else 0
+        return ' '.join(rng.choice(WORDS) for _ in range(words))
+
+    def mutations(self, thread, reply=-1):
+        rng = self.rng(thread, reply)
+        cid = self.cid(thread, reply)
+        author = rng.randrange(max(10, self.comments // 10))
+        channel = 'UC%022d' % author
+        likes = rng.choice(LIKES)
+        # Replies come after their comment
+        seconds = self.interval * thread - (reply + 1) * rng.randrange(max(1, self.interval))
+        published = relative_time(seconds) + (' (edited)' if rng.random() < .05 else '')
+        hearted = rng.random() < .02
+        paid = rng.random() < self.paid_ratio
+        surface = {'key': 'sk' + cid, 'voiceReplyContainerViewModel': {}}
+        if paid:
+            surface['pdgCommentChip'] = {'pdgCommentChipRenderer': {'chipText': {
+                'simpleText': '$%d.00' % rng.choice([2, 5, 10, 20, 50])}}}
+        return [
+            {'entityKey': 'ck' + cid, 'type': 'ENTITY_MUTATION_TYPE_REPLACE', 'payload': {'commentEntityPayload': {
+                'key': 'ck' + cid,
+                'properties': {'commentId': cid, 'content': {'content': self.text(rng), 'styleRuns': []},
+                               'publishedTime': published, 'replyLevel': 0 if reply < 0 else 1,
+                               'authorButtonA11y': '@user%d' % author, 'toolbarStateKey': 'tk' + cid},
+                'author': {'channelId': channel, 'displayName': '@user%d' % author,
+                           'avatarThumbnailUrl': 'https://yt3.ggpht.com/ytc/AIdro_%040d=s88-c-k-c0x00ffffff-no-rj' %
+                                                 author,
+                           'isVerified': False, 'isCreator': author == 0,
+                           'channelCommand': {'innertubeCommand': {'browseEndpoint': {'browseId': channel}}}},
+                'toolbar': {'likeCountNotliked': likes, 'likeCountLiked': likes or '1',
+                            'replyCount': str(self.reply_count(thread) or '') if reply < 0 else '',
+                            'engagementToolbarStyle': {'value': 'ENGAGEMENT_TOOLBAR_STYLE_VALUE_DEFAULT'}}}}},
+            {'entityKey': 'tk' + cid, 'type': 'ENTITY_MUTATION_TYPE_REPLACE', 'payload': {
+                'engagementToolbarStateEntityPayload': {
+                    'key': 'tk' + cid, 'likeState': 'TOOLBAR_LIKE_STATE_INDIFFERENT',
+                    'heartState': 'TOOLBAR_HEART_STATE_HEARTED' if hearted else 'TOOLBAR_HEART_STATE_UNHEARTED'}}},
+            {'entityKey': 'sk' + cid, 'type': 'ENTITY_MUTATION_TYPE_REPLACE',
+             'payload': {'commentSurfaceEntityPayload': surface}}]
+
+    def comment_page(self, page):
+        items, mutations = [], []
+        for thread in range(page * self.page_size, min(self.comments, (page + 1) * self.page_size)):
+            cid = self.cid(thread)
+            mutations.extend(self.mutations(thread))
+            renderer = dict(view_model(cid), renderingPriority='RENDERING_PRIORITY_UNKNOWN')
+            if self.reply_count(thread):
+                renderer['replies'] = {'commentRepliesRenderer': {'targetId': 'comment-replies-item-' + cid,
+                                                                  'contents': [{'continuationItemRenderer': {
+                                                                      'trigger': 'CONTINUATION_TRIGGER_ON_ITEM_SHOWN',
+                                                                      'continuationEndpoint': endpoint(
+                                                                          'replies-%d-0' % thread)}}]}}
+            items.append({'commentThreadRenderer': renderer})
+        if page + 1 < self.pages:
+            items.append({'continuationItemRenderer': {'trigger': 'CONTINUATION_TRIGGER_ON_ITEM_SHOWN',
+                                                       'continuationEndpoint': endpoint('page-%d' % (page + 1))}})
+        if page == 0:
+            header = {'commentsHeaderRenderer': {'countText': {'runs': [{'text': str(self.comments)},
+                                                                        {'text': ' Comments'}]}}}
+            return wrap('reloadContinuationItemsCommand', 'comments-section', [header] + items, mutations[::-1])
+        return wrap('appendContinuationItemsAction', 'comments-section', items, mutations[::-1])
+
+    def reply_page(self, thread, page):
+        count = self.reply_count(thread)
+        items, mutations = [], []
+        for reply in range(page * self.reply_page_size, min(count, (page + 1) * self.reply_page_size)):
+            mutations.extend(self.mutations(thread, reply))
+            items.append(view_model(self.cid(thread, reply)))
+        if (page + 1) * self.reply_page_size < count:
+            items.append({'continuationItemRenderer': {'trigger': 'CONTINUATION_TRIGGER_ON_ITEM_SHOWN', 'button': {
+                'buttonRenderer': {'text': {'runs': [{'text': 'Show more replies'}]},
+                                   'command': endpoint('replies-%d-%d' % (thread, page + 1))}}}})
+        return wrap('appendContinuationItemsAction', 'comment-replies-item-' + self.cid(thread), items,
+                    mutations[::-1])
+
+    def response(self, token):
+        # Returns the response for a continuation token as a dict, or None for an unknown token
+        try:
+            if token in SORT_TOKENS:
+                return self.comment_page(0)
+            kind, _, position = token.partition('-')
+            if kind == 'page':
+                page = int(position)
+                return self.comment_page(page) if 0 < page < self.pages else None
+            if kind == 'replies':
+                thread, page = map(int, position.split('-'))
+                if 0 <= thread < self.comments and 0 <= page * self.reply_page_size < self.reply_count(thread):
+                    return self.reply_page(thread, page)
+        except ValueError:
+            pass
+        return None
+
+    def continuation(self, token):
+        response = self.response(token)
+        return None if response is None else jsonlib.encode(response)
+
+    def responses(self):
+        # Yields (token, response) for every page of the video
+        first_page = self.comment_page(0)
+        for token in SORT_TOKENS:
+            yield token, first_page
+        for page in range(1, self.pages):
+            yield 'page-%d' % page, self.comment_page(page)
+        for thread in range(self.comments):
+            for page in range(-(-self.reply_count(thread) // self.reply_page_size)):
+                yield 'replies-%d-%d' % (thread, page), self.reply_page(thread, page)
+
+    def watch_page(self, youtube_id=''):
+        ytcfg = {'INNERTUBE_API_KEY': 'synthetic', 'INNERTUBE_CLIENT_NAME': 'WEB',
+                 'INNERTUBE_CLIENT_VERSION': '2.20240501.01.00',
+                 'INNERTUBE_CONTEXT': {'client': {'hl': 'en', 'gl': 'US', 'clientName': 'WEB',
+                                                  'clientVersion': '2.20240501.01.00'}}}
+        menu = {'sortFilterSubMenuRenderer': {'subMenuItems': [
+            {'title': 'Top comments', 'selected': True, 'serviceEndpoint': endpoint(SORT_TOKENS[0])},
+            {'title': 'Newest first', 'selected': False, 'serviceEndpoint': endpoint(SORT_TOKENS[1])}]}}
+        data = {'contents': {'twoColumnWatchNextResults': {'results': {'results': {'contents': [
+            {'videoPrimaryInfoRenderer': {'title': {'runs': [{'text': 'Synthetic video ' + youtube_id}]}}},
+            {'itemSectionRenderer': {'sectionIdentifier': 'comment-item-section', 'contents': [
+                {'continuationItemRenderer': {'trigger': 'CONTINUATION_TRIGGER_ON_ITEM_SHOWN',
+                                              'continuationEndpoint': endpoint('comments-section')}}]}}]}}}},
+            'engagementPanels': [{'engagementPanelSectionListRenderer': {
+                'header': {'engagementPanelTitleHeaderRenderer': {'menu': menu}},
+                'panelIdentifier': 'engagement-panel-comments-section'}}]}
+        return ('<!DOCTYPE html><html lang="en"><head><title>Synthetic video - YouTube</title>\n'
+                '<script nonce="n">ytcfg.set(%s); window.ytcfg.obfuscatedData_ = [];</script>\n'
+                '<script nonce="n">var ytInitialData = %s;</script>\n'
+                '</head><body></body></html>\n' % (json.dumps(ytcfg), json.dumps(data))).encode('utf-8')
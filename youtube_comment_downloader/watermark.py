@@ -0,0 +1,74 @@
+import json
+import time
+
+from .cache import write_json_atomic
+
+# Number of top-level comment IDs remembered per video, so the crawl still stops if a few of them are deleted
+WATERMARK_SIZE = 20
+
+
+class Watermark:
+    # The newest top-level comments of a video as of the last complete crawl. When sorting by recent, comments come
+    # newest first, so a re-crawl can stop paging at the first comment it already knows. A since timestamp also stops
+    # the crawl at the first top-level comment published before it. Both are stored in a JSON file per video, which
+    # is only updated once a crawl is complete, so stopping early never leaves a gap for the next run.
+
+    def __init__(self, path=None, since=None):
+        self.path = path
+        self.since = since
+        self.cids = []
+        self.time_parsed = None
+        self.new_cids = []
+        self.new_time_parsed = None
+        self.checked = 0
+
+    def load(self):
+        # Returns True if the file holds a watermark. A since stored in the file is used unless one was given.
+        self.cids, self.time_parsed, self.new_cids, self.new_time_parsed, self.checked = [], None, [], None, 0
+        try:
+            with open(self.path, encoding='utf-8') as fp:
+                data = json.load(fp)
+        except (TypeError, OSError, ValueError):
+            return False
+
+        self.cids = data.get('cids', [])
+        self.time_parsed = data.get('time_parsed')
+        if self.since is None:
+            self.since = data.get('since')
+        return True
+
+    def filter(self, comments):
+        # Returns the comments that are new, up to the first top-level comment that was seen before or is older than
+        # since, together with the ID of that comment (or None). New top-level comments are remembered for the next
+        # crawl.
+        known = set(self.cids)
+        new_comments = []
+        for comment in comments:
+            if comment['reply']:
+                new_comments.append(comment)
+                continue
+            time_parsed = comment.get('time_parsed')
+            old = comment['cid'] in known or \
+                (self.since is not None and time_parsed is not None and time_parsed < self.since)
+            self.checked += 1
+            if old and self.checked > 1:
+                return new_comments, comment['cid']
+            if old:
+                # The first comment may be pinned, in which case it is not in chronological order
+                continue
+            new_comments.append(comment)
+            if len(self.new_cids) < WATERMARK_SIZE:
+                self.new_cids.append(comment['cid'])
+            if time_parsed is not None:
+                self.new_time_parsed = max(time_parsed, self.new_time_parsed or time_parsed)
+        return new_comments, None
+
+    def save(self):
+        if self.path is None:
+            return
+        cids = self.new_cids + [cid for cid in self.cids if cid not in self.new_cids]
+        times = [t for t in (self.time_parsed, self.new_time_parsed) if t is not None]
+        write_json_atomic(self.path, {'cids': cids[:WATERMARK_SIZE],
+                                      'time_parsed': max(times) if times else None,
+                                      'since': self.since,
+                                      'updated': time.time()})
@@ -0,0 +1,228 @@
+import csv
+import gzip
+import io
+import json
+import os
+import re
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+from . import jsonlib
+
+# Number of comments after which the output file is flushed
+FLUSH_EVERY = 100
+
+# Compressed output is picked by file extension
+COMPRESSION_EXTENSIONS = ('.gz', '.zst')
+
+# Abbreviated counts as shown by Youtube ("1.2K", "3M")
+COUNT_RE = re.compile(r'([\d.]+)\s*([KMB]?)', re.IGNORECASE)
+COUNT_UNITS = {'': 1, 'k': 1000, 'm': 1000000, 'b': 1000000000}
+
+
+def parse_count(value):
+    # Returns the vote or reply count as an int ('1,234' -> 1234, '1.2K' -> 1200), or 0 if it can't be parsed
+    if isinstance(value, int):
+        return value
+    match = COUNT_RE.fullmatch(str(value or '').replace(',', '').strip())
+    if not match:
+        return 0
+    try:
+        return int(float(match.group(1)) * COUNT_UNITS[match.group(2).lower()])
+    except ValueError:
+        return 0
+
+
+def to_json(comment, indent=None, depth=2):
+    # With an indent, every line is padded for a comment nested depth levels deep (by default in {"comments": [...]})
+    comment_str = jsonlib.encode(comment, indent).decode('utf-8')
+    if indent is None:
+        return comment_str
+    padding = ' ' * (depth * indent) if indent else ''
+    return ''.join(padding + line for line in comment_str.splitlines(True))
+
+
+def open_binary(path, mode='w'):
+    # Opens a file for writing ('w') or appending ('a') bytes. Files ending in .gz are gzip compressed and files ending
+    # in .zst are zstd compressed as they are written. Appending to a compressed file adds a new gzip member/zstd
+    # frame, which gzip/zstd and Python read back as one stream.
+    lower = path.lower()
+    if lower.endswith('.gz'):
+        return gzip.open(path, mode + 'b', compresslevel=6)
+    if lower.endswith('.zst'):
+        if zstandard is None:
+            raise ImportError('writing .zst files requires zstandard (pip install zstandard)')
+        return zstandard.ZstdCompressor().stream_writer(io.open(path, mode + 'b'))
+    return io.open(path, mode + 'b')
+
+
+def open_text(path, mode='w', encoding='utf-8'):
+    # Like open_binary, for writing text
+    return io.TextIOWrapper(open_binary(path, mode), encoding=encoding, newline='')
+
+
+def split_extension(path):
+    # Returns the path without its extension and the extension, including the compression ('x.ndjson.gz' -> 'x',
+    # '.ndjson.gz')
+    compression = ''
+    for extension in COMPRESSION_EXTENSIONS:
+        if path.lower().endswith(extension):
+            path, compression = path[:-len(extension)], path[-len(extension):]
+            break
+    root, extension = os.path.splitext(path)
+    return root, extension + compression
+
+
+def shard_path(path, index):
+    # The first file of a rotated output is the path itself, the next ones are numbered ('x.0001.ndjson.gz', ...)
+    if not index:
+        return path
+    root, extension = split_extension(path)
+    return '%s.%04d%s' % (root, index, extension)
+
+
+class CommentWriter:
+    # Writes comments to a file as they arrive. Every comment is written as a complete line and the file is flushed
+    # every flush_every comments, so whatever is on disk after a crash or an interrupt can be read as is. If max_bytes
+    # is given, a new file (see shard_path) is started once the file on disk has grown past it, which is checked
+    # whenever the file is flushed. For compressed files this is the compressed size.
+
+    encoding = 'utf-8'
+    # Binary writers write bytes to fp instead of text
+    binary = False
+
+    def __init__(self, path, flush_every=FLUSH_EVERY, append=False, max_bytes=None):
+        self.path = path
+        self.flush_every = flush_every
+        self.max_bytes = max_bytes
+        self.count = 0
+        self.paths = []
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        index = 0
+        if append and max_bytes:
+            # Continue with the last file of the output
+            while os.path.exists(shard_path(path, index + 1)):
+                index += 1
+        self.open_shard(index, append)
+
+    def open_shard(self, index, append=False):
+        self.shard = index
+        self.shard_count = 0
+        path = shard_path(self.path, index)
+        empty = not append or not os.path.exists(path) or os.path.getsize(path) == 0
+        # When appending, don't add another byte order mark to the middle of the file
+        if self.binary:
+            self.fp = open_binary(path, 'w' if empty else 'a')
+        else:
+            self.fp = open_text(path, 'w' if empty else 'a', self.encoding if empty else 'utf-8')
+        self.paths.append(path)
+        self.start_shard(empty)
+
+    def rotate(self):
+        self.end_shard()
+        self.fp.close()
+        self.open_shard(self.shard + 1)
+
+    def write(self, record):
+        self.write_record(record)
+        self.count += 1
+        self.shard_count += 1
+        if self.flush_every and self.count % self.flush_every == 0:
+            self.fp.flush()
+            if self.max_bytes and os.path.getsize(self.paths[-1]) >= self.max_bytes:
+                self.rotate()
+
+    def write_all(self, records):
+        # Returns the number of records written
+        start = self.count
+        for record in records:
+            self.write(record)
+        return self.count - start
+
+    def start_shard(self, empty):
+        # Called when a file is opened, empty is False when appending to a file that has data
+        pass
+
+    def end_shard(self):
+        # Called before a file is closed
+        pass
+
+    def write_record(self, record):
+        raise NotImplementedError
+
+    def close(self):
+        if not self.fp.closed:
+            self.end_shard()
+            self.fp.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+class NdjsonWriter(CommentWriter):
+    # One JSON object per line, encoded straight to bytes by the JSON backend (see jsonlib)
+
+    binary = True
+
+    def write_record(self, record):
+        self.fp.write(jsonlib.encode(record) + b'\n')
+
+
+class JsonWriter(CommentWriter):
+    # Indented JSON of the form {"comments": [...]}, as written by the --pretty option, or a plain list if key is None.
+    # Every file of a rotated output is a complete document. Appending is not supported.
+
+    def __init__(self, path, indent=4, key='comments', flush_every=FLUSH_EVERY, max_bytes=None):
+        self.indent = indent
+        self.key = key
+        super(JsonWriter, self).__init__(path, flush_every, False, max_bytes)
+
+    def start_shard(self, empty):
+        if self.key is None:
+            self.fp.write('[\n')
+        else:
+            self.fp.write('{\n' + ' ' * self.indent + json.dumps(self.key) + ': [\n')
+
+    def write_record(self, record):
+        if self.shard_count:
+            self.fp.write(',\n')
+        self.fp.write(to_json(record, indent=self.indent, depth=1 if self.key is None else 2))
+
+    def end_shard(self):
+        self.fp.write(('\n' if self.shard_count else '') + (']' if self.key is None else ' ' * self.indent + ']\n}'))
+
+
+class CsvWriter(CommentWriter):
+    # CSV with a header row, encoded as utf-8-sig so that Excel picks up the encoding. The columns are fixed up front,
+    # missing fields are left empty and unknown fields are ignored. Every file of a rotated output has a header.
+
+    encoding = 'utf-8-sig'
+
+    def __init__(self, path, fieldnames, flush_every=FLUSH_EVERY, append=False, max_bytes=None):
+        self.fieldnames = list(fieldnames)
+        super(CsvWriter, self).__init__(path, flush_every, append, max_bytes)
+
+    def start_shard(self, empty):
+        self.writer = csv.DictWriter(self.fp, self.fieldnames, extrasaction='ignore', lineterminator='\n')
+        if empty:
+            self.writer.writeheader()
+
+    def write_record(self, record):
+        self.writer.writerow(record)
+
+
+def open_writer(path, fieldnames=None, **kwargs):
+    # Picks the writer by file extension: .csv (optionally .csv.gz/.csv.zst) is written as CSV (fieldnames are
+    # required), anything else as NDJSON
+    if split_extension(path)[1].lower().startswith('.csv'):
+        return CsvWriter(path, fieldnames, **kwargs)
+    return NdjsonWriter(path, **kwargs)